@@ -1,13 +1,236 @@
+#!/usr/bin/env python
+# Delete every object under the prefixes listed in a file (one prefix per line)
+#
+#   ./S3deleter.py --bucket gap-vps-logs-prod --prefixes GAP2.csv --dry-run
+#   ./S3deleter.py --bucket gap-vps-logs-prod --prefixes GAP2.csv --checkpoint GAP2.done
+#
+# Prefixes are listed concurrently with list_objects_v2 paginators and the keys are
+# deleted in batches of 1000 (the delete_objects maximum) from a pool of delete workers.
+# Finished prefixes are appended to the checkpoint file so an interrupted run can be
+# restarted and will skip them.
+
+import argparse
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 
 import boto3
-s3 = boto3.resource("s3")
+from botocore.config import Config
+
+DELETE_BATCH_SIZE = 1000
+PROGRESS_INTERVAL_SECONDS = 10
+
+
+class RateLimiter(object):
+    """
+    Simple token bucket shared by all the delete workers.
+    rate is the number of delete_objects calls allowed per second, 0 means unlimited.
+    """
+    def __init__(self, rate):
+        self.rate = float(rate)
+        # the bucket holds at least one whole token, or a rate below 1/s could never be met
+        self.capacity = max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.last = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+
+class Progress(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.prefixes = 0
+        self.listed = 0
+        self.bytes = 0
+        self.deleted = 0
+        self.errors = 0
+        self.started = time.time()
+
+    def add(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def report(self):
+        with self.lock:
+            elapsed = max(time.time() - self.started, 1e-6)
+            print("prefixes done: {}  listed: {} ({:.1f} GB)  deleted: {}  errors: {}  ({:.0f} keys/s)".format(
+                self.prefixes, self.listed, self.bytes / 1024.0 ** 3, self.deleted, self.errors, self.deleted / elapsed))
+            sys.stdout.flush()
+
+
+def iter_prefixes(filename, done):
+    """
+    Yields the prefixes in filename one line at a time, skipping blank lines and
+    prefixes that are already recorded in the checkpoint.
+    """
+    with open(filename, "r") as f:
+        for line in f:
+            prefix = line.rstrip("\r\n")
+            if not prefix.strip():
+                continue
+            if prefix in done:
+                continue
+            yield prefix
+
+
+def load_checkpoint(checkpoint):
+    done = set()
+    if not checkpoint:
+        return done
+    try:
+        with open(checkpoint, "r") as f:
+            for line in f:
+                done.add(line.rstrip("\r\n"))
+    except IOError:
+        pass
+    return done
+
+
+def delete_batch(client, bucket, keys, limiter, progress):
+    limiter.acquire()
+    res = client.delete_objects(
+        Bucket=bucket,
+        Delete={
+            'Objects': [{'Key': key} for key in keys],
+            'Quiet': True
+        }
+    )
+    errors = res.get('Errors', [])
+    for error in errors:
+        print("Failed to delete {}: {} {}".format(error['Key'], error['Code'], error['Message']))
+    progress.add(deleted=len(keys) - len(errors), errors=len(errors))
+    if errors:
+        # fail the prefix so it isn't checkpointed and a resumed run deletes the rest
+        raise RuntimeError("{} of {} keys could not be deleted".format(len(errors), len(keys)))
+
+
+def process_prefix(client, bucket, prefix, delete_pool, in_flight, limiter, progress, dry_run):
+    """
+    Lists every key under prefix and hands them to the delete pool in batches.
+    Returns once all of the prefix's batches have been deleted.
+    """
+    paginator = client.get_paginator('list_objects_v2')
+    futures = []
+    batch = []
+
+    def submit(keys):
+        # in_flight bounds the number of queued batches so memory stays flat
+        in_flight.acquire()
+        future = delete_pool.submit(delete_batch, client, bucket, keys, limiter, progress)
+        future.add_done_callback(lambda _: in_flight.release())
+        futures.append(future)
+
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix, PaginationConfig={'PageSize': DELETE_BATCH_SIZE}):
+        contents = page.get('Contents', [])
+        progress.add(listed=len(contents), bytes=sum(obj['Size'] for obj in contents))
+        if dry_run:
+            continue
+        for obj in contents:
+            batch.append(obj['Key'])
+            if len(batch) == DELETE_BATCH_SIZE:
+                submit(batch)
+                batch = []
+
+    if batch:
+        submit(batch)
+
+    wait(futures)
+    for future in futures:
+        # re-raise delete failures so the prefix isn't checkpointed
+        future.result()
+
+
+def run(bucket, prefixes_file, list_workers, delete_workers, rate, checkpoint, dry_run):
+    config = Config(max_pool_connections=list_workers + delete_workers,
+                    retries={'max_attempts': 10, 'mode': 'adaptive'})
+    client = boto3.client('s3', config=config)
+
+    done = load_checkpoint(checkpoint)
+    if done:
+        print("Skipping {} prefixes already recorded in {}".format(len(done), checkpoint))
+
+    limiter = RateLimiter(rate)
+    progress = Progress()
+    in_flight = threading.BoundedSemaphore(delete_workers * 4)
+    checkpoint_lock = threading.Lock()
+    checkpoint_file = open(checkpoint, "a") if checkpoint and not dry_run else None
+    failed = []
+
+    def worker(prefix):
+        try:
+            process_prefix(client, bucket, prefix, delete_pool, in_flight, limiter, progress, dry_run)
+        except Exception as e:
+            print("Prefix {} failed: {}".format(prefix, e))
+            failed.append(prefix)
+            return
+        progress.add(prefixes=1)
+        if checkpoint_file:
+            with checkpoint_lock:
+                checkpoint_file.write(prefix + "\n")
+                checkpoint_file.flush()
+
+    stop = threading.Event()
+
+    def reporter():
+        while not stop.wait(PROGRESS_INTERVAL_SECONDS):
+            progress.report()
+
+    threading.Thread(target=reporter, daemon=True).start()
+
+    # the prefix file is streamed, so only list_workers * 2 prefixes are queued at a time
+    slots = threading.BoundedSemaphore(list_workers * 2)
+    try:
+        with ThreadPoolExecutor(max_workers=delete_workers) as delete_pool, \
+                ThreadPoolExecutor(max_workers=list_workers) as list_pool:
+            for prefix in iter_prefixes(prefixes_file, done):
+                slots.acquire()
+                list_pool.submit(worker, prefix).add_done_callback(lambda _: slots.release())
+    finally:
+        stop.set()
+        if checkpoint_file:
+            checkpoint_file.close()
+
+    if dry_run:
+        print("DRY_RUN: nothing was deleted")
+    progress.report()
+    if failed:
+        print("{} prefixes failed, re-run with the same --checkpoint to retry them".format(len(failed)))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bucket', action='store', dest='bucket', default="gap-vps-logs-prod")
+    parser.add_argument('--prefixes', action='store', dest='prefixes_file', default="GAP2.csv",
+                        help="File with one key prefix per line")
+    parser.add_argument('--list-workers', type=int, action='store', dest='list_workers', default=8,
+                        help="Number of prefixes listed at the same time")
+    parser.add_argument('--delete-workers', type=int, action='store', dest='delete_workers', default=16,
+                        help="Number of concurrent delete_objects calls")
+    parser.add_argument('--rate', type=float, action='store', dest='rate', default=0,
+                        help="Maximum delete_objects calls per second, 0 for unlimited")
+    parser.add_argument('--checkpoint', action='store', dest='checkpoint', default=None,
+                        help="File used to record finished prefixes so the run can be resumed")
+    parser.add_argument('--dry-run', action='store_true', dest='dry_run', default=False,
+                        help="Only count the objects and bytes that would be deleted")
 
-file = open("GAP2.csv", "r")
-for i in file.readlines():
-  bucket = s3.Bucket("gap-vps-logs-prod")
-  if i.strip():
-  objects = bucket.objects.filter(Prefix="%s" % i.rstrip('\r\n'))
-  objects.delete() 
+    args = parser.parse_args()
 
-  else:
-    print("blank line")
+    sys.exit(run(args.bucket, args.prefixes_file, args.list_workers, args.delete_workers,
+                 args.rate, args.checkpoint, args.dry_run))
@@ -1,16 +1,22 @@
-import json
-from difflib import get_close_matches
+import store
+from complete import CompletionIndex
+from suggest import SuggestionIndex
 
-data = json.load(open("data.json"))
+data = store.load("data.json", "data.bin")
+index = SuggestionIndex(data.keys())
+completions = CompletionIndex(data.keys())
 
 def translate(w):
+    if w.endswith("*"):
+        return completions.complete(w[:-1]) or "No words start with %s" % w[:-1]
     w = w.lower()
     if w in data:
         return data[w]
-    elif len(get_close_matches(w, data.keys())) > 0:
-        yn = input("Did you mean %s instead? Enter Y if yes, or N if no: " % get_close_matches(w, data.keys())[0])
+    matches = index.suggest(w)
+    if len(matches) > 0:
+        yn = input("Did you mean %s instead? Enter Y if yes, or N if no: " % matches[0])
         if yn == "Y":
-            return data[get_close_matches(w, data.keys())[0]]
+            return data[matches[0]]
         elif yn == "N":
             return "The word doesn't exist. Please double check it."
         else:
@@ -18,7 +24,7 @@ def translate(w):
     else:
         return "The word doesn't exist. Please double check it."
 
-word = input("Enter word: ")
+word = input("Enter word (end it with * to list completions): ")
 output = translate(word)
 if type(output) == list:
     for item in output:
@@ -0,0 +1,71 @@
+import heapq
+import threading
+from bisect import bisect_left
+
+
+class CompletionIndex(object):
+    """
+    Sorted-array prefix index over the dictionary keys.
+
+    The keys matching a prefix are a contiguous range of the sorted array, found with
+    two binary searches. Completions are ranked by frequency when one is given, then
+    by length, then alphabetically. The ranges of the short prefixes (up to
+    precompute_depth characters) are too large to rank per query, so their top k
+    is computed once when the index is built.
+    """
+    def __init__(self, words, frequencies=None, k=10, precompute_depth=3):
+        self.source = words
+        self.frequencies = frequencies or {}
+        self.k = k
+        self.precompute_depth = precompute_depth
+        self.index = None
+        self.lock = threading.Lock()
+
+    def _ranker(self, lowered, words):
+        def rank(i):
+            word = words[i]
+            return (-self.frequencies.get(word, 0), len(word), lowered[i])
+        return rank
+
+    def build(self):
+        """
+        Builds the index unless that was done already and returns it as (lowered, words, top).
+        It is built on first use so that loading the dictionary stays instant, servers call
+        this up front. The finished index is published in one assignment so other threads
+        never see it half built.
+        """
+        with self.lock:
+            if self.index is None:
+                pairs = sorted((word.lower(), word) for word in self.source)
+                lowered = [lower for lower, word in pairs]
+                words = [word for lower, word in pairs]
+                rank = self._ranker(lowered, words)
+
+                groups = {}
+                for i, lower in enumerate(lowered):
+                    for depth in range(1, min(len(lower), self.precompute_depth) + 1):
+                        groups.setdefault(lower[:depth], []).append(i)
+                top = {prefix: [words[i] for i in heapq.nsmallest(self.k, ids, key=rank)]
+                       for prefix, ids in groups.items()}
+                self.index = (lowered, words, top)
+            return self.index
+
+    def prefix_range(self, prefix):
+        """
+        Returns (lo, hi) such that words[lo:hi] of the built index are the keys starting with prefix
+        """
+        lowered = (self.index or self.build())[0]
+        lo = bisect_left(lowered, prefix)
+        hi = bisect_left(lowered, prefix[:-1] + chr(ord(prefix[-1]) + 1), lo)
+        return lo, hi
+
+    def complete(self, prefix, k=None):
+        lowered, words, top = self.index or self.build()
+        k = k or self.k
+        prefix = prefix.lower()
+        if not prefix:
+            return []
+        if len(prefix) <= self.precompute_depth and k <= self.k:
+            return top.get(prefix, [])[:k]
+        lo, hi = self.prefix_range(prefix)
+        return [words[i] for i in heapq.nsmallest(k, range(lo, hi), key=self._ranker(lowered, words))]
@@ -1,20 +1,19 @@
-import json
-from difflib import get_close_matches
+import store
+from translator import Translator
 
-data = json.load(open("data.json"))
+translator = Translator(store.load("data.json", "data.bin"))
 
 def translate(word):
-    word = word.lower()
-    if word in data:
-        return data[word]
-    elif word.title() in data:
-        return data[word.title()]
-    elif word.upper() in data:
-        return data[word.upper()]
-    elif len(get_close_matches(word, data.keys())) > 0:
-        yn = input("Did you mean %s instead? Enter Y if yes or N if no: " % get_close_matches(word, data.keys())[0])
+    if word.endswith("*"):
+        return translator.completions.complete(word[:-1]) or "No words start with %s" % word[:-1]
+    result = translator.lookup(word)
+    if result['key'] is not None:
+        return result['definitions']
+    matches = result['suggestions']
+    if len(matches) > 0:
+        yn = input("Did you mean %s instead? Enter Y if yes or N if no: " % matches[0])
         if yn == "Y":
-            return data[get_close_matches(word, data.keys())[0]]
+            return translator.data[matches[0]]
         elif yn == "N":
             return("The word doesn't exist please double check it.")
         else:
@@ -22,7 +21,7 @@ def translate(word):
     else:
         return("The word doesn't exist please double check it.")
 
-word = input("Enter word: ")
+word = input("Enter word (end it with * to list completions): ")
 
 output = translate(word)
 
@@ -0,0 +1,200 @@
+"""
+Compact, memory-mapped dictionary store.
+
+Build it once from data.json:
+
+    python store.py data.json data.bin
+
+File layout:
+
+    magic "APP1DIC2", n, m  (uint64)
+    key offsets             n + 1 uint32 offsets into the key blob
+    definition offsets      n + 1 uint32 offsets into the definition blob
+    variant offsets         m + 1 uint32 offsets into the variant blob
+    variant targets         m uint32 key indexes
+    key blob                utf-8 keys, sorted by their bytes
+    definition blob         one json list per key
+    variant blob            utf-8 lower-cased keys, sorted by their bytes
+
+Lookups binary search the key offsets straight out of the mmap, so opening the
+store costs nothing and only the pages that are touched are ever read. The
+variants map word.lower() to the key load.py would find for word (see
+case_variants), and are searched the same way.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b"APP1DIC2"
+HEADER = struct.Struct("<8sQQ")
+
+
+def case_variants(keys):
+    """
+    Returns {word.lower(): key} for the key that load.py would have found first
+    among word, word.title() and word.upper()
+    """
+    variants = {}
+    for key in keys:
+        lower = key.lower()
+        if key == lower:
+            rank = 0
+        elif key == lower.title():
+            rank = 1
+        elif key == lower.upper():
+            rank = 2
+        else:
+            continue
+        if lower not in variants or rank < variants[lower][0]:
+            variants[lower] = (rank, key)
+    return {lower: key for lower, (rank, key) in variants.items()}
+
+
+def offsets(blobs):
+    result = [0]
+    for blob in blobs:
+        result.append(result[-1] + len(blob))
+    return result
+
+
+def build(json_file, store_file):
+    with open(json_file, encoding="utf-8") as f:
+        data = json.load(f)
+
+    items = sorted((key.encode("utf-8"), value) for key, value in data.items())
+    key_offsets = [0]
+    def_offsets = [0]
+    definitions = []
+    for key, value in items:
+        key_offsets.append(key_offsets[-1] + len(key))
+        definition = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        definitions.append(definition)
+        def_offsets.append(def_offsets[-1] + len(definition))
+
+    if def_offsets[-1] >= 2 ** 32:
+        raise ValueError("definitions are too large for 32-bit offsets")
+
+    index = {key: i for i, (key, value) in enumerate(items)}
+    variants = sorted((lower.encode("utf-8"), index[key.encode("utf-8")])
+                      for lower, key in case_variants(data.keys()).items())
+    var_offsets = offsets(lower for lower, i in variants)
+
+    tmp_file = store_file + ".tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(items), len(variants)))
+        f.write(struct.pack("<%dI" % len(key_offsets), *key_offsets))
+        f.write(struct.pack("<%dI" % len(def_offsets), *def_offsets))
+        f.write(struct.pack("<%dI" % len(var_offsets), *var_offsets))
+        f.write(struct.pack("<%dI" % len(variants), *[i for lower, i in variants]))
+        for key, value in items:
+            f.write(key)
+        for definition in definitions:
+            f.write(definition)
+        for lower, i in variants:
+            f.write(lower)
+    os.rename(tmp_file, store_file)
+
+
+class DictionaryStore(object):
+    """
+    Read-only, dict-like view of a store built with build()
+    """
+    def __init__(self, store_file):
+        with open(store_file, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, m = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError("%s is not a dictionary store" % store_file)
+        self.n = n
+        self.m = m
+        tables_end = HEADER.size + 8 * (n + 1) + 4 * (2 * m + 1)
+        tables = memoryview(self.mm)[HEADER.size:tables_end].cast("I")
+        self.key_offsets = tables[:n + 1]
+        self.def_offsets = tables[n + 1:2 * n + 2]
+        self.var_offsets = tables[2 * n + 2:2 * n + m + 3]
+        self.var_targets = tables[2 * n + m + 3:]
+        self.keys_start = tables_end
+        self.defs_start = self.keys_start + self.key_offsets[n]
+        self.vars_start = self.defs_start + self.def_offsets[n]
+
+    def __len__(self):
+        return self.n
+
+    def _key(self, i):
+        return self.mm[self.keys_start + self.key_offsets[i]:self.keys_start + self.key_offsets[i + 1]]
+
+    def _variant(self, i):
+        return self.mm[self.vars_start + self.var_offsets[i]:self.vars_start + self.var_offsets[i + 1]]
+
+    @staticmethod
+    def _search(get, size, key):
+        lo, hi = 0, size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if get(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < size and get(lo) == key:
+            return lo
+        return -1
+
+    def _find(self, word):
+        return self._search(self._key, self.n, word.encode("utf-8"))
+
+    def find_variant(self, word):
+        """
+        Returns the key load.py would have found for word, ignoring case, or None
+        """
+        i = self._search(self._variant, self.m, word.lower().encode("utf-8"))
+        if i < 0:
+            return None
+        return self._key(self.var_targets[i]).decode("utf-8")
+
+    def __contains__(self, word):
+        return self._find(word) >= 0
+
+    def __getitem__(self, word):
+        i = self._find(word)
+        if i < 0:
+            raise KeyError(word)
+        start = self.defs_start + self.def_offsets[i]
+        end = self.defs_start + self.def_offsets[i + 1]
+        return json.loads(self.mm[start:end].decode("utf-8"))
+
+    def get(self, word, default=None):
+        try:
+            return self[word]
+        except KeyError:
+            return default
+
+    def keys(self):
+        for i in range(self.n):
+            yield self._key(i).decode("utf-8")
+
+    __iter__ = keys
+
+
+def load(json_file="data.json", store_file="data.bin"):
+    """
+    Opens the compiled store if it is up to date, otherwise falls back to json.load
+    """
+    if os.path.exists(store_file) and \
+            (not os.path.exists(json_file) or os.path.getmtime(store_file) >= os.path.getmtime(json_file)):
+        try:
+            return DictionaryStore(store_file)
+        except ValueError:
+            # built by an older store.py, rebuild it to get the mmap back
+            if not os.path.exists(json_file):
+                raise
+    with open(json_file, encoding="utf-8") as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    json_file = sys.argv[1] if len(sys.argv) > 1 else "data.json"
+    store_file = sys.argv[2] if len(sys.argv) > 2 else "data.bin"
+    build(json_file, store_file)
+    print("Wrote %s" % store_file)
@@ -0,0 +1,96 @@
+import heapq
+import threading
+from collections import Counter
+from difflib import SequenceMatcher
+from itertools import chain
+from operator import itemgetter
+
+
+def letters(word):
+    """
+    The (letter, k) pairs for the k-th occurrence of each letter in word. Two words
+    share as many pairs as quick_ratio counts matching letters between them.
+    """
+    seen = Counter()
+    pairs = []
+    for letter in word:
+        seen[letter] += 1
+        pairs.append((letter, seen[letter]))
+    return pairs
+
+
+class SuggestionIndex(object):
+    """
+    Letter index over the dictionary keys, built once at load time.
+
+    suggest() returns exactly what difflib.get_close_matches does without scoring
+    every key. One pass over the postings of the query's letters counts the letters
+    every key shares with it, which gives its quick_ratio, an upper bound of its ratio.
+    Keys are taken in order of shared letters until even a key no longer than those
+    letters couldn't reach the n-th best ratio found, and only the ones whose own
+    quick_ratio could are scored. Results are cached per query.
+    """
+    def __init__(self, words):
+        self.source = words
+        self.index = None
+        self.lock = threading.Lock()
+        self.cache = {}
+
+    def build(self):
+        """
+        Builds the index unless that was done already and returns it as (words, postings, lengths).
+        It is built on the first miss so that loading the dictionary stays instant, servers
+        call this up front. The finished index is published in one assignment so other
+        threads never see it half built.
+        """
+        with self.lock:
+            if self.index is None:
+                words = list(self.source)
+                postings = {}
+                lengths = []
+                for idx, word in enumerate(words):
+                    lengths.append(len(word))
+                    for pair in letters(word):
+                        postings.setdefault(pair, []).append(idx)
+                self.index = (words, postings, lengths)
+            return self.index
+
+    def suggest(self, word, n=3, cutoff=0.6):
+        key = (word, n, cutoff)
+        if key not in self.cache:
+            if len(self.cache) > 10000:
+                self.cache.clear()
+            self.cache[key] = self._suggest(word, n, cutoff)
+        return self.cache[key]
+
+    def _suggest(self, word, n, cutoff):
+        words, postings, lengths = self.index or self.build()
+        if n <= 0:
+            return []
+        size = len(word)
+        shared = Counter(chain.from_iterable(postings.get(pair, ()) for pair in letters(word)))
+        if cutoff <= 0:
+            # keys without a letter in common can still make the cut
+            shared.update(dict.fromkeys(range(len(words)), 0))
+
+        # the n best (score, word) so far, the smallest first
+        best = []
+        s = SequenceMatcher()
+        s.set_seq2(word)
+        for idx, matches in sorted(shared.items(), key=itemgetter(1), reverse=True):
+            limit = max(cutoff, best[0][0]) if len(best) == n else cutoff
+            # a key is at least as long as the letters it shares, so this bounds every key left
+            if matches + size and 2.0 * matches / (matches + size) < limit:
+                break
+            if lengths[idx] + size and 2.0 * matches / (lengths[idx] + size) < limit:
+                continue
+            x = words[idx]
+            s.set_seq1(x)
+            score = s.ratio()
+            if score >= cutoff:
+                if len(best) < n:
+                    heapq.heappush(best, (score, x))
+                elif (score, x) > best[0]:
+                    heapq.heapreplace(best, (score, x))
+
+        return [x for score, x in sorted(best, reverse=True)]
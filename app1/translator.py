@@ -0,0 +1,141 @@
+"""
+Non-interactive translator with batch and HTTP service modes.
+
+    python translator.py rain paris                # look up a few words
+    python translator.py --batch words.txt         # one word per line, "-" for stdin
+    python translator.py --serve --port 8000       # GET /translate?word=rain
+                                                   # GET /complete?prefix=ra
+    python translator.py --complete ra             # words starting with "ra"
+
+Every answer is a JSON object: {"word", "key", "definitions", "suggestions"}.
+"key" is the dictionary entry that matched, or null, in which case "suggestions"
+holds the closest entries instead.
+"""
+import argparse
+import json
+import sys
+import threading
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import store
+from complete import CompletionIndex
+from suggest import SuggestionIndex
+
+
+class Translator(object):
+    """
+    Keeps the dictionary, the case-normalized index, the suggestion index and the
+    completion index warm and caches the most recent answers.
+
+    A compiled store has the case variants on disk. For a plain dict loaded from
+    data.json they are built in memory on first use.
+    """
+    def __init__(self, data, cache_size=10000):
+        self.data = data
+        self.suggestions = SuggestionIndex(data.keys())
+        self.completions = CompletionIndex(data.keys())
+        self.variants = None
+        self.lock = threading.Lock()
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    def _build_variants(self):
+        with self.lock:
+            if self.variants is None:
+                self.variants = store.case_variants(self.data.keys())
+            return self.variants
+
+    def warm(self):
+        """
+        Builds every index now instead of on the first request that needs it
+        """
+        if not hasattr(self.data, 'find_variant'):
+            self._build_variants()
+        self.suggestions.build()
+        self.completions.build()
+
+    def find(self, word):
+        """
+        Returns the dictionary key for word, ignoring case the same way load.py does, or None
+        """
+        if hasattr(self.data, 'find_variant'):
+            return self.data.find_variant(word)
+        return (self.variants or self._build_variants()).get(word.lower())
+
+    def _lookup(self, word):
+        word = word.strip()
+        key = self.find(word)
+        if key is not None:
+            return {'word': word, 'key': key, 'definitions': self.data[key], 'suggestions': []}
+        return {'word': word, 'key': None, 'definitions': [], 'suggestions': self.suggestions.suggest(word.lower())}
+
+    def complete(self, prefix, k=10):
+        return {'prefix': prefix, 'completions': self.completions.complete(prefix.strip(), k)}
+
+
+def run_batch(translator, lines, out):
+    for line in lines:
+        word = line.strip()
+        if word:
+            out.write(json.dumps(translator.lookup(word), ensure_ascii=False) + "\n")
+    out.flush()
+
+
+def make_handler(translator):
+    class TranslateHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            if url.path == "/translate" and query.get('word'):
+                answer = translator.lookup(query['word'][0])
+            elif url.path == "/complete" and query.get('prefix'):
+                answer = translator.complete(query['prefix'][0])
+            else:
+                self.send_error(404, "Use /translate?word=... or /complete?prefix=...")
+                return
+            body = json.dumps(answer, ensure_ascii=False).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return TranslateHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('words', nargs='*')
+    parser.add_argument('--data', action='store', dest='json_file', default="data.json")
+    parser.add_argument('--store', action='store', dest='store_file', default="data.bin")
+    parser.add_argument('--batch', action='store', dest='batch', default=None,
+                        help="File with one word per line, '-' for stdin")
+    parser.add_argument('--complete', action='store', dest='prefix', default=None,
+                        help="Print the words starting with this prefix")
+    parser.add_argument('--serve', action='store_true', dest='serve', default=False)
+    parser.add_argument('--host', action='store', dest='host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, action='store', dest='port', default=8000)
+    parser.add_argument('--cache-size', type=int, action='store', dest='cache_size', default=10000)
+
+    args = parser.parse_args()
+
+    translator = Translator(store.load(args.json_file, args.store_file), args.cache_size)
+
+    if args.prefix is not None:
+        print(json.dumps(translator.complete(args.prefix), ensure_ascii=False))
+    elif args.serve:
+        translator.warm()
+        server = ThreadingHTTPServer((args.host, args.port), make_handler(translator))
+        print("Serving on http://%s:%d/translate?word=..." % (args.host, args.port))
+        server.serve_forever()
+    elif args.batch == "-":
+        run_batch(translator, sys.stdin, sys.stdout)
+    elif args.batch:
+        with open(args.batch, encoding="utf-8") as f:
+            run_batch(translator, f, sys.stdout)
+    else:
+        run_batch(translator, args.words, sys.stdout)
@@ -1,9 +1,149 @@
+"""
+Merges text files into one, without reading any of them into memory.
+
+    python merging_text_files.py                          file*.txt into a timestamped .txt
+    python merging_text_files.py 'logs/**/*.log.gz' -o all.log --workers 4
+    python merging_text_files.py a.log b.log.gz --sorted --key '^(\\S+ \\S+)'
+
+By default the files are concatenated in glob order with a newline after
+each. Plain files are copied with os.sendfile() where the platform has it
+(the kernel moves the bytes, nothing passes through Python) and with
+shutil.copyfileobj() and a fixed buffer otherwise; gzip files are
+decompressed on the fly. When none of the inputs are compressed their sizes
+give every file's offset in the output, so --workers copies them in parallel.
+
+--sorted does an ordered k-way merge of files that are each already sorted,
+e.g. by timestamp: a heap holds the current line of every file, so memory
+stays at one line per input. --key is a regex whose first group (or whole
+match) is compared; without it whole lines are compared.
+"""
+import argparse
 import datetime
+import gzip
+import heapq
+import os
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
 import glob2
 
-myfile = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S-%f.txt")
-filenames = glob2.glob('file*.txt')
-with open(myfile, 'w') as file:
-    for filename in filenames:
-        with open(filename, 'r') as f:
-            file.write(f.read() + "\n") 
+BUFFER_SIZE = 1024 * 1024
+SEPARATOR = b"\n"
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def is_gzip(filename):
+    with open(filename, 'rb') as f:
+        return f.read(2) == GZIP_MAGIC
+
+
+def open_input(filename, mode='rb'):
+    if is_gzip(filename):
+        return gzip.open(filename, mode)
+    return open(filename, mode)
+
+
+def send_file(src, dst, offset=None):
+    """
+    Copies the open file src to the open file dst, at offset if given
+    """
+    if offset is not None:
+        dst.seek(offset)
+    dst.flush()
+    if hasattr(os, 'sendfile'):
+        size = os.fstat(src.fileno()).st_size
+        sent = 0
+        try:
+            while sent < size:
+                n = os.sendfile(dst.fileno(), src.fileno(), sent, min(size - sent, 1 << 30))
+                if n == 0:
+                    break
+                sent += n
+            # sendfile() moved the descriptor, bring the file object along
+            dst.seek(os.lseek(dst.fileno(), 0, os.SEEK_CUR))
+            return
+        except OSError:
+            if sent:
+                raise
+    shutil.copyfileobj(src, dst, BUFFER_SIZE)
+
+
+def copy_into(filename, output, offset):
+    with open(filename, 'rb') as src, open(output, 'r+b') as dst:
+        send_file(src, dst, offset)
+        dst.write(SEPARATOR)
+
+
+def concatenate(filenames, output, workers=1):
+    if workers > 1 and not any(is_gzip(filename) for filename in filenames):
+        offsets = []
+        total = 0
+        for filename in filenames:
+            offsets.append(total)
+            total += os.path.getsize(filename) + len(SEPARATOR)
+        with open(output, 'wb') as f:
+            f.truncate(total)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(copy_into, filename, output, offset)
+                           for filename, offset in zip(filenames, offsets)]:
+                future.result()
+        return
+
+    with open(output, 'wb') as dst:
+        for filename in filenames:
+            if is_gzip(filename):
+                with gzip.open(filename, 'rb') as src:
+                    shutil.copyfileobj(src, dst, BUFFER_SIZE)
+            else:
+                with open(filename, 'rb') as src:
+                    send_file(src, dst)
+            dst.write(SEPARATOR)
+
+
+def read_lines(filename):
+    with open_input(filename) as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                line += b"\n"
+            yield line
+
+
+def line_key(pattern):
+    if pattern is None:
+        return None
+    regex = re.compile(pattern.encode('utf-8'))
+
+    def key(line):
+        match = regex.search(line)
+        if match is None:
+            return b""
+        return match.group(1) if regex.groups else match.group(0)
+    return key
+
+
+def merge_sorted(filenames, output, key=None):
+    with open(output, 'wb') as dst:
+        dst.writelines(heapq.merge(*[read_lines(filename) for filename in filenames], key=key))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('patterns', nargs='*', default=['file*.txt'], help="Files or glob patterns (** recurses)")
+    parser.add_argument('-o', '--output', action='store', dest='output',
+                        default=datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S-%f.txt"))
+    parser.add_argument('--workers', type=int, action='store', dest='workers', default=1)
+    parser.add_argument('--sorted', action='store_true', dest='sorted', default=False,
+                        help="k-way merge of inputs that are each sorted, instead of concatenating them")
+    parser.add_argument('--key', action='store', dest='key', default=None,
+                        help="Regex picking the part of each line to sort on")
+
+    args = parser.parse_args()
+
+    filenames = [filename for pattern in args.patterns for filename in glob2.glob(pattern)]
+    filenames = [filename for filename in filenames if os.path.abspath(filename) != os.path.abspath(args.output)]
+
+    if args.sorted:
+        merge_sorted(filenames, args.output, line_key(args.key))
+    else:
+        concatenate(filenames, args.output, args.workers)
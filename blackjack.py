@@ -1,95 +1,125 @@
 import random
 import os
 
-def calc_hand(hand):
-	sum = 0
-	non_aces = [card for card in hand if card != 'A']
-	aces = [card for card in hand if card == 'A']
-	
-	for card in non_aces:
-		if card in 'JQK':
-			sum += 10
-		else:
-			sum += int(card)
-
-	for card in aces:
-		if sum <= 10:
-			sum += 11
-		else:
-			sum += 1
-
-
-	return sum
-
-cards = [
-	'2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A',
-	'2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A',
-	'2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A',
-	'2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A',
-]
-
-random.shuffle(cards)
-#print(cards)
-
-dealer = []
-player = []
-
-player.append(cards.pop())
-dealer.append(cards.pop())
-player.append(cards.pop())
-dealer.append(cards.pop())
+CARD_VALUES = {'2': 2, '3': 3, '4': 4, '5': 5, '6': 6, '7': 7, '8': 8, '9': 9, '10': 10, 'J': 10, 'Q': 10, 'K': 10}
 
-#print(dealer, player)
-standing = False
-first_hand = True
+def score(total, aces):
+	"""
+	Score of a hand whose non-ace cards add up to total: the first ace counts
+	11 if the total is 10 or less, every other ace counts 1
+	"""
+	if aces and total <= 10:
+		return total + 11 + aces - 1
+	return total + aces
 
-while True:
-	os.system('cls' if os.name == 'nt' else 'clear')
-
-	player_score = calc_hand(player)
-	dealer_score = calc_hand(dealer)
-
-	if standing:
-		print('Your Cards: [{}] ({})'.format(']['.join(dealer), dealer_score))
-	else:	
-		print('Dealer Cards: [{}][?]'.format(dealer[0]))
-
-	print('Your Cards: [{}] ({})'.format(']['.join(player), player_score))
-	print('')
-
-	if standing:
-		if dealer_score > 21:
-			print('Dealer Busted, you win')
-		elif player_score == dealer_score:
-			print('Push, nobody wins or loses')
-		elif player_score > dealer_score:
-			print('You beat the dealer, you win!')
+def calc_hand(hand):
+	total = 0
+	aces = 0
+	for card in hand:
+		if card == 'A':
+			aces += 1
 		else:
-			print('You lose')
-
-		break
-
-	if first_hand and player_score == 21:
-		print("BlackJack Nice!!!")
-		break
-
-	first_hand = False
+			total += CARD_VALUES[card]
+	return score(total, aces)
+
+def get_hint(player, up):
+	"""
+	Best move for the hand and the expected value of both moves, with every
+	card but the player's and the dealer's upcard still unseen
+	"""
+	from blackjack_solver import RANK_INDEX, Solver, full_shoe
+
+	global solver
+	if solver is None:
+		solver = Solver()
+	shoe = list(full_shoe())
+	for card in player + [up]:
+		shoe[RANK_INDEX[card]] -= 1
+	return solver.advise(player, up, tuple(shoe))
+
+solver = None
+
+def play():
+	cards = [
+		'2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A',
+		'2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A',
+		'2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A',
+		'2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A',
+	]
+
+	random.shuffle(cards)
+	#print(cards)
+
+	dealer = []
+	player = []
+
+	player.append(cards.pop())
+	dealer.append(cards.pop())
+	player.append(cards.pop())
+	dealer.append(cards.pop())
+
+	#print(dealer, player)
+	standing = False
+	first_hand = True
+	hint = None
+
+	while True:
+		os.system('cls' if os.name == 'nt' else 'clear')
+
+		player_score = calc_hand(player)
+		dealer_score = calc_hand(dealer)
+
+		if standing:
+			print('Your Cards: [{}] ({})'.format(']['.join(dealer), dealer_score))
+		else:	
+			print('Dealer Cards: [{}][?]'.format(dealer[0]))
+
+		print('Your Cards: [{}] ({})'.format(']['.join(player), player_score))
+		print('')
+
+		if standing:
+			if dealer_score > 21:
+				print('Dealer Busted, you win')
+			elif player_score == dealer_score:
+				print('Push, nobody wins or loses')
+			elif player_score > dealer_score:
+				print('You beat the dealer, you win!')
+			else:
+				print('You lose')
+
+			break
+
+		if first_hand and player_score == 21:
+			print("BlackJack Nice!!!")
+			break
+
+		first_hand = False
 	
-	if player_score > 21:
-		print('You busted')
-		break
-	print('What would you like to do?')
-	print(' [1] Hit')
-	print(' [2] Stand')
+		if player_score > 21:
+			print('You busted')
+			break
+		if hint:
+			print('Hint: {} (stand {:+.3f}, hit {:+.3f})'.format(*hint))
+			print('')
+			hint = None
+
+		print('What would you like to do?')
+		print(' [1] Hit')
+		print(' [2] Stand')
+		print(' [3] Hint')
 	
-	print('')
-	choice = input('Your Choice ')
-	print(choice)
-
-	if choice == '1':
-		player.append(cards.pop())	
-	elif choice == '2':
-		standing = True
-		while calc_hand(dealer) <= 16:
-			dealer.append(cards.pop())
-
+		print('')
+		choice = input('Your Choice ')
+		print(choice)
+
+		if choice == '1':
+			player.append(cards.pop())	
+		elif choice == '2':
+			standing = True
+			while calc_hand(dealer) <= 16:
+				dealer.append(cards.pop())
+		elif choice == '3':
+			hint = get_hint(player, dealer[0])
+
+if __name__ == "__main__":
+	play()
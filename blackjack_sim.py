@@ -0,0 +1,249 @@
+"""
+Headless Monte Carlo simulator for the game in blackjack.py.
+
+    python blackjack_sim.py --hands 10000000
+    python blackjack_sim.py --hands 1000000 --stand-on 15 --decks 6 --hit-soft-17
+
+Hands are played in chunks of NumPy arrays, one row per hand, spread over a
+process pool. Cards are small integers (1 is an ace, 10 any ten-valued card)
+and each hand is tracked as its non-ace total plus its number of aces, which
+a lookup table built from blackjack.score() turns into the same score
+calc_hand() gives. Every hand gets a freshly shuffled shoe, like the game;
+only as many cards as are actually dealt get shuffled into place.
+
+The rules follow the game: a two card 21 is paid at once (the dealer's hole
+card isn't checked), a bust loses without the dealer playing, and the dealer
+draws while under --dealer-stand. The player's strategy is a boolean table
+hit[score, soft, dealer upcard].
+"""
+import argparse
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy
+
+from blackjack import score
+
+# 2-9, four ten-valued cards and an ace per suit
+SUIT = [2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10, 1]
+MAX_TOTAL = 31
+MAX_ACES = 32
+
+SCORES = numpy.array([[score(total, aces) for aces in range(MAX_ACES + 1)] for total in range(MAX_TOTAL + 1)],
+                     dtype=numpy.int16)
+SOFT = numpy.array([[aces > 0 and total <= 10 for aces in range(MAX_ACES + 1)] for total in range(MAX_TOTAL + 1)])
+
+# order of the counters simulate_chunk() returns
+FIELDS = ["hands", "wins", "losses", "pushes", "blackjacks", "player_busts", "dealer_busts", "payout", "payout_sq"]
+
+
+def make_shoe(decks):
+    return numpy.array(SUIT * 4 * decks, dtype=numpy.int8)
+
+
+def threshold_strategy(stand_on):
+    """
+    Hits below stand_on whatever the dealer shows
+    """
+    hit = numpy.zeros((MAX_TOTAL + 1, 2, 11), dtype=bool)
+    hit[:stand_on] = True
+    return hit
+
+
+def table_strategy(table):
+    """
+    Converts a blackjack_solver table ({(score, soft, upcard): "H" or "S"}), standing where it has no entry
+    """
+    hit = numpy.zeros((MAX_TOTAL + 1, 2, 11), dtype=bool)
+    for (player_score, soft, up), decision in table.items():
+        hit[player_score, int(soft), up] = decision == "H"
+    return hit
+
+
+class Hands(object):
+    """
+    Non-ace totals and ace counts for a batch of hands
+    """
+    def __init__(self, n):
+        self.total = numpy.zeros(n, dtype=numpy.int16)
+        self.aces = numpy.zeros(n, dtype=numpy.int16)
+
+    def add(self, cards, mask=None):
+        if mask is None:
+            mask = numpy.ones(len(cards), dtype=bool)
+        is_ace = cards == 1
+        self.aces += mask & is_ace
+        self.total += numpy.where(mask & ~is_ace, cards, 0).astype(numpy.int16)
+
+    def _index(self):
+        return numpy.minimum(self.total, MAX_TOTAL), numpy.minimum(self.aces, MAX_ACES)
+
+    def score(self):
+        return SCORES[self._index()]
+
+    def soft(self):
+        return SOFT[self._index()]
+
+
+class Shoes(object):
+    """
+    One shoe per hand, shuffled lazily: column i is only fixed by a Fisher-Yates
+    step once a hand needs its i-th card
+    """
+    def __init__(self, rng, n, decks):
+        self.rng = rng
+        self.cards = numpy.tile(make_shoe(decks), (n, 1))
+        self.rows = numpy.arange(n)
+        self.shuffled = 0
+        self.pos = numpy.zeros(n, dtype=numpy.int64)
+
+    def _shuffle_to(self, column):
+        size = self.cards.shape[1]
+        while self.shuffled <= column and self.shuffled < size:
+            i = self.shuffled
+            j = self.rng.integers(i, size, size=len(self.rows))
+            picked = self.cards[self.rows, j]
+            self.cards[self.rows, j] = self.cards[:, i]
+            self.cards[:, i] = picked
+            self.shuffled += 1
+
+    def draw(self, mask=None):
+        """
+        Next card of every shoe (where mask is set, the others are left alone)
+        """
+        if mask is None:
+            mask = numpy.ones(len(self.rows), dtype=bool)
+        if mask.any():
+            self._shuffle_to(int(self.pos[mask].max()))
+        cards = self.cards[self.rows, numpy.minimum(self.pos, self.cards.shape[1] - 1)]
+        self.pos += mask
+        return cards
+
+
+def simulate_chunk(n, seed, decks=1, strategy=None, dealer_stand=17, hit_soft_17=False, blackjack_payout=1.5):
+    """
+    Plays n hands and returns their counters, in FIELDS order
+    """
+    rng = numpy.random.default_rng(seed)
+    if strategy is None:
+        strategy = threshold_strategy(17)
+    shoes = Shoes(rng, n, decks)
+    player = Hands(n)
+    dealer = Hands(n)
+
+    player.add(shoes.draw())
+    dealer.add(shoes.draw())
+    up = numpy.where(dealer.total > 0, dealer.total, 1)
+    player.add(shoes.draw())
+    dealer.add(shoes.draw())
+
+    natural = player.score() == 21
+    active = ~natural
+    while True:
+        player_score = player.score()
+        active &= (player_score < 21) & strategy[numpy.minimum(player_score, MAX_TOTAL), player.soft().astype(int), up]
+        if not active.any():
+            break
+        player.add(shoes.draw(active), active)
+
+    player_score = player.score()
+    player_bust = player_score > 21
+    drawing = ~natural & ~player_bust
+    while True:
+        dealer_score = dealer.score()
+        hits = dealer_score < dealer_stand
+        if hit_soft_17:
+            hits |= (dealer_score == 17) & dealer.soft()
+        drawing &= hits
+        if not drawing.any():
+            break
+        dealer.add(shoes.draw(drawing), drawing)
+
+    dealer_score = dealer.score()
+    played = ~natural & ~player_bust
+    dealer_bust = played & (dealer_score > 21)
+    wins = played & ~dealer_bust & (player_score > dealer_score)
+    pushes = played & ~dealer_bust & (player_score == dealer_score)
+    losses = played & ~dealer_bust & (player_score < dealer_score)
+
+    payout = numpy.zeros(n)
+    payout[natural] = blackjack_payout
+    payout[player_bust | losses] = -1.0
+    payout[dealer_bust | wins] = 1.0
+
+    return numpy.array([
+        n,
+        int(numpy.count_nonzero(wins | dealer_bust)) + int(numpy.count_nonzero(natural)),
+        int(numpy.count_nonzero(player_bust | losses)),
+        int(numpy.count_nonzero(pushes)),
+        int(numpy.count_nonzero(natural)),
+        int(numpy.count_nonzero(player_bust)),
+        int(numpy.count_nonzero(dealer_bust)),
+        float(payout.sum()),
+        float(numpy.square(payout).sum())
+    ])
+
+
+def simulate(hands, workers=None, chunk_size=100000, seed=None, **rules):
+    """
+    Plays hands over a process pool and returns the summed counters as a dict
+    """
+    chunks = [chunk_size] * (hands // chunk_size)
+    if hands % chunk_size:
+        chunks.append(hands % chunk_size)
+    seeds = numpy.random.SeedSequence(seed).spawn(len(chunks))
+
+    totals = numpy.zeros(len(FIELDS))
+    if workers == 1:
+        results = map(partial(simulate_chunk, **rules), chunks, seeds)
+        for result in results:
+            totals += result
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for result in executor.map(partial(simulate_chunk, **rules), chunks, seeds):
+                totals += result
+    return dict(zip(FIELDS, totals.tolist()))
+
+
+def summarize(stats):
+    n = stats["hands"]
+    ev = stats["payout"] / n
+    variance = stats["payout_sq"] / n - ev * ev
+    lines = ["%d hands" % n]
+    for field in FIELDS[1:7]:
+        lines.append("%-13s %6.2f%%" % (field.replace("_", " "), 100.0 * stats[field] / n))
+    lines.append("EV per hand   %+.4f +/- %.4f" % (ev, 1.96 * math.sqrt(max(variance, 0.0) / n)))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hands', type=int, action='store', dest='hands', default=1000000)
+    parser.add_argument('--workers', type=int, action='store', dest='workers', default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, action='store', dest='chunk_size', default=100000)
+    parser.add_argument('--seed', type=int, action='store', dest='seed', default=None)
+    parser.add_argument('--decks', type=int, action='store', dest='decks', default=1)
+    parser.add_argument('--stand-on', type=int, action='store', dest='stand_on', default=17,
+                        help="The player hits below this score")
+    parser.add_argument('--basic-strategy', action='store_true', dest='basic_strategy', default=False,
+                        help="Play the table computed by blackjack_solver.py instead of --stand-on")
+    parser.add_argument('--dealer-stand', type=int, action='store', dest='dealer_stand', default=17,
+                        help="The dealer hits below this score")
+    parser.add_argument('--hit-soft-17', action='store_true', dest='hit_soft_17', default=False)
+    parser.add_argument('--blackjack-payout', type=float, action='store', dest='blackjack_payout', default=1.5)
+
+    args = parser.parse_args()
+
+    if args.basic_strategy:
+        from blackjack_solver import Solver
+        table, _ = Solver(args.dealer_stand, args.hit_soft_17, args.blackjack_payout).table(args.decks)
+        strategy = table_strategy(table)
+    else:
+        strategy = threshold_strategy(args.stand_on)
+
+    stats = simulate(args.hands, args.workers, args.chunk_size, args.seed, decks=args.decks,
+                     strategy=strategy, dealer_stand=args.dealer_stand,
+                     hit_soft_17=args.hit_soft_17, blackjack_payout=args.blackjack_payout)
+    print(summarize(stats))
@@ -0,0 +1,217 @@
+"""
+Exact hit/stand solver for the game in blackjack.py.
+
+    python blackjack_solver.py
+    python blackjack_solver.py --decks 6 --hit-soft-17
+
+The shoe is a tuple of ten counts (aces, twos, ..., ten-valued cards) and a
+hand is its non-ace total plus its number of aces, scored by blackjack.score()
+exactly like calc_hand(). Expected values are computed by recursion over the
+cards left in the shoe: standing plays the dealer out (the hole card is drawn
+from the same shoe, as the game doesn't peek), hitting averages the best
+value over every card that can come next. Both recursions are memoized on
+(hand, shoe) in LRU caches.
+
+The strategy table is filled by playing every starting hand against every
+upcard with the best composition-dependent decisions and summing, for each
+(score, soft, upcard), how much better hitting is than standing weighted by
+the chance of getting there.
+"""
+import argparse
+from functools import lru_cache
+
+from blackjack import score
+
+RANKS = ['A', '2', '3', '4', '5', '6', '7', '8', '9', '10']
+RANK_INDEX = {'A': 0, '2': 1, '3': 2, '4': 3, '5': 4, '6': 5, '7': 6, '8': 7, '9': 8, '10': 9,
+              'J': 9, 'Q': 9, 'K': 9}
+
+
+def full_shoe(decks=1):
+    return (4 * decks,) * 9 + (16 * decks,)
+
+
+def remove(shoe, index):
+    return shoe[:index] + (shoe[index] - 1,) + shoe[index + 1:]
+
+
+def add_card(total, aces, index):
+    if index == 0:
+        return total, aces + 1
+    return total + index + 1, aces
+
+
+def is_soft(total, aces):
+    return aces > 0 and total <= 10
+
+
+def hand_state(cards):
+    """
+    (non-ace total, aces) of a hand of game cards
+    """
+    total = 0
+    aces = 0
+    for card in cards:
+        total, aces = add_card(total, aces, RANK_INDEX[card])
+    return total, aces
+
+
+class Solver(object):
+    def __init__(self, dealer_stand=17, hit_soft_17=False, blackjack_payout=1.5, cache_size=2 ** 20):
+        self.dealer_stand = dealer_stand
+        self.hit_soft_17 = hit_soft_17
+        self.blackjack_payout = blackjack_payout
+        self.dealer_outcomes = lru_cache(maxsize=cache_size)(self._dealer_outcomes)
+        self.best = lru_cache(maxsize=cache_size)(self._best)
+
+    def _dealer_hits(self, total, aces, dealer_score):
+        if dealer_score < self.dealer_stand:
+            return True
+        return self.hit_soft_17 and dealer_score == 17 and is_soft(total, aces)
+
+    def _dealer_outcomes(self, total, aces, shoe):
+        """
+        Probabilities of the dealer's final score, from dealer_stand to 21 and then bust
+        """
+        left = sum(shoe)
+        result = [0.0] * (23 - self.dealer_stand)
+        for index, count in enumerate(shoe):
+            if not count:
+                continue
+            p = count / left
+            new_total, new_aces = add_card(total, aces, index)
+            dealer_score = score(new_total, new_aces)
+            if dealer_score > 21:
+                result[-1] += p
+            elif not self._dealer_hits(new_total, new_aces, dealer_score):
+                result[dealer_score - self.dealer_stand] += p
+            else:
+                outcomes = self.dealer_outcomes(new_total, new_aces, remove(shoe, index))
+                result = [r + p * q for r, q in zip(result, outcomes)]
+        return tuple(result)
+
+    def stand(self, total, aces, up, shoe):
+        """
+        Expected value of standing on the hand against the upcard
+        """
+        player_score = score(total, aces)
+        if player_score > 21:
+            return -1.0
+        outcomes = self.dealer_outcomes(*add_card(0, 0, up), shoe)
+        ev = outcomes[-1]
+        for dealer_score, p in enumerate(outcomes[:-1], self.dealer_stand):
+            if player_score > dealer_score:
+                ev += p
+            elif player_score < dealer_score:
+                ev -= p
+        return ev
+
+    def hit(self, total, aces, up, shoe):
+        """
+        Expected value of taking one card and then playing on as well as possible
+        """
+        left = sum(shoe)
+        ev = 0.0
+        for index, count in enumerate(shoe):
+            if count:
+                ev += count / left * self.best(*add_card(total, aces, index), up, remove(shoe, index))
+        return ev
+
+    def _best(self, total, aces, up, shoe):
+        if score(total, aces) >= 21:
+            return self.stand(total, aces, up, shoe)
+        return max(self.stand(total, aces, up, shoe), self.hit(total, aces, up, shoe))
+
+    def advise(self, player, up, shoe):
+        """
+        Returns ("Hit" or "Stand", stand EV, hit EV) for the player's cards against
+        the dealer's upcard, with shoe the counts of the cards not yet seen
+        """
+        total, aces = hand_state(player)
+        up = RANK_INDEX[up]
+        stand_ev = self.stand(total, aces, up, shoe)
+        if score(total, aces) >= 21:
+            return "Stand", stand_ev, -1.0
+        hit_ev = self.hit(total, aces, up, shoe)
+        return ("Hit" if hit_ev > stand_ev else "Stand"), stand_ev, hit_ev
+
+    def table(self, decks=1):
+        """
+        Returns ({(score, soft, upcard rank): "H" or "S"}, EV of a hand played that way)
+        """
+        gain = {}
+        ev = 0.0
+        start = full_shoe(decks)
+        for up, up_count in enumerate(start):
+            p_up = up_count / sum(start)
+            shoe = remove(start, up)
+            # every reachable (total, aces, shoe) with its probability, one more card per round
+            level = {}
+            for first, first_count in enumerate(shoe):
+                if not first_count:
+                    continue
+                p_first = first_count / sum(shoe)
+                after_first = remove(shoe, first)
+                for second, second_count in enumerate(after_first):
+                    if second_count:
+                        total, aces = add_card(*add_card(0, 0, first), second)
+                        key = (total, aces, remove(after_first, second))
+                        level[key] = level.get(key, 0.0) + p_first * second_count / sum(after_first)
+
+            natural = True
+            while level:
+                next_level = {}
+                for (total, aces, rest), p in level.items():
+                    player_score = score(total, aces)
+                    if natural and player_score == 21:
+                        ev += p_up * p * self.blackjack_payout
+                        continue
+                    stand_ev = self.stand(total, aces, up, rest)
+                    hit_ev = self.hit(total, aces, up, rest) if player_score < 21 else -1.0
+                    cell = (player_score, is_soft(total, aces), up + 1)
+                    gain[cell] = gain.get(cell, 0.0) + p_up * p * (hit_ev - stand_ev)
+                    if hit_ev <= stand_ev:
+                        ev += p_up * p * stand_ev
+                        continue
+                    left = sum(rest)
+                    for index, count in enumerate(rest):
+                        if count:
+                            new_total, new_aces = add_card(total, aces, index)
+                            if score(new_total, new_aces) > 21:
+                                ev -= p_up * p * count / left
+                                continue
+                            key = (new_total, new_aces, remove(rest, index))
+                            next_level[key] = next_level.get(key, 0.0) + p * count / left
+                level = next_level
+                natural = False
+
+        return {cell: "H" if value > 0 else "S" for cell, value in gain.items()}, ev
+
+
+def format_table(table):
+    lines = []
+    for soft in (False, True):
+        scores = sorted(set(cell[0] for cell in table if cell[1] == soft))
+        lines.append("%-6s %s" % ("soft" if soft else "hard", " ".join("%2s" % rank for rank in RANKS[1:] + RANKS[:1])))
+        for player_score in scores:
+            row = [table.get((player_score, soft, up), "-") for up in range(2, 11)] + [table.get((player_score, soft, 1), "-")]
+            lines.append("%-6d %s" % (player_score, " ".join("%2s" % decision for decision in row)))
+        lines.append("")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--decks', type=int, action='store', dest='decks', default=1)
+    parser.add_argument('--dealer-stand', type=int, action='store', dest='dealer_stand', default=17,
+                        help="The dealer hits below this score")
+    parser.add_argument('--hit-soft-17', action='store_true', dest='hit_soft_17', default=False)
+    parser.add_argument('--blackjack-payout', type=float, action='store', dest='blackjack_payout', default=1.5)
+    parser.add_argument('--cache-size', type=int, action='store', dest='cache_size', default=2 ** 20)
+
+    args = parser.parse_args()
+
+    solver = Solver(args.dealer_stand, args.hit_soft_17, args.blackjack_payout, args.cache_size)
+    table, ev = solver.table(args.decks)
+    print(format_table(table))
+    print("EV per hand %+.4f" % ev)
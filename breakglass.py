@@ -0,0 +1,436 @@
+#!/usr/bin/env python
+# Breakglass tool to attach or detach a policy (AdministratorAccess by default) for many users at once
+#
+#   ./breakglass.py attach                      # users listed in the AdministratorAccess file
+#   ./breakglass.py attach --users oncall.txt --profile devops --profile prod
+#   ./breakglass.py detach                      # every user the policy is attached to
+#   ./breakglass.py rollback --journal breakglass.journal
+#   ./breakglass.py grant --users oncall.txt --minutes 60
+#   ./breakglass.py scheduler --profile devops
+#
+# Every change that is actually made is appended to the journal as a JSON line, so
+# "rollback" can undo exactly that run (and nothing that was already in place).
+# Accounts are processed in parallel when more than one --profile or --role-arn is given.
+#
+# "grant" attaches the policy like "attach" but also records each grant with an expiry
+# in a local sqlite store. "scheduler" keeps the unexpired grants in a heap ordered by
+# expiry, sleeps until the next one is due and detaches everything due at that point
+# in one batch. It never lists IAM to find expired grants, it only reads the store.
+# Its detaches are journaled under the "scheduler" command and rollback never undoes
+# them, as that would hand back access that has expired.
+
+import argparse
+import heapq
+import json
+import random
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+POLICY_ARN = "arn:aws:iam::aws:policy/AdministratorAccess"
+USERS_FILE = "AdministratorAccess"
+JOURNAL_FILE = "breakglass.journal"
+GRANTS_DB = "breakglass_grants.db"
+
+# How often the scheduler checks the store for grants added by other processes
+SCHEDULER_POLL_SECONDS = 30
+
+THROTTLE_ERRORS = ('Throttling', 'ThrottlingException', 'RequestLimitExceeded', 'TooManyRequestsException')
+MAX_ATTEMPTS = 8
+
+
+def read_users(filename):
+    with open(filename) as f:
+        content = f.readlines()
+
+    return [x.strip() for x in content if x.strip()]
+
+
+def with_retries(call, **kwargs):
+    """
+    Calls call(**kwargs), backing off exponentially (with jitter) while IAM is throttling us
+    """
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            return call(**kwargs)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in THROTTLE_ERRORS or attempt == MAX_ATTEMPTS - 1:
+                raise
+            time.sleep(min(20, (2 ** attempt) * 0.1) * random.uniform(0.5, 1.5))
+
+
+def get_policy_users(client, policy_arn):
+    """
+    Returns every user the policy is attached to, following all the pages
+    """
+    users = []
+    paginator = client.get_paginator('list_entities_for_policy')
+    for page in paginator.paginate(PolicyArn=policy_arn, EntityFilter='User'):
+        users += [user['UserName'] for user in page['PolicyUsers']]
+    return users
+
+
+class Journal(object):
+    """
+    Append-only JSON lines record of the changes made, flushed after every entry
+    """
+    def __init__(self, filename, run_id, command=None):
+        self.filename = filename
+        self.run_id = run_id
+        self.command = command
+        self.lock = threading.Lock()
+        self.file = open(filename, "a")
+
+    def record(self, account, action, user, policy_arn):
+        entry = {
+            'run_id': self.run_id,
+            'command': self.command,
+            'time': datetime.utcnow().isoformat() + "Z",
+            'account': account,
+            'action': action,
+            'user': user,
+            'policy_arn': policy_arn
+        }
+        with self.lock:
+            self.file.write(json.dumps(entry) + "\n")
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_journal(filename, run_id=None):
+    """
+    Returns the journal entries of run_id, or of the last run in the journal. Entries
+    recorded by the scheduler are left out, undoing an expiry would re-grant access.
+    """
+    entries = []
+    try:
+        with open(filename) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    if entry.get('command') != "scheduler":
+                        entries.append(entry)
+    except FileNotFoundError:
+        print("Journal {} doesn't exist".format(filename))
+        return []
+    if not entries:
+        return []
+    run_id = run_id or entries[-1]['run_id']
+    return [entry for entry in entries if entry['run_id'] == run_id]
+
+
+class Account(object):
+    def __init__(self, name, session):
+        self.name = name
+        self.client = session.client('iam', config=Config(retries={'max_attempts': 10, 'mode': 'adaptive'}))
+        self.account_id = session.client('sts').get_caller_identity().get('Account')
+
+
+def get_accounts(profiles, role_arns):
+    """
+    Returns an Account for each --profile and each --role-arn (assumed from the default
+    credentials), or just the default credentials if neither was given
+    """
+    accounts = []
+    for profile in profiles:
+        accounts.append(Account(profile, boto3.session.Session(profile_name=profile)))
+    for role_arn in role_arns:
+        creds = boto3.client('sts').assume_role(RoleArn=role_arn, RoleSessionName="breakglass")['Credentials']
+        session = boto3.session.Session(
+            aws_access_key_id=creds['AccessKeyId'],
+            aws_secret_access_key=creds['SecretAccessKey'],
+            aws_session_token=creds['SessionToken']
+        )
+        accounts.append(Account(role_arn, session))
+    if not accounts:
+        accounts.append(Account("default", boto3.session.Session()))
+    return accounts
+
+
+def apply_changes(account, action, users, policy_arn, journal, workers):
+    """
+    Attaches or detaches policy_arn for users concurrently. Returns the users that failed.
+    """
+    if action == "attach":
+        call = account.client.attach_user_policy
+    else:
+        call = account.client.detach_user_policy
+
+    def change(user):
+        try:
+            with_retries(call, PolicyArn=policy_arn, UserName=user)
+        except ClientError as e:
+            # someone already detached it by hand, nothing to record
+            if action == "detach" and e.response['Error']['Code'] == 'NoSuchEntity':
+                return
+            raise
+        if journal:
+            journal.record(account.account_id, action, user, policy_arn)
+
+    failed = set()
+    if not users:
+        return failed
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(change, user): user for user in users}
+        for future in as_completed(futures):
+            user = futures[future]
+            try:
+                future.result()
+                print("{}: {}ed {} for {}".format(account.account_id, action, policy_arn, user))
+            except Exception as e:
+                # network errors as well as IAM ones, the caller retries or reports the user
+                print("{}: failed to {} {} for {}: {}".format(account.account_id, action, policy_arn, user, e))
+                failed.add(user)
+    return failed
+
+
+def attach(account, users, policy_arn, journal, workers):
+    # Users that already have the policy are left out so a rollback won't take it away from them
+    attached = set(get_policy_users(account.client, policy_arn))
+    return len(apply_changes(account, "attach", [user for user in users if user not in attached],
+                             policy_arn, journal, workers))
+
+
+def detach(account, users, policy_arn, journal, workers):
+    attached = get_policy_users(account.client, policy_arn)
+    if users is not None:
+        wanted = set(users)
+        attached = [user for user in attached if user in wanted]
+    return len(apply_changes(account, "detach", attached, policy_arn, journal, workers))
+
+
+def rollback(account, entries, journal, workers):
+    """
+    Undoes the journal entries recorded for this account
+    """
+    failures = 0
+    undo = {"attach": "detach", "detach": "attach"}
+    for action in undo:
+        by_policy = {}
+        for entry in entries:
+            if entry['account'] == account.account_id and entry['action'] == action:
+                by_policy.setdefault(entry['policy_arn'], []).append(entry['user'])
+        for policy_arn, users in by_policy.items():
+            failures += len(apply_changes(account, undo[action], users, policy_arn, journal, workers))
+    return failures
+
+
+class GrantStore(object):
+    """
+    sqlite store of timed grants. A grant is active until revoked_at is set.
+    """
+    def __init__(self, filename):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS grants (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                account TEXT NOT NULL,
+                user TEXT NOT NULL,
+                policy_arn TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                revoked_at REAL
+            )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS active_grants ON grants (revoked_at, expires_at)")
+        self.db.commit()
+
+    def active(self, account, policy_arn):
+        """
+        Returns {user: grant id} for the active grants of policy_arn in account
+        """
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT user, id FROM grants WHERE revoked_at IS NULL AND account = ? AND policy_arn = ?",
+                (account, policy_arn)).fetchall()
+        return dict(rows)
+
+    def add(self, account, users, policy_arn, expires_at):
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT INTO grants (account, user, policy_arn, expires_at) VALUES (?, ?, ?, ?)",
+                [(account, user, policy_arn, expires_at) for user in users])
+
+    def extend(self, grant_ids, expires_at):
+        with self.lock, self.db:
+            self.db.executemany(
+                "UPDATE grants SET expires_at = MAX(expires_at, ?) WHERE id = ?",
+                [(expires_at, grant_id) for grant_id in grant_ids])
+
+    def pending(self, after_id=0):
+        """
+        Returns (expires_at, id, account, user, policy_arn) for every active grant with an id above after_id
+        """
+        with self.lock:
+            return self.db.execute(
+                "SELECT expires_at, id, account, user, policy_arn FROM grants "
+                "WHERE revoked_at IS NULL AND id > ? ORDER BY id", (after_id,)).fetchall()
+
+    def expiry(self, grant_id):
+        with self.lock:
+            row = self.db.execute("SELECT expires_at, revoked_at FROM grants WHERE id = ?", (grant_id,)).fetchone()
+        return None if row is None or row[1] is not None else row[0]
+
+    def revoke(self, grant_ids):
+        with self.lock, self.db:
+            self.db.executemany(
+                "UPDATE grants SET revoked_at = ? WHERE id = ?",
+                [(time.time(), grant_id) for grant_id in grant_ids])
+
+
+def grant(account, users, policy_arn, journal, workers, store, minutes):
+    """
+    Attaches policy_arn for users and records an expiry for each of them.
+    Users with an active grant have it extended instead, users who already had the
+    policy outside of a grant are left alone so the scheduler never takes it away.
+    If the policy was detached by hand while a grant was still active, it is attached
+    again and that grant is extended, so a user never has two active grants.
+    """
+    expires_at = time.time() + minutes * 60
+    attached = set(get_policy_users(account.client, policy_arn))
+    active = store.active(account.account_id, policy_arn)
+
+    to_extend = [active[user] for user in users if user in attached and user in active]
+    standing = [user for user in users if user in attached and user not in active]
+    to_attach = [user for user in users if user not in attached]
+
+    for user in standing:
+        print("{}: {} already has {} outside of breakglass, not granting".format(account.account_id, user, policy_arn))
+
+    store.extend(to_extend, expires_at)
+    failed = apply_changes(account, "attach", to_attach, policy_arn, journal, workers)
+    attached_now = [user for user in to_attach if user not in failed]
+    store.extend([active[user] for user in attached_now if user in active], expires_at)
+    store.add(account.account_id, [user for user in attached_now if user not in active], policy_arn, expires_at)
+    print("{}: {} grants until {}".format(
+        account.account_id, len(to_attach) - len(failed) + len(to_extend), datetime.fromtimestamp(expires_at)))
+    return len(failed)
+
+
+def run_scheduler(accounts, store, journal, workers):
+    """
+    Revokes grants as they expire. Grants are kept in a heap ordered by expiry, new
+    grants are picked up from the store every SCHEDULER_POLL_SECONDS.
+    """
+    accounts_by_id = {account.account_id: account for account in accounts}
+    heap = []
+    last_id = 0
+
+    while True:
+        for row in store.pending(last_id):
+            heapq.heappush(heap, row)
+            last_id = max(last_id, row[1])
+
+        now = time.time()
+        due = []
+        while heap and heap[0][0] <= now:
+            expires_at, grant_id, account_id, user, policy_arn = heapq.heappop(heap)
+            # the grant may have been extended or revoked since it was queued
+            current = store.expiry(grant_id)
+            if current is None:
+                continue
+            if current > expires_at:
+                heapq.heappush(heap, (current, grant_id, account_id, user, policy_arn))
+                continue
+            due.append((grant_id, account_id, user, policy_arn))
+
+        batches = {}
+        for grant_id, account_id, user, policy_arn in due:
+            batches.setdefault((account_id, policy_arn), {})[user] = grant_id
+        for (account_id, policy_arn), grants in batches.items():
+            account = accounts_by_id.get(account_id)
+            if account is None:
+                print("No credentials for account {}, can't revoke {} grants".format(account_id, len(grants)))
+                continue
+            try:
+                failed = apply_changes(account, "detach", list(grants), policy_arn, journal, workers)
+            except Exception as e:
+                print("{}: failed to revoke {} grants: {}".format(account_id, len(grants), e))
+                failed = set(grants)
+            store.revoke([grant_id for user, grant_id in grants.items() if user not in failed])
+            for user in failed:
+                # try again on the next pass
+                heapq.heappush(heap, (time.time() + SCHEDULER_POLL_SECONDS, grants[user], account_id, user, policy_arn))
+
+        sleep_for = SCHEDULER_POLL_SECONDS
+        if heap:
+            sleep_for = min(sleep_for, max(0, heap[0][0] - time.time()))
+        time.sleep(sleep_for)
+
+
+def run(command, accounts, users, policy_arn, journal_file, run_id, workers, grants_db=GRANTS_DB, minutes=60):
+    journal_entries = read_journal(journal_file, run_id) if command == "rollback" else None
+    if command == "rollback" and not journal_entries:
+        print("Nothing to roll back in {}".format(journal_file))
+        return 0
+    journal = Journal(journal_file, str(uuid.uuid4()), command)
+    print("Journal run id: {}".format(journal.run_id))
+    store = GrantStore(grants_db) if command in ("grant", "scheduler") else None
+
+    if command == "scheduler":
+        try:
+            run_scheduler(accounts, store, journal, workers)
+        finally:
+            journal.close()
+
+    def run_account(account):
+        if command == "grant":
+            return grant(account, users, policy_arn, journal, workers, store, minutes)
+        elif command == "attach":
+            return attach(account, users, policy_arn, journal, workers)
+        elif command == "detach":
+            return detach(account, users, policy_arn, journal, workers)
+        else:
+            return rollback(account, journal_entries, journal, workers)
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(accounts)) as pool:
+            failures = sum(pool.map(run_account, accounts))
+    finally:
+        journal.close()
+
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['attach', 'detach', 'rollback', 'grant', 'scheduler'])
+    parser.add_argument('--policy-arn', action='store', dest='policy_arn', default=POLICY_ARN)
+    parser.add_argument('--users', action='store', dest='users_file', default=None,
+                        help="File with one user name per line. attach defaults to the AdministratorAccess file, "
+                             "detach defaults to every user the policy is attached to")
+    parser.add_argument('--profile', action='append', dest='profiles', default=[])
+    parser.add_argument('--role-arn', action='append', dest='role_arns', default=[],
+                        help="Role to assume in another account")
+    parser.add_argument('--journal', action='store', dest='journal_file', default=JOURNAL_FILE)
+    parser.add_argument('--run-id', action='store', dest='run_id', default=None,
+                        help="Run to roll back, defaults to the last run in the journal. "
+                             "Scheduler runs are never rolled back")
+    parser.add_argument('--workers', type=int, action='store', dest='workers', default=10,
+                        help="Number of concurrent IAM calls per account")
+    parser.add_argument('--minutes', type=float, action='store', dest='minutes', default=60,
+                        help="How long a grant lasts before the scheduler revokes it")
+    parser.add_argument('--grants-db', action='store', dest='grants_db', default=GRANTS_DB)
+
+    args = parser.parse_args()
+
+    if args.command in ("attach", "grant"):
+        users = read_users(args.users_file or USERS_FILE)
+    elif args.users_file:
+        users = read_users(args.users_file)
+    else:
+        users = None
+
+    accounts = get_accounts(args.profiles, args.role_arns)
+    failures = run(args.command, accounts, users, args.policy_arn, args.journal_file, args.run_id, args.workers,
+                   args.grants_db, args.minutes)
+    sys.exit(1 if failures else 0)
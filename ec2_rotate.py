@@ -1,9 +1,10 @@
 #!/usr/bin/env python
 
 import boto3
+import json
 import os
 import pprint
-from datetime import datetime
+from datetime import datetime, timedelta
 import time
 import signal
 from termcolor import colored
@@ -12,8 +13,30 @@ import sys
 
 IS_DRY_RUN = True
 IS_PROD = False
+ROTATE_UP_TO_DATE = False
 
 SLEEP_INTERVAL_SECONDS = 90
+# the scheduler wakes up at least this often while waiting for a window
+SCHEDULER_MAX_SLEEP_SECONDS = 15 * 60
+
+# termination policies under which scaling down removes the out of date instances first
+OLDEST_FIRST_TERMINATION_POLICIES = ('Default', 'OldestLaunchTemplate', 'OldestLaunchConfiguration')
+
+# Service Quotas codes of the On-Demand vCPU limits, by instance family (the letters before
+# the generation number). Instances of families that aren't listed can't be checked.
+STANDARD_VCPU_QUOTA = 'L-1216C47A'
+FAMILY_VCPU_QUOTAS = dict([(family, STANDARD_VCPU_QUOTA) for family in ('a', 'c', 'd', 'h', 'i', 'im', 'is', 'm', 'r', 't', 'z')] + [
+    ('dl', 'L-6E869C2A'),
+    ('f', 'L-74FC7D96'),
+    ('g', 'L-DB2E81BA'),
+    ('gr', 'L-DB2E81BA'),
+    ('vt', 'L-DB2E81BA'),
+    ('inf', 'L-1945791B'),
+    ('p', 'L-417A185B'),
+    ('trn', 'L-2C3B7624'),
+    ('u', 'L-43DA4232'),
+    ('x', 'L-7295265B'),
+])
 
 USAGE = """
         Simple tool to perform a rolling update on the ASGs you select. 
@@ -41,6 +64,15 @@ USAGE = """
         --wait is the time to wait in minutes between the scale up and scale down activities
         --filter should be followed by a comma-separated list of tag key-value pairs you want to filter ASGs on
                  Providing more than one --filter will combine the results of each individual --filter
+        --schedule runs the jobs in a schedule file within their maintenance windows, see run_scheduler
+        --checkpoint is the file the scheduler records finished ASGs in (default ec2_rotate_checkpoint.json)
+        --skip-capacity-check skips the pre-flight check that the surge fits in the account's EC2 vCPU quotas.
+                 With the check, ASGs are rotated in several waves when they don't all fit at once, and
+                 nothing is done if one ASG's surge alone doesn't fit. Instance families without a known
+                 On-Demand quota aren't checked
+        --force rotates every selected ASG. Without it, ASGs whose instances all run the group's current
+                launch template version or launch configuration are skipped, and the others only surge
+                by the number of out of date instances (unless their termination policies might keep those)
 
             Sample arguments and their output:
 
@@ -67,10 +99,35 @@ SUSPENDED_SCALING_PROCESSES = [
 ]
 
 
-def run_rolling_update(asg_update_list, asgs_dict, asg_clients, elb_clients, initial_sleep_time, is_alb, scaler):
+def run_rolling_update(asg_update_list, asgs_dict, asg_clients, elb_clients, initial_sleep_time, is_alb, scaler, ec2_clients=None,
+                       capacity_checkers=None, check_up_to_date=True):
+    """
+    check_up_to_date=False is for callers that already ran skip_up_to_date_asgs on asg_update_list,
+    the RotationState it left on the records is used as it is
+    """
 
     completed_asgs = set()
 
+    if check_up_to_date and not ROTATE_UP_TO_DATE:
+        asg_update_list = skip_up_to_date_asgs(asg_update_list, asgs_dict, ec2_clients)
+    else:
+        for asg in asg_update_list:
+            if asg in asgs_dict and (check_up_to_date or asgs_dict[asg].rotation is None):
+                asgs_dict[asg].rotation = RotationState(asgs_dict[asg])
+
+    if capacity_checkers and asg_update_list:
+        waves, refused = plan_capacity_waves(asg_update_list, asgs_dict, capacity_checkers)
+        if refused:
+            raise InsufficientCapacity(refusal_message(refused), refused)
+        if len(waves) > 1:
+            print colored("The surge doesn't fit in the EC2 quotas all at once, rotating in {} waves".format(len(waves)), "yellow", "on_white", attrs=["bold"])
+            for number, wave in enumerate(waves, 1):
+                print "Wave {}: {}\n".format(number, ", ".join(wave))
+            for wave in waves:
+                run_rolling_update(wave, asgs_dict, asg_clients, elb_clients, initial_sleep_time, is_alb, scaler, ec2_clients,
+                                   check_up_to_date=False)
+            return 0
+
     """
     ******************
     **** SCALE UP ****
@@ -92,21 +149,21 @@ def run_rolling_update(asg_update_list, asgs_dict, asg_clients, elb_clients, ini
             continue
 
         # Scale up
-        region = asgs_dict[asg]['region']
-
-        old_max_size = asgs_dict[asg]['MaxSize']
-        if IS_PROD:
-            asgs_dict[asg]['NewMaxSize'] = ((old_max_size * 2) + 4) if old_max_size else 0
-        else:
-            asgs_dict[asg]['NewMaxSize'] = (old_max_size * 2) if old_max_size else 0
-        new_max_size = asgs_dict[asg]['NewMaxSize']
-
-        old_desired_capacity = asgs_dict[asg]['DesiredCapacity']
-        if IS_PROD:
-            asgs_dict[asg]['NewDesiredCapacity'] = ((old_desired_capacity * 2) + 4) if old_desired_capacity else 0
-        else:
-            asgs_dict[asg]['NewDesiredCapacity'] = (old_desired_capacity * 2) if old_desired_capacity else 0
-        new_desired_capacity = asgs_dict[asg]['NewDesiredCapacity']
+        region = asgs_dict[asg].region
+        rotation = asgs_dict[asg].rotation
+
+        old_max_size = rotation.old_max_size
+        old_desired_capacity = rotation.old_desired_capacity
+        stale_count = rotation.stale_instance_count
+        if stale_count is not None and 0 < stale_count < old_desired_capacity:
+            print "     {} of {} instances in {} are out of date\n".format(stale_count, len(asgs_dict[asg].instances), asg)
+            if not terminates_oldest_first(asgs_dict[asg]):
+                print "     Its termination policies ({}) may not pick the out of date instances when scaling down, replacing all of them\n"\
+                    .format(", ".join(asgs_dict[asg].termination_policies))
+
+        rotation.new_desired_capacity, rotation.new_max_size = get_surge_capacity(asgs_dict[asg])
+        new_max_size = rotation.new_max_size
+        new_desired_capacity = rotation.new_desired_capacity
 
         if IS_DRY_RUN:
             print DRY_RUN_NOTICE
@@ -162,7 +219,8 @@ def run_rolling_update(asg_update_list, asgs_dict, asg_clients, elb_clients, ini
                 completed_asgs.add(asg)
                 continue
 
-            attached_elbs = get_attached_lbs(asg, asg_clients[asgs_dict[asg]['region']])
+            rotation = asgs_dict[asg].rotation
+            attached_elbs = get_attached_lbs(asg, asg_clients[asgs_dict[asg].region])
             print "ELBs attached to {}".format(asg)
             for elb in attached_elbs:
                 print "    - {}".format(elb)
@@ -171,22 +229,22 @@ def run_rolling_update(asg_update_list, asgs_dict, asg_clients, elb_clients, ini
             all_instances_healthy = True
             for elb in attached_elbs:
                 if is_alb:
-                    attached_instance_states = {target["Target"]["Id"]: target["TargetHealth"]["State"] for target in elb_clients[asgs_dict[asg]['region']].describe_target_health(TargetGroupArn=elb)["TargetHealthDescriptions"]}
+                    attached_instance_states = {target["Target"]["Id"]: target["TargetHealth"]["State"] for target in elb_clients[asgs_dict[asg].region].describe_target_health(TargetGroupArn=elb)["TargetHealthDescriptions"]}
                 else:
-                    attached_instance_states = {instance["InstanceId"]: instance["State"] for instance in elb_clients[asgs_dict[asg]['region']].describe_instance_health(LoadBalancerName=elb)["InstanceStates"]}
+                    attached_instance_states = {instance["InstanceId"]: instance["State"] for instance in elb_clients[asgs_dict[asg].region].describe_instance_health(LoadBalancerName=elb)["InstanceStates"]}
 
-                if len(attached_instance_states) < asgs_dict[asg]['NewDesiredCapacity']:
+                if len(attached_instance_states) < rotation.new_desired_capacity:
                     print "{} There are {} instances attached to '{}', but the ASG's DesiredCapacity is {}\n"\
-                        .format(colored("NOTE:", "yellow", "on_white", attrs=["bold"]), len(attached_instance_states), elb, asgs_dict[asg]['NewDesiredCapacity'])
-                    print colored("Set the DesiredCapacity of {} to {}".format(asg, asgs_dict[asg]['NewDesiredCapacity']), "blue", "on_white", attrs=["bold"])
+                        .format(colored("NOTE:", "yellow", "on_white", attrs=["bold"]), len(attached_instance_states), elb, rotation.new_desired_capacity)
+                    print colored("Set the DesiredCapacity of {} to {}".format(asg, rotation.new_desired_capacity), "blue", "on_white", attrs=["bold"])
                     print ""
 
-                    region = asgs_dict[asg]['region']
+                    region = asgs_dict[asg].region
                     if not IS_DRY_RUN:
                         asg_clients[region].update_auto_scaling_group(
                             AutoScalingGroupName=asg,
-                            MaxSize=asgs_dict[asg]['NewMaxSize'],
-                            DesiredCapacity=asgs_dict[asg]['NewDesiredCapacity'],
+                            MaxSize=rotation.new_max_size,
+                            DesiredCapacity=rotation.new_desired_capacity,
                         )
                     all_instances_healthy = False
                     break
@@ -208,13 +266,13 @@ def run_rolling_update(asg_update_list, asgs_dict, asg_clients, elb_clients, ini
 
             if all_instances_healthy or IS_DRY_RUN or not IS_PROD:
                 # Scale down
-                region = asgs_dict[asg]['region']
+                region = asgs_dict[asg].region
 
-                old_max_size = asgs_dict[asg]['MaxSize']
-                new_max_size = asgs_dict[asg]['NewMaxSize']
+                old_max_size = rotation.old_max_size
+                new_max_size = rotation.new_max_size
 
-                old_desired_capacity = asgs_dict[asg]['DesiredCapacity']
-                new_desired_capacity = asgs_dict[asg]['NewDesiredCapacity']
+                old_desired_capacity = rotation.old_desired_capacity
+                new_desired_capacity = rotation.new_desired_capacity
 
                 if IS_DRY_RUN:
                     print DRY_RUN_NOTICE
@@ -263,6 +321,33 @@ def run_rolling_update(asg_update_list, asgs_dict, asg_clients, elb_clients, ini
             time.sleep(SLEEP_INTERVAL_SECONDS)  # sleep for a minute, then try again
 
     print colored("All rolling updates completed successfully!", "green", "on_white", attrs=["bold"])
+    return 0
+
+def get_surge_capacity(record):
+    """
+    Returns the (DesiredCapacity, MaxSize) the ASG is scaled up to during a rolling update
+    """
+    old_max_size = record.max_size
+    old_desired_capacity = record.desired_capacity
+    stale_count = record.rotation.stale_instance_count if record.rotation else None
+
+    if stale_count is not None and 0 < stale_count < old_desired_capacity and terminates_oldest_first(record):
+        # only surge by the out of date instances, scaling back down terminates them
+        # first as they run the oldest launch template/configuration
+        surge = (stale_count + 4) if IS_PROD else stale_count
+        return old_desired_capacity + surge, max(old_max_size, old_desired_capacity + surge)
+    if IS_PROD:
+        return (((old_desired_capacity * 2) + 4) if old_desired_capacity else 0,
+                ((old_max_size * 2) + 4) if old_max_size else 0)
+    return (old_desired_capacity * 2) if old_desired_capacity else 0, (old_max_size * 2) if old_max_size else 0
+
+def terminates_oldest_first(record):
+    """
+    True if the ASG's termination policies remove the instances running the oldest launch
+    template/configuration first, which a partial surge relies on when scaling back down
+    """
+    return all(policy in OLDEST_FIRST_TERMINATION_POLICIES for policy in record.termination_policies)
+
 
 def run_scale_down_only(asg_update_list, asgs_dict, asg_clients, elb_clients, is_alb):
 
@@ -278,13 +363,9 @@ def run_scale_down_only(asg_update_list, asgs_dict, asg_clients, elb_clients, is
             print "    - {}".format(asg)
         print ""
 
-    asgs_dict[asg]['NewMinSize'] = 0
-    asgs_dict[asg]['NewDesiredCapacity'] = 0
-    asgs_dict[asg]['NewMaxSize'] = 0
-
-    scale_asgs(asg_clients, asgs_dict, asg_update_list, asgs_dict[asg]['NewMinSize'], asgs_dict[asg]['NewDesiredCapacity'], asgs_dict[asg]['NewMaxSize'])
+    scale_asgs(asg_clients, asgs_dict, asg_update_list, 0, 0, 0)
 
-    wait_for_asg_scale_completion(asg_update_list, downscaled_asgs, asgs_dict[asg]['NewDesiredCapacity'], elb_clients, is_alb)
+    wait_for_asg_scale_completion(asg_update_list, downscaled_asgs, 0, elb_clients, is_alb)
 
     print colored("All scale downs have completed successfully!", "green", "on_white", attrs=["bold"])
 
@@ -302,20 +383,15 @@ def run_scale_up_only(asg_update_list, asgs_dict, asg_clients, elb_clients, is_a
             print "    - {}".format(asg)
         print ""
 
-    asgs_dict[asg]['NewMinSize'] = desired_capacity
-    asgs_dict[asg]['NewDesiredCapacity'] = desired_capacity
-    asgs_dict[asg]['NewMaxSize'] = desired_capacity
+    scale_asgs(asg_clients, asgs_dict, asg_update_list, desired_capacity, desired_capacity, desired_capacity)
 
-    scale_asgs(asg_clients, asgs_dict, asg_update_list, asgs_dict[asg]['NewMinSize'], asgs_dict[asg]['NewDesiredCapacity'], asgs_dict[asg]['NewMaxSize'])
-
-    wait_for_asg_scale_completion(asg_update_list, scaledup_asgs, asgs_dict[asg]['NewDesiredCapacity'], elb_clients, is_alb)
+    wait_for_asg_scale_completion(asg_update_list, scaledup_asgs, desired_capacity, elb_clients, is_alb)
 
     print colored("All scale ups have completed successfully!", "green", "on_white", attrs=["bold"])
 
 def run_rolling_update_worker_node(asg_update_list, asgs_dict, asg_clients, elb_clients, is_alb):
 
     downscaled_asgs = set()
-    completed_asgs = set()
 
     if len(asg_update_list) == 0:
         print "No ASGs provided!"
@@ -327,24 +403,28 @@ def run_rolling_update_worker_node(asg_update_list, asgs_dict, asg_clients, elb_
             print "    - {}".format(asg)
         print ""
 
-    asgs_dict[asg]['NewMinSize'] = 0
-    asgs_dict[asg]['NewDesiredCapacity'] = 0
-    asgs_dict[asg]['NewMaxSize'] = 0
+    scale_asgs(asg_clients, asgs_dict, asg_update_list, 0, 0, 0)
 
-    scale_asgs(asg_clients, asgs_dict, asg_update_list, asgs_dict[asg]['NewMinSize'], asgs_dict[asg]['NewDesiredCapacity'], asgs_dict[asg]['NewMaxSize'])
-
-    wait_for_asg_scale_completion(asg_update_list, downscaled_asgs, asgs_dict[asg]['NewDesiredCapacity'], elb_clients, is_alb)
-
-    if asgs_dict[asg]['DesiredCapacity'] == 0:
-        asgs_dict[asg]['MinSize'] = 1
-        asgs_dict[asg]['DesiredCapacity'] = 1
-        asgs_dict[asg]['MaxSize'] = 5
+    wait_for_asg_scale_completion(asg_update_list, downscaled_asgs, 0, elb_clients, is_alb)
 
     print colored("Scale down completed. Proceeding to Scale up", "green", "on_white", attrs=["bold"])
 
-    scale_asgs(asg_clients, asgs_dict, asg_update_list, asgs_dict[asg]['MinSize'], asgs_dict[asg]['DesiredCapacity'], asgs_dict[asg]['MaxSize'])
+    # every ASG goes back to its own loaded sizes, ASGs restored to the same DesiredCapacity are waited on together
+    restored = {}
+    for asg in asg_update_list:
+        if asg not in asgs_dict:
+            # already reported as skipped by the scale down
+            continue
+        record = asgs_dict[asg]
+        min_size, desired_capacity, max_size = record.min_size, record.desired_capacity, record.max_size
+        if desired_capacity == 0:
+            min_size, desired_capacity, max_size = 1, 1, 5
+        scale_asgs(asg_clients, asgs_dict, [asg], min_size, desired_capacity, max_size)
+        restored.setdefault(desired_capacity, []).append(asg)
 
-    wait_for_asg_scale_completion(asg_update_list, completed_asgs, asgs_dict[asg]['DesiredCapacity'], elb_clients, is_alb)
+    for desired_capacity, asgs in sorted(restored.items()):
+        # the wait runs until its set holds exactly the ASGs it was given, so each group gets its own
+        wait_for_asg_scale_completion(asgs, set(), desired_capacity, elb_clients, is_alb)
 
     print colored("All rolling updates completed successfully!", "green", "on_white", attrs=["bold"])
 
@@ -374,13 +454,13 @@ def scale_asgs(asg_clients, asgs_dict, asg_update_list, min, desired, max):
         if IS_DRY_RUN:
             print DRY_RUN_NOTICE
 
-        print colored("Performing scale for {} located in {}".format(asg, asgs_dict[asg]['region']), "blue", "on_white", attrs=["bold"])
+        print colored("Performing scale for {} located in {}".format(asg, asgs_dict[asg].region), "blue", "on_white", attrs=["bold"])
         print "     Scaling DesiredCapacity for {} to {}".format(asg, desired)
         print "     Scaling MinSize for {} to {}\n".format(asg, min)
         print "     Scaling MaxSize for {} to {}\n".format(asg, max)
 
         if not IS_DRY_RUN:
-            scale(asg_clients, asg, asgs_dict[asg]['region'], min, desired, max)
+            scale(asg_clients, asg, asgs_dict[asg].region, min, desired, max)
 
 def scale(asg_clients, asg, region, min, desired, max):
     asg_clients[region].update_auto_scaling_group(
@@ -420,9 +500,9 @@ def is_elb_match_asg(asg, asgs_dict, elb, elb_clients, desired_capacity, is_alb)
 
 def get_attached_targets(asg, asgs_dict, elb, elb_clients, is_alb):
     if is_alb:
-        return {target["Target"]["Id"]: target["TargetHealth"]["State"] for target in elb_clients[asgs_dict[asg]['region']].describe_target_health(TargetGroupArn=elb)["TargetHealthDescriptions"]}
+        return {target["Target"]["Id"]: target["TargetHealth"]["State"] for target in elb_clients[asgs_dict[asg].region].describe_target_health(TargetGroupArn=elb)["TargetHealthDescriptions"]}
     else:
-        return {instance["InstanceId"]: instance["State"] for instance in elb_clients[asgs_dict[asg]['region']].describe_instance_health(LoadBalancerName=elb)["InstanceStates"]}
+        return {instance["InstanceId"]: instance["State"] for instance in elb_clients[asgs_dict[asg].region].describe_instance_health(LoadBalancerName=elb)["InstanceStates"]}
 
 def is_asg_fit_for_elb_test(asg, asgs_dict, completed_asgs):
     if asg in completed_asgs:
@@ -451,7 +531,7 @@ def wait_for_asg_scale_completion(asg_update_list, completed_asgs, desired_capac
             if not is_asg_fit_for_elb_test(asg, asgs_dict, completed_asgs):
                 print "ASG {} is not fit to be tested\n".format(asg)
                 continue
-            attached_elbs = get_attached_elb_tgs(asg, asg_clients[asgs_dict[asg]['region']], is_alb)
+            attached_elbs = get_attached_elb_tgs(asg, asg_clients[asgs_dict[asg].region], is_alb)
             print "Attached ELBs:\n".format(attached_elbs)
             for elb in attached_elbs:
                 print "ELBs attached to {}".format(asg)
@@ -491,6 +571,206 @@ def get_elbv2_clients(aws_profile):
     return elb_clients
 
 
+def get_ec2_clients(aws_profile):
+    session = boto3.session.Session(profile_name=aws_profile)
+
+    ec2_clients = {
+        'us-east-1': session.client("ec2", region_name="us-east-1"),
+        'eu-west-1': session.client("ec2", region_name="eu-west-1")
+    }
+
+    return ec2_clients
+
+
+class InsufficientCapacity(Exception):
+    def __init__(self, message, asgs):
+        Exception.__init__(self, message)
+        self.asgs = asgs
+
+
+class CapacityChecker(object):
+    """
+    Free On-Demand capacity in one region: the vCPU quotas from Service Quotas minus the
+    vCPUs of the running On-Demand instances. A quota that can't be read isn't checked, and
+    if none of them can, the account's max-instances attribute is used and capacity is
+    counted in instances instead.
+
+    The clients are only used for describe_instance_types, describe_instances,
+    describe_account_attributes and get_service_quota, so stubs can be passed in.
+    """
+    def __init__(self, ec2_client, quotas_client=None):
+        self.ec2_client = ec2_client
+        self.quotas_client = quotas_client
+        self.vcpu_counts = {}
+        self.by_instances = False
+        self.unread_codes = set()
+
+    def vcpus(self, instance_types):
+        missing = sorted(set(instance_types) - set(self.vcpu_counts))
+        for start in range(0, len(missing), 100):
+            res = self.ec2_client.describe_instance_types(InstanceTypes=missing[start:start + 100])
+            for instance_type in res['InstanceTypes']:
+                self.vcpu_counts[instance_type['InstanceType']] = instance_type['VCpuInfo']['DefaultVCpus']
+        return self.vcpu_counts
+
+    @staticmethod
+    def quota_code(instance_type):
+        """
+        Returns the quota code that instance_type counts against, or None for families without a known one
+        """
+        # the letters before the generation number, e.g. "inf" for inf2.xlarge or "u" for u-6tb1.metal
+        family = instance_type[:len(instance_type) - len(instance_type.lstrip("abcdefghijklmnopqrstuvwxyz"))]
+        return FAMILY_VCPU_QUOTAS.get(family)
+
+    def running_instance_types(self):
+        counts = {}
+        paginator = self.ec2_client.get_paginator('describe_instances')
+        for page in paginator.paginate(Filters=[{'Name': 'instance-state-name', 'Values': ['pending', 'running']}]):
+            for reservation in page['Reservations']:
+                for instance in reservation['Instances']:
+                    # Spot instances count against the Spot quotas, not the On-Demand ones
+                    if instance.get('InstanceLifecycle') == 'spot':
+                        continue
+                    counts[instance['InstanceType']] = counts.get(instance['InstanceType'], 0) + 1
+        return counts
+
+    def headroom(self):
+        """
+        Returns {quota code: free vCPUs} for the quotas that could be read, or {'instances': free instances}
+        when none of them could
+        """
+        running = self.running_instance_types()
+        vcpus = self.vcpus(running.keys())
+        used = {}
+        for instance_type, count in running.iteritems():
+            code = self.quota_code(instance_type)
+            if code is not None:
+                used[code] = used.get(code, 0) + count * vcpus.get(instance_type, 0)
+
+        if self.quotas_client is not None:
+            free = {}
+            self.unread_codes = set()
+            for code in sorted(set(FAMILY_VCPU_QUOTAS.values())):
+                try:
+                    quota = self.quotas_client.get_service_quota(ServiceCode='ec2', QuotaCode=code)['Quota']['Value']
+                except Exception as e:
+                    print "Could not read the EC2 vCPU quota {} ({}), its instance families aren't checked".format(code, e)
+                    self.unread_codes.add(code)
+                    continue
+                free[code] = int(quota) - used.get(code, 0)
+            if free:
+                self.by_instances = False
+                return free
+            print "Could not read any EC2 vCPU quota, checking the max-instances limit instead"
+
+        res = self.ec2_client.describe_account_attributes(AttributeNames=['max-instances'])
+        max_instances = int(res['AccountAttributes'][0]['AttributeValues'][0]['AttributeValue'])
+        self.by_instances = True
+        return {'instances': max_instances - sum(running.values())}
+
+    def demand(self, instance_type, count):
+        """
+        Returns (headroom key, amount) that launching count instances of instance_type uses,
+        or None if its quota isn't known or couldn't be read
+        """
+        if self.by_instances:
+            return 'instances', count
+        code = self.quota_code(instance_type)
+        if code is None or code in self.unread_codes:
+            return None
+        return code, count * self.vcpus([instance_type]).get(instance_type, 0)
+
+
+def get_capacity_checkers(aws_profile):
+    session = boto3.session.Session(profile_name=aws_profile)
+
+    capacity_checkers = {
+        'us-east-1': CapacityChecker(session.client("ec2", region_name="us-east-1"), session.client("service-quotas", region_name="us-east-1")),
+        'eu-west-1': CapacityChecker(session.client("ec2", region_name="eu-west-1"), session.client("service-quotas", region_name="eu-west-1"))
+    }
+
+    return capacity_checkers
+
+
+def get_main_instance_type(record):
+    counts = {}
+    for instance in record.instances:
+        if instance.instance_type:
+            counts[instance.instance_type] = counts.get(instance.instance_type, 0) + 1
+    if not counts:
+        return None
+    return max(sorted(counts), key=lambda instance_type: counts[instance_type])
+
+
+def plan_capacity_waves(asg_update_list, asgs_dict, capacity_checkers):
+    """
+    Splits the ASGs into waves whose combined surge fits in the free capacity of their regions,
+    assuming the surge launches the ASG's most common instance type. Returns (waves, ASGs whose
+    surge doesn't fit even on its own), the refused ASGs aren't in any wave.
+    """
+    headroom = {}
+    demands = {}
+    for asg in asg_update_list:
+        demands[asg] = {}
+        if asg not in asgs_dict:
+            continue
+        record = asgs_dict[asg]
+        surge = get_surge_capacity(record)[0] - record.desired_capacity
+        instance_type = get_main_instance_type(record)
+        checker = capacity_checkers.get(record.region)
+        if surge <= 0 or checker is None:
+            continue
+        if instance_type is None:
+            print "{} has no instances to tell its instance type from, its surge of {} isn't checked".format(asg, surge)
+            continue
+        if record.region not in headroom:
+            headroom[record.region] = checker.headroom()
+        demand = checker.demand(instance_type, surge)
+        if demand is None:
+            print "{} runs {} instances, whose On-Demand quota isn't known, its surge of {} isn't checked".format(asg, instance_type, surge)
+            continue
+        key, amount = demand
+        demands[asg][(record.region, key)] = demands[asg].get((record.region, key), 0) + amount
+
+    free = {}
+    for region, region_headroom in headroom.iteritems():
+        for key, amount in region_headroom.iteritems():
+            free[(region, key)] = amount
+
+    needed = {}
+    for demand in demands.itervalues():
+        for key, amount in demand.iteritems():
+            needed[key] = needed.get(key, 0) + amount
+    for (region, key), amount in sorted(needed.iteritems()):
+        unit = "instances" if key == 'instances' else "vCPUs ({})".format(key)
+        print "Surge needs {} {} in {}, {} free".format(amount, unit, region, free.get((region, key), 0))
+    print ""
+
+    refused = [asg for asg in asg_update_list
+               if any(amount > free.get(key, 0) for key, amount in demands[asg].iteritems())]
+
+    waves = []
+    wave_usage = []
+    for asg in asg_update_list:
+        if asg in refused:
+            continue
+        for wave, usage in zip(waves, wave_usage):
+            if all(usage.get(key, 0) + amount <= free[key] for key, amount in demands[asg].iteritems()):
+                break
+        else:
+            wave, usage = [], {}
+            waves.append(wave)
+            wave_usage.append(usage)
+        wave.append(asg)
+        for key, amount in demands[asg].iteritems():
+            usage[key] = usage.get(key, 0) + amount
+    return waves, refused
+
+
+def refusal_message(refused):
+    return "Not enough EC2 capacity to surge {} even on their own".format(", ".join(refused))
+
+
 def get_aws_account_id(aws_profile):
     session = boto3.session.Session(profile_name=aws_profile)
     aws_account_id = session.client("sts", region_name="us-east-1").get_caller_identity().get('Account')
@@ -498,9 +778,73 @@ def get_aws_account_id(aws_profile):
     return aws_account_id
 
 
+# one shared copy of every region, tag, launch spec... (intern() only takes str in Python 2, boto3 returns unicode)
+INTERNED = {}
+
+
+def intern_value(value):
+    return INTERNED.setdefault(value, value)
+
+
+def intern_spec(spec):
+    if spec is None:
+        return None
+    return intern_value(tuple(intern_value(part) for part in spec))
+
+
+class InstanceRecord(object):
+    __slots__ = ('instance_id', 'instance_type', 'availability_zone', 'launch_spec')
+
+    def __init__(self, instance):
+        self.instance_id = instance['InstanceId']
+        self.instance_type = intern_value(instance.get('InstanceType'))
+        self.availability_zone = intern_value(instance.get('AvailabilityZone'))
+        self.launch_spec = intern_spec(get_instance_launch_spec(instance))
+
+
+class AsgRecord(object):
+    """
+    What ec2_rotate uses of a describe_auto_scaling_groups entry. Tags are only used by
+    --filter, so they are kept as a frozenset of upper-cased (KEY, VALUE) pairs.
+
+    The loaded fields are the snapshot taken when the ASGs were loaded and aren't changed
+    afterwards. Only rotation is set later, to the RotationState with the sizes worked out
+    for a rotation.
+    """
+    __slots__ = ('name', 'region', 'min_size', 'max_size', 'desired_capacity', 'launch_spec', 'termination_policies',
+                 'instances', 'tags', 'rotation')
+
+    def __init__(self, asg, region):
+        self.name = asg['AutoScalingGroupName']
+        self.region = intern_value(region)
+        self.min_size = asg['MinSize']
+        self.max_size = asg['MaxSize']
+        self.desired_capacity = asg['DesiredCapacity']
+        self.launch_spec = intern_spec(get_launch_spec(asg))
+        self.termination_policies = intern_spec(asg.get('TerminationPolicies') or ['Default'])
+        self.instances = tuple(InstanceRecord(instance) for instance in asg.get('Instances', []))
+        self.tags = intern_value(frozenset((intern_value(tag['Key'].upper()), intern_value(tag['Value'].upper()))
+                                           for tag in asg.get('Tags', [])))
+        self.rotation = None
+
+
+class RotationState(object):
+    """
+    Sizes one rotation moves an ASG between, starting from its loaded sizes
+    """
+    __slots__ = ('old_min_size', 'old_desired_capacity', 'old_max_size',
+                 'new_min_size', 'new_desired_capacity', 'new_max_size', 'stale_instance_count')
+
+    def __init__(self, record):
+        self.old_min_size = self.new_min_size = record.min_size
+        self.old_desired_capacity = self.new_desired_capacity = record.desired_capacity
+        self.old_max_size = self.new_max_size = record.max_size
+        self.stale_instance_count = None
+
+
 def get_asgs(asg_clients):
     """
-    Returns a list of all the ASGs which can be found under the regions in the asg_clients
+    Returns {name: AsgRecord} for all the ASGs which can be found under the regions in the asg_clients
     """
     asgs_dict = {}
 
@@ -514,9 +858,8 @@ def get_asgs(asg_clients):
             asgs += asgs_initial_res['AutoScalingGroups']
         for asg in asgs:
             name = asg['AutoScalingGroupName']
-            asg['region'] = region
             if not asgs_dict.get(name):
-                asgs_dict[name] = asg
+                asgs_dict[name] = AsgRecord(asg, region)
             else:
                 print "Duplicate ASG name detected!"
 
@@ -534,6 +877,93 @@ def get_attached_lbs(asg, client):
     return lbs
 
 
+def get_launch_spec(asg_info):
+    """
+    Returns what the ASG launches new instances from, either ('template', id, version)
+    or ('config', name, None), or None if it can't tell
+    """
+    if asg_info.get('LaunchConfigurationName'):
+        return ('config', asg_info['LaunchConfigurationName'], None)
+    template = asg_info.get('LaunchTemplate') or \
+        asg_info.get('MixedInstancesPolicy', {}).get('LaunchTemplate', {}).get('LaunchTemplateSpecification')
+    if template:
+        return ('template', template.get('LaunchTemplateId') or template.get('LaunchTemplateName'), template.get('Version', '$Default'))
+    return None
+
+
+def get_instance_launch_spec(instance):
+    if instance.get('LaunchConfigurationName'):
+        return ('config', instance['LaunchConfigurationName'], None)
+    template = instance.get('LaunchTemplate')
+    if template:
+        return ('template', template.get('LaunchTemplateId') or template.get('LaunchTemplateName'), template.get('Version'))
+    return None
+
+
+def resolve_template_versions(asg_update_list, asgs_dict, ec2_clients):
+    """
+    Looks up the version numbers behind $Latest and $Default, with one describe_launch_templates
+    call per region (and 200 templates). Returns {(region, template id or name): {'$Latest': '7', '$Default': '5'}}
+    """
+    wanted = {}
+    for asg in asg_update_list:
+        spec = asgs_dict[asg].launch_spec if asg in asgs_dict else None
+        if spec and spec[0] == 'template' and spec[2] in ('$Latest', '$Default'):
+            wanted.setdefault(asgs_dict[asg].region, set()).add(spec[1])
+
+    versions = {}
+    for region, templates in wanted.iteritems():
+        if not ec2_clients or region not in ec2_clients:
+            continue
+        templates = sorted(templates)
+        ids = [template for template in templates if template.startswith('lt-')]
+        names = [template for template in templates if not template.startswith('lt-')]
+        for key, group in (('LaunchTemplateIds', ids), ('LaunchTemplateNames', names)):
+            for start in range(0, len(group), 200):
+                res = ec2_clients[region].describe_launch_templates(**{key: group[start:start + 200]})
+                for template in res['LaunchTemplates']:
+                    resolved = {'$Latest': str(template['LatestVersionNumber']), '$Default': str(template['DefaultVersionNumber'])}
+                    versions[(region, template['LaunchTemplateId'])] = resolved
+                    versions[(region, template['LaunchTemplateName'])] = resolved
+    return versions
+
+
+def get_stale_instances(record, template_versions):
+    """
+    Returns the IDs of the ASG's instances that don't run its current launch template version
+    or launch configuration. If the current one can't be worked out every instance counts as stale.
+    """
+    spec = record.launch_spec
+    if spec and spec[0] == 'template' and spec[2] in ('$Latest', '$Default'):
+        version = template_versions.get((record.region, spec[1]), {}).get(spec[2])
+        spec = (spec[0], spec[1], version) if version else None
+
+    return [instance.instance_id for instance in record.instances
+            if spec is None or instance.launch_spec != spec]
+
+
+def skip_up_to_date_asgs(asg_update_list, asgs_dict, ec2_clients):
+    """
+    Drops the ASGs whose instances are all up to date and records how many instances the others have to replace
+    """
+    template_versions = resolve_template_versions(asg_update_list, asgs_dict, ec2_clients)
+    to_rotate = []
+    for asg in asg_update_list:
+        if asg not in asgs_dict:
+            to_rotate.append(asg)
+            continue
+        stale = get_stale_instances(asgs_dict[asg], template_versions)
+        asgs_dict[asg].rotation = RotationState(asgs_dict[asg])
+        asgs_dict[asg].rotation.stale_instance_count = len(stale)
+        if stale:
+            to_rotate.append(asg)
+        else:
+            print "{} is already running its current launch template/configuration. Skipping...".format(asg)
+    if len(to_rotate) != len(asg_update_list):
+        print ""
+    return to_rotate
+
+
 def create_tag_filters_list(filters):
     """
     Takes in the passed --tag filters list and returns a list of dicts with tag keys and values
@@ -579,25 +1009,279 @@ def filter_asgs(asgs_dict, tag_filters_list):
 
              The tag_filters_list can contain any number of dictionaries with any numbers of tag-key:tag-val pairs
     """
-    filtered_asgs = []
+    filter_sets = [frozenset(tag_filters.iteritems()) for tag_filters in tag_filters_list]
+
+    return [asg for asg, record in asgs_dict.iteritems()
+            if any(filter_set <= record.tags for filter_set in filter_sets)]
 
-    for asg, asg_info in asgs_dict.iteritems():
-        if asg in filtered_asgs:
+
+class CronWindow(object):
+    """
+    Maintenance window opening at the times matched by a 5 field cron expression
+    (minute hour day-of-month month day-of-week, with *, lists, ranges and /steps)
+    and staying open for duration minutes.
+
+    concurrency is how many ASGs are rotated at once, surge how many extra instances
+    may be running at once across them, and batch_minutes how long a batch is expected
+    to take. A batch is only started if it can finish before the window closes.
+    """
+    FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, name, cron, duration, concurrency=1, surge=None, batch_minutes=None):
+        self.name = name
+        self.cron = cron
+        self.duration = int(duration)
+        self.concurrency = int(concurrency)
+        self.surge = surge
+        self.batch_minutes = batch_minutes
+        fields = cron.split()
+        if len(fields) != 5:
+            raise ValueError("Cron expression needs 5 fields: {}".format(cron))
+        self.minutes, self.hours, self.days, self.months, self.weekdays = [
+            self._parse_field(field, low, high) for field, (low, high) in zip(fields, self.FIELD_RANGES)]
+        # Sunday is both 0 and 7
+        if 7 in self.weekdays:
+            self.weekdays.add(0)
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    @staticmethod
+    def _parse_field(field, low, high):
+        values = set()
+        for part in field.split(","):
+            part, _, step = part.partition("/")
+            if part == '*':
+                start, end = low, high
+            elif "-" in part:
+                start, end = [int(value) for value in part.split("-")]
+            else:
+                start = end = int(part)
+                if step:
+                    end = high
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def _day_matches(self, t):
+        day = t.day in self.days
+        weekday = (t.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        # like cron, a day matches if either the day of month or the day of week does
+        return day or weekday
+
+    def matches(self, t):
+        return t.minute in self.minutes and t.hour in self.hours and t.month in self.months and self._day_matches(t)
+
+    def closes_at(self, now):
+        """
+        Returns when the window open at now closes, or None if it isn't open
+        """
+        minute = now.replace(second=0, microsecond=0)
+        for back in range(self.duration):
+            start = minute - timedelta(minutes=back)
+            if self.matches(start):
+                return start + timedelta(minutes=self.duration)
+        return None
+
+    def next_start(self, now):
+        day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        for _ in range(366 * 4):
+            if day.month in self.months and self._day_matches(day):
+                for hour in sorted(self.hours):
+                    for minute in sorted(self.minutes):
+                        start = day.replace(hour=hour, minute=minute)
+                        if start > now:
+                            return start
+            day += timedelta(days=1)
+        return None
+
+
+def load_schedule(schedule_file):
+    """
+    Reads a schedule file:
+
+        {
+            "windows": {
+                "weeknights": {"cron": "0 2 * * 1-5", "duration": 180, "concurrency": 4, "surge": 200}
+            },
+            "jobs": [
+                {"id": "gateway-us", "window": "weeknights", "filters": ["traderev:application==gateway,traderev:region==us"]},
+                {"id": "tr-api", "window": "weeknights", "asgs": ["tr-api-us", "tr-api-eu"]}
+            ]
+        }
+
+    Jobs are run in the order they are listed.
+    """
+    with open(schedule_file) as f:
+        schedule = json.load(f)
+
+    windows = {}
+    for name, window in schedule['windows'].iteritems():
+        windows[name] = CronWindow(name, window['cron'], window['duration'], window.get('concurrency', 1),
+                                   window.get('surge'), window.get('batch_minutes'))
+    jobs = schedule['jobs']
+    for job in jobs:
+        if job.get('window') not in windows:
+            print "Job {} uses unknown window {}".format(job.get('id'), job.get('window'))
+            exit(1)
+        job['tag_filters_list'] = create_tag_filters_list(job.get('filters', []))
+    return windows, jobs
+
+
+def load_checkpoint(checkpoint_file):
+    """
+    Returns {job id: {'status': 'pending' or 'done', 'completed': [ASG, ...], 'blocked': [ASG, ...]}}
+    """
+    if not os.path.exists(checkpoint_file):
+        return {}
+    with open(checkpoint_file) as f:
+        return json.load(f)
+
+
+def save_checkpoint(checkpoint_file, checkpoint):
+    if IS_DRY_RUN:
+        return
+    tmp_file = checkpoint_file + ".tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(checkpoint, f, indent=2, sort_keys=True)
+    os.rename(tmp_file, checkpoint_file)
+
+
+def get_job_asgs(job, asgs_dict):
+    asgs = list(job.get('asgs', []))
+    if job['tag_filters_list']:
+        asgs += filter_asgs(asgs_dict, job['tag_filters_list'])
+    return sorted(set(asgs))
+
+
+def plan_batches(asg_update_list, asgs_dict, concurrency, surge_limit):
+    """
+    Splits the ASGs into batches of at most concurrency ASGs whose combined surge
+    stays within surge_limit. Returns (batches, ASGs whose surge alone is over the limit).
+    """
+    batches = []
+    blocked = []
+    batch = []
+    batch_surge = 0
+    for asg in asg_update_list:
+        surge = 0
+        if asg in asgs_dict:
+            surge = get_surge_capacity(asgs_dict[asg])[0] - asgs_dict[asg].desired_capacity
+        if surge_limit is not None and surge > surge_limit:
+            blocked.append(asg)
             continue
-        asg_tags = asg_info['Tags']
-        asg_tags_dict = {}
-        for tag in asg_tags:
-            asg_tags_dict[tag['Key'].upper()] = tag['Value'].upper()
-
-        for tag_filters in tag_filters_list:
-            matches = True
-            for tag_filter_key, tag_filter_val in tag_filters.iteritems():
-                matches = matches and asg_tags_dict.get(tag_filter_key) == tag_filter_val
-            if matches:
-                filtered_asgs.append(asg)
-                break
+        if batch and (len(batch) >= concurrency or (surge_limit is not None and batch_surge + surge > surge_limit)):
+            batches.append(batch)
+            batch = []
+            batch_surge = 0
+        batch.append(asg)
+        batch_surge += surge
+    if batch:
+        batches.append(batch)
+    return batches, blocked
+
+
+def run_window(window, closes, jobs, checkpoint, checkpoint_file, asg_clients, elb_clients, ec2_clients, initial_sleep_time, is_alb, scaler, capacity_checkers=None):
+    """
+    Rotates the jobs' remaining ASGs in batches until they are done or the next batch wouldn't fit before the window closes
+    """
+    print colored("Window {} is open until {}".format(window.name, closes), "blue", "on_white", attrs=["bold"])
+    asgs_dict = get_asgs(asg_clients)
+
+    owners = {}
+    for job in jobs:
+        state = checkpoint.setdefault(job['id'], {'status': 'pending', 'completed': [], 'blocked': []})
+        for asg in get_job_asgs(job, asgs_dict):
+            if asg not in state['completed'] and asg not in owners:
+                owners[asg] = job['id']
+    queue = [asg for job in jobs for asg in get_job_asgs(job, asgs_dict) if owners.get(asg) == job['id']]
+
+    def mark_completed(asgs):
+        for asg in asgs:
+            checkpoint[owners[asg]]['completed'].append(asg)
+        save_checkpoint(checkpoint_file, checkpoint)
+
+    if not ROTATE_UP_TO_DATE:
+        to_rotate = skip_up_to_date_asgs(queue, asgs_dict, ec2_clients)
+        mark_completed([asg for asg in queue if asg not in to_rotate])
+        queue = to_rotate
+
+    batches, blocked = plan_batches(queue, asgs_dict, window.concurrency, window.surge)
+    for asg in blocked:
+        print "{} needs more than the window's surge limit of {} instances, it won't be rotated".format(asg, window.surge)
+        if asg not in checkpoint[owners[asg]]['blocked']:
+            checkpoint[owners[asg]]['blocked'].append(asg)
+    save_checkpoint(checkpoint_file, checkpoint)
+
+    batch_minutes = window.batch_minutes or int(initial_sleep_time) + 15
+    while batches:
+        if datetime.now() + timedelta(minutes=batch_minutes) > closes:
+            remaining = sum(len(later) for later in batches)
+            print "Not enough time left in window {} for another batch, postponing {} ASGs\n".format(window.name, remaining)
+            break
+        batch = batches.pop(0)
+        if capacity_checkers:
+            # a batch that doesn't fit in the quotas is split into waves, the later ones go back
+            # in the queue so the time left is checked again before each of them
+            waves, refused = plan_capacity_waves(batch, asgs_dict, capacity_checkers)
+            if refused:
+                print "{}, they won't be rotated\n".format(refusal_message(refused))
+                for asg in refused:
+                    if asg not in checkpoint[owners[asg]]['blocked']:
+                        checkpoint[owners[asg]]['blocked'].append(asg)
+                save_checkpoint(checkpoint_file, checkpoint)
+            if not waves:
+                continue
+            batch = waves[0]
+            batches[:0] = waves[1:]
+        run_rolling_update(batch, asgs_dict, asg_clients, elb_clients, initial_sleep_time, is_alb, scaler, ec2_clients,
+                           check_up_to_date=False)
+        mark_completed(batch)
 
-    return filtered_asgs
+    for job in jobs:
+        state = checkpoint[job['id']]
+        if not [asg for asg, owner in owners.iteritems() if owner == job['id'] and asg not in state['completed'] + state['blocked']]:
+            state['status'] = 'done'
+    save_checkpoint(checkpoint_file, checkpoint)
+
+
+def run_scheduler(schedule_file, checkpoint_file, asg_clients, elb_clients, ec2_clients, initial_sleep_time, is_alb, scaler, capacity_checkers=None):
+    """
+    Runs the jobs of the schedule file within their windows. Finished ASGs are recorded
+    in checkpoint_file, so a restarted scheduler (or the next window) carries on where
+    the last one stopped. A batch that has started always runs to the end.
+    """
+    windows, jobs = load_schedule(schedule_file)
+    checkpoint = load_checkpoint(checkpoint_file)
+    # {window name: close time} of the windows already worked through
+    finished_windows = {}
+
+    while True:
+        pending = [job for job in jobs if checkpoint.get(job['id'], {}).get('status') != 'done']
+        if not pending:
+            print colored("All scheduled jobs are done!", "green", "on_white", attrs=["bold"])
+            return
+
+        now = datetime.now()
+        ran = False
+        for name in sorted(set(job['window'] for job in pending)):
+            closes = windows[name].closes_at(now)
+            if closes and finished_windows.get(name) != closes:
+                finished_windows[name] = closes
+                run_window(windows[name], closes, [job for job in pending if job['window'] == name], checkpoint,
+                           checkpoint_file, asg_clients, elb_clients, ec2_clients, initial_sleep_time, is_alb, scaler, capacity_checkers)
+                ran = True
+        if ran:
+            continue
+
+        starts = [(windows[job['window']].next_start(now), job['window']) for job in pending]
+        starts = [start for start in starts if start[0]]
+        if not starts:
+            print "None of the pending jobs' windows will ever open!"
+            return
+        next_start, name = min(starts)
+        print "...{} job(s) pending, window {} opens at {}...\n".format(len(pending), name, next_start)
+        time.sleep(max(1, min(SCHEDULER_MAX_SLEEP_SECONDS, (next_start - datetime.now()).total_seconds())))
 
 
 def print_help():
@@ -623,6 +1307,13 @@ if __name__ == "__main__":
     parser.add_argument('--scale-up', action='store_true', dest='scale_up_only', default=False)
     parser.add_argument('--desired-capacity', action='store', dest='desired_capacity', default=0)
     parser.add_argument('--scaler', type=int, action='store', dest='scaler', default=10)
+    parser.add_argument('--schedule', action='store', dest='schedule_file', default=None,
+                        help="Run the jobs in this schedule file within their maintenance windows")
+    parser.add_argument('--checkpoint', action='store', dest='checkpoint_file', default="ec2_rotate_checkpoint.json")
+    parser.add_argument('--skip-capacity-check', action='store_true', dest='skip_capacity_check', default=False,
+                        help="Don't check the surge against the EC2 vCPU quotas before scaling up")
+    parser.add_argument('--force', action='store_true', dest='force', default=False,
+                        help="Rotate ASGs even if all their instances run the current launch template/configuration")
 
     args = parser.parse_args()
 
@@ -634,6 +1325,7 @@ if __name__ == "__main__":
     DESIRED_CAPACITY = int(args.desired_capacity)
     IS_ALB = args.is_alb
     SCALER = args.scaler
+    ROTATE_UP_TO_DATE = args.force
 
     aws_account_id = get_aws_account_id(args.aws_profile)
 
@@ -642,6 +1334,15 @@ if __name__ == "__main__":
     asg_clients = get_asg_clients(args.aws_profile)
     elb_clients = get_elb_clients(args.aws_profile)
     elbv2_clients = get_elbv2_clients(args.aws_profile)
+    ec2_clients = get_ec2_clients(args.aws_profile)
+    capacity_checkers = None if args.skip_capacity_check else get_capacity_checkers(args.aws_profile)
+
+    # SCHEDULER MODE
+    if args.schedule_file:
+        run_scheduler(args.schedule_file, args.checkpoint_file, asg_clients, elbv2_clients if IS_ALB else elb_clients,
+                      ec2_clients, MINUTES_TO_SLEEP, IS_ALB, SCALER, capacity_checkers)
+        exit(0)
+
     asgs_dict = get_asgs(asg_clients)
 
     # NON-INTERACTIVE MODE:
@@ -673,10 +1374,14 @@ if __name__ == "__main__":
             else:
                 run_rolling_update_worker_node(asg_update_list, asgs_dict, asg_clients, elb_clients, IS_ALB)
         else:
-            if IS_ALB:
-                run_rolling_update(asg_update_list, asgs_dict, asg_clients, elbv2_clients, MINUTES_TO_SLEEP, IS_ALB, SCALER)
-            else:
-                run_rolling_update(asg_update_list, asgs_dict, asg_clients, elb_clients, MINUTES_TO_SLEEP, IS_ALB, SCALER)
+            try:
+                if IS_ALB:
+                    run_rolling_update(asg_update_list, asgs_dict, asg_clients, elbv2_clients, MINUTES_TO_SLEEP, IS_ALB, SCALER, ec2_clients, capacity_checkers)
+                else:
+                    run_rolling_update(asg_update_list, asgs_dict, asg_clients, elb_clients, MINUTES_TO_SLEEP, IS_ALB, SCALER, ec2_clients, capacity_checkers)
+            except InsufficientCapacity as e:
+                print colored("{}, nothing was changed".format(e), "red", "on_white", attrs=["bold"])
+                exit(1)
 
     # INTERACTIVE MODE
     else:
@@ -727,7 +1432,10 @@ if __name__ == "__main__":
                         else:
                             run_rolling_update_worker_node(asg_update_list, asgs_dict, asg_clients, elb_clients, IS_ALB)
                     else:
-                        run_rolling_update(asg_update_list, asgs_dict, asg_clients, elb_clients, MINUTES_TO_SLEEP, IS_ALB, SCALER)
+                        try:
+                            run_rolling_update(asg_update_list, asgs_dict, asg_clients, elb_clients, MINUTES_TO_SLEEP, IS_ALB, SCALER, ec2_clients, capacity_checkers)
+                        except InsufficientCapacity as e:
+                            print colored("{}, nothing was changed".format(e), "red", "on_white", attrs=["bold"])
                 continue
             elif user_input == "exit":
                 exit(0)
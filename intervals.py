@@ -0,0 +1,199 @@
+"""
+Set operations on time windows.
+
+    python intervals.py --benchmark 1000 4000
+
+Intervals are (start, end) pairs, treated as half-open [start, end), so
+(9.0, 11.0) and (11.0, 13.0) touch but don't overlap. Sets of intervals can
+be any iterable, e.g. {(9.0, 11.0), (13.0, 15.0)}.
+
+union/intersection/difference/free_slots sort their inputs once and then walk
+them together, O((n + m) log(n + m)). overlaps() pairs up the individual
+intervals that overlap using an IntervalTree built over one side,
+O(m log n + k) for k pairs. The naive_* versions compare every pair and are
+only kept for the benchmark.
+"""
+import argparse
+import random
+import time
+
+
+def normalize(intervals):
+    """
+    Sorted list of the intervals with overlapping and touching ones merged and empty ones dropped
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def union(a, b):
+    return normalize(list(a) + list(b))
+
+
+def intersection(a, b):
+    a = normalize(a)
+    b = normalize(b)
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start = max(a[i][0], b[j][0])
+        end = min(a[i][1], b[j][1])
+        if start < end:
+            result.append((start, end))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def difference(a, b):
+    """
+    The parts of a not covered by b
+    """
+    b = normalize(b)
+    result = []
+    j = 0
+    for start, end in normalize(a):
+        # skip the b intervals that end before this one starts
+        while j < len(b) and b[j][1] <= start:
+            j += 1
+        k = j
+        while k < len(b) and b[k][0] < end:
+            if b[k][0] > start:
+                result.append((start, b[k][0]))
+            start = max(start, b[k][1])
+            k += 1
+        if start < end:
+            result.append((start, end))
+    return result
+
+
+def free_slots(calendars, start, end, min_length=0):
+    """
+    The gaps between start and end that no calendar has booked, at least min_length long
+    """
+    busy = [interval for calendar in calendars for interval in calendar]
+    return [(s, e) for s, e in difference([(start, end)], busy) if e - s >= min_length]
+
+
+class IntervalTree(object):
+    """
+    Static interval tree: the intervals sorted by start form an implicit balanced
+    binary tree (the middle of every range is its root), and each root keeps the
+    largest end in its range so whole subtrees can be skipped.
+    """
+    def __init__(self, intervals):
+        self.intervals = sorted(intervals)
+        self.starts = [start for start, end in self.intervals]
+        self.max_end = [end for start, end in self.intervals]
+        self._build(0, len(self.intervals))
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def _build(self, lo, hi):
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        for child in (self._build(lo, mid), self._build(mid + 1, hi)):
+            if child is not None and child > self.max_end[mid]:
+                self.max_end[mid] = child
+        return self.max_end[mid]
+
+    def _search(self, start, end, closed):
+        result = []
+        stack = [(0, len(self.intervals))]
+        while stack:
+            lo, hi = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            if self.max_end[mid] <= start:
+                # nothing in this subtree ends after start
+                continue
+            stack.append((lo, mid))
+            interval_start, interval_end = self.intervals[mid]
+            if interval_start < end or (closed and interval_start == end):
+                if interval_end > start:
+                    result.append(self.intervals[mid])
+                stack.append((mid + 1, hi))
+        result.sort()
+        return result
+
+    def overlapping(self, start, end):
+        """
+        The intervals that overlap [start, end), sorted
+        """
+        return self._search(start, end, False)
+
+    def containing(self, point):
+        return self._search(point, point, True)
+
+
+def overlaps(a, b):
+    """
+    Every (interval of a, interval of b) pair that overlaps
+    """
+    tree = IntervalTree(interval for interval in b if interval[1] > interval[0])
+    return [(interval, other) for interval in sorted(a) if interval[1] > interval[0]
+            for other in tree.overlapping(*interval)]
+
+
+def naive_overlaps(a, b):
+    return [(x, y) for x in sorted(a) for y in sorted(b)
+            if x[0] < y[1] and y[0] < x[1] and x[1] > x[0] and y[1] > y[0]]
+
+
+def naive_intersection(a, b):
+    pieces = [(max(x[0], y[0]), min(x[1], y[1])) for x in a for y in b]
+    return normalize(piece for piece in pieces if piece[0] < piece[1])
+
+
+def random_calendar(n, span, max_length, rng):
+    calendar = set()
+    for _ in range(n):
+        start = round(rng.uniform(0, span), 2)
+        calendar.add((start, round(start + rng.uniform(0.01, max_length), 2)))
+    return calendar
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def benchmark(n, span=24.0 * 365, max_length=4.0, seed=0):
+    rng = random.Random(seed)
+    a = random_calendar(n, span, max_length, rng)
+    b = random_calendar(n, span, max_length, rng)
+    for name, fast, naive in (("overlaps", overlaps, naive_overlaps),
+                              ("intersection", intersection, naive_intersection)):
+        fast_result, fast_time = timed(fast, a, b)
+        naive_result, naive_time = timed(naive, a, b)
+        assert fast_result == naive_result, name
+        print("%-13s n=%-7d %8.4fs  naive %8.4fs  (%.0fx, %d results)" % (
+            name, n, fast_time, naive_time, naive_time / max(fast_time, 1e-9), len(fast_result)))
+    for name, function in (("difference", difference), ("union", union)):
+        result, elapsed = timed(function, a, b)
+        print("%-13s n=%-7d %8.4fs  (%d results)" % (name, n, elapsed, len(result)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--benchmark', type=int, nargs='+', dest='sizes', default=[100, 1000, 4000],
+                        help="Calendar sizes to compare against the naive pairwise versions")
+
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        benchmark(size)
@@ -1,25 +1,16 @@
+from intervals import difference, free_slots, intersection, overlaps
+
 a = {(9.0, 11.0), (13.0, 15.0)}
 b = {(9.0, 9.15), (10.0, 10.15), (12.30, 16.0)}
 
 print(len(a))
 print(len(b))
 
-if len(a) > 1:
-	print("Big one A")
-	if len(b) > 1:
-		print("Big one B")
-else:
-	print("Little one")
-
-
-
-#a_start = all first elements in a
-#a_ends = all second elememts in a
-
-#comparisosns
-
-#b_starts = all first elements in b
-#b_ends = all second elements in b
+#windows in a that clash with one in b
+for x, y in overlaps(a, b):
+	print("{} overlaps {}".format(x, y))
 
-#for 
-#Logic
\ No newline at end of file
+print("Both busy: {}".format(intersection(a, b)))
+print("Only a busy: {}".format(difference(a, b)))
+print("Only b busy: {}".format(difference(b, a)))
+print("Both free between 8 and 18: {}".format(free_slots([a, b], 8.0, 18.0)))
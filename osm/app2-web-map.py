@@ -1,31 +1,14 @@
 import folium
 import pandas
+from layers import population_layer, volcano_layer
 
 data = pandas.read_csv("Volcanoes.txt")
-lat = list(data["LAT"])
-lon = list(data["LON"])
-elev = list(data["ELEV"])
 
-def color_producer(elevation):
-    if elevation < 1000:
-        return 'green'
-    elif 1000 <= elevation < 3000:
-        return 'orange'
-    else:
-        return 'red'
 map = folium.Map(location=[38.58, -99.09], zoom_start=6, tiles="Mapbox Bright")
 
-fgv = folium.FeatureGroup(name="Volcanoes")
+fgv = volcano_layer(data, name="Volcanoes", cluster=len(data) > 10000)
 
-for lt, ln, el in zip(lat, lon, elev):
-    fgv.add_child(folium.CircleMarker(location=[lt, ln], radius = 6, popup=str(el)+" m",
-    fill_color=color_producer(el), fill=True,  color = 'grey', fill_opacity=0.7))
-
-fgp = folium.FeatureGroup(name="Population")
-
-fgp.add_child(folium.GeoJson(data=open('world.json', 'r', encoding='utf-8-sig').read(),
-style_function=lambda x: {'fillColor':'green' if x['properties']['POP2005'] < 10000000
-else 'orange' if 10000000 <= x['properties']['POP2005'] < 20000000 else 'red'}))
+fgp = population_layer("world.json", name="Population")
 
 map.add_child(fgv)
 map.add_child(fgp)
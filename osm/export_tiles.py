@@ -0,0 +1,204 @@
+"""
+Exports the volcano and population layers as static, lazily loaded files.
+
+    python export_tiles.py --out map_tiles
+    cd map_tiles && python -m http.server       # then open http://localhost:8000/
+
+Instead of embedding every point and polygon in Map1.html, this writes:
+
+    volcanoes/{z}/{x}/{y}.json   points split into web mercator tiles at --tile-zoom
+    volcanoes/overview/{z}.json  one point per grid cell with a count, for zooms below it
+    countries/{level}.json       the population layer simplified for each zoom band
+    index.html                   a thin Leaflet page that fetches only what is in view
+
+Browsers don't allow fetch() from file:// pages, so the folder has to be served.
+"""
+import argparse
+import json
+import math
+import os
+
+import numpy
+import pandas
+
+from layers import ELEVATION_COLORS, elevation_color_codes, round_elevations
+from population import preprocess
+
+# (min zoom, simplification tolerance in degrees) for each countries/{level}.json
+COUNTRY_LEVELS = [(0, 0.5), (3, 0.1), (5, 0.02), (8, 0.0)]
+
+
+def tile_xy(lat, lon, zoom):
+    """
+    Vectorized web mercator tile coordinates for arrays of lat/lon
+    """
+    n = 2 ** zoom
+    lat = numpy.clip(lat, -85.0511, 85.0511)
+    x = numpy.floor((lon + 180.0) / 360.0 * n).astype(int)
+    lat_rad = numpy.radians(lat)
+    y = numpy.floor((1.0 - numpy.log(numpy.tan(lat_rad) + 1.0 / numpy.cos(lat_rad)) / math.pi) / 2.0 * n).astype(int)
+    return numpy.clip(x, 0, n - 1), numpy.clip(y, 0, n - 1)
+
+
+def write_json(path, data):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+
+
+def export_volcanoes(data, out_dir, tile_zoom, precision=5):
+    """
+    Writes [lat, lon, color index, elevation] rows per tile, plus per-zoom overviews
+    """
+    table = pandas.DataFrame({
+        'lat': numpy.round(data["LAT"].to_numpy(dtype=float), precision),
+        'lon': numpy.round(data["LON"].to_numpy(dtype=float), precision),
+        'color': elevation_color_codes(data["ELEV"]),
+        'elev': data["ELEV"].to_numpy(dtype=float)
+    })
+
+    table['x'], table['y'] = tile_xy(table['lat'].to_numpy(), table['lon'].to_numpy(), tile_zoom)
+    for (x, y), tile in table.groupby(['x', 'y']):
+        rows = round_elevations(tile[['lat', 'lon', 'color', 'elev']].to_numpy().tolist())
+        write_json(os.path.join(out_dir, "volcanoes", str(tile_zoom), str(x), "%d.json" % y), rows)
+
+    # Below tile_zoom, points sharing a tile at that zoom are merged into their
+    # centroid, colored by the highest elevation and labelled with the count
+    for zoom in range(tile_zoom):
+        x, y = tile_xy(table['lat'].to_numpy(), table['lon'].to_numpy(), zoom + 2)
+        grouped = table.assign(x=x, y=y).groupby(['x', 'y']).agg(
+            lat=('lat', 'mean'), lon=('lon', 'mean'), elev=('elev', 'max'), count=('elev', 'size'))
+        grouped['color'] = elevation_color_codes(grouped['elev'])
+        rows = round_elevations(grouped[['lat', 'lon', 'color', 'elev', 'count']].round(precision).to_numpy().tolist())
+        write_json(os.path.join(out_dir, "volcanoes", "overview", "%d.json" % zoom), rows)
+
+
+def export_countries(world, out_dir, precision=4):
+    for level, (min_zoom, tolerance) in enumerate(COUNTRY_LEVELS):
+        styled = preprocess(world, tolerance, precision)
+        write_json(os.path.join(out_dir, "countries", "%d.json" % level), styled)
+
+
+HTML_SHELL = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css"/>
+<script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+<style>html, body, #map {height: 100%%; margin: 0;}</style>
+</head>
+<body>
+<div id="map"></div>
+<script>
+var TILE_ZOOM = %(tile_zoom)d;
+var COLORS = %(colors)s;
+var COUNTRY_LEVELS = %(country_levels)s;
+
+var map = L.map('map', {preferCanvas: true}).setView([38.58, -99.09], 6);
+L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
+    attribution: '&copy; OpenStreetMap contributors'
+}).addTo(map);
+
+var volcanoes = L.featureGroup().addTo(map);
+var population = L.geoJson(null, {
+    style: function(feature) { return {fillColor: feature.properties.fill}; }
+}).addTo(map);
+L.control.layers(null, {"Volcanoes": volcanoes, "Population": population}).addTo(map);
+
+var cache = {};
+function load(url) {
+    if (!cache[url]) {
+        cache[url] = fetch(url).then(function(res) { return res.ok ? res.json() : null; });
+    }
+    return cache[url];
+}
+
+function marker(row) {
+    var elev = (row[3] === null ? "?" : row[3]) + " m";
+    var label = row.length > 4 && row[4] > 1 ? row[4] + " volcanoes, highest " + elev : elev;
+    return L.circleMarker([row[0], row[1]], {
+        radius: row.length > 4 ? Math.min(6 + Math.log(row[4]) * 2, 16) : 6,
+        color: 'grey', fill: true, fillColor: COLORS[row[2]], fillOpacity: 0.7
+    }).bindPopup(label);
+}
+
+var shown = "";
+function showVolcanoes() {
+    var zoom = map.getZoom();
+    var urls = [];
+    if (zoom < TILE_ZOOM) {
+        urls.push("volcanoes/overview/" + zoom + ".json");
+    } else {
+        var bounds = map.getPixelBounds();
+        var scale = Math.pow(2, TILE_ZOOM - zoom) / 256;
+        var n = Math.pow(2, TILE_ZOOM);
+        for (var x = Math.floor(bounds.min.x * scale); x <= Math.floor(bounds.max.x * scale); x++) {
+            for (var y = Math.max(0, Math.floor(bounds.min.y * scale)); y <= Math.min(n - 1, Math.floor(bounds.max.y * scale)); y++) {
+                urls.push("volcanoes/" + TILE_ZOOM + "/" + (((x %% n) + n) %% n) + "/" + y + ".json");
+            }
+        }
+    }
+    var key = urls.join();
+    if (key === shown) return;
+    shown = key;
+    Promise.all(urls.map(load)).then(function(tiles) {
+        if (key !== shown) return;
+        volcanoes.clearLayers();
+        tiles.forEach(function(rows) { (rows || []).forEach(function(row) { volcanoes.addLayer(marker(row)); }); });
+    });
+}
+
+var countryLevel = -1;
+function showCountries() {
+    var zoom = map.getZoom(), level = 0;
+    for (var i = 0; i < COUNTRY_LEVELS.length; i++) {
+        if (zoom >= COUNTRY_LEVELS[i]) level = i;
+    }
+    if (level === countryLevel) return;
+    countryLevel = level;
+    load("countries/" + level + ".json").then(function(data) {
+        if (level !== countryLevel || !data) return;
+        population.clearLayers();
+        population.addData(data);
+    });
+}
+
+map.on('moveend', function() { showVolcanoes(); showCountries(); });
+showVolcanoes();
+showCountries();
+</script>
+</body>
+</html>
+"""
+
+
+def export(volcanoes_file, world_file, out_dir, tile_zoom):
+    data = pandas.read_csv(volcanoes_file)
+    export_volcanoes(data, out_dir, tile_zoom)
+
+    with open(world_file, encoding="utf-8-sig") as f:
+        world = json.load(f)
+    export_countries(world, out_dir)
+
+    with open(os.path.join(out_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(HTML_SHELL % {
+            'tile_zoom': tile_zoom,
+            'colors': json.dumps(ELEVATION_COLORS),
+            'country_levels': json.dumps([min_zoom for min_zoom, tolerance in COUNTRY_LEVELS])
+        })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--volcanoes', action='store', dest='volcanoes_file', default="Volcanoes.txt")
+    parser.add_argument('--world', action='store', dest='world_file', default="world.json")
+    parser.add_argument('--out', action='store', dest='out_dir', default="map_tiles")
+    parser.add_argument('--tile-zoom', type=int, action='store', dest='tile_zoom', default=6,
+                        help="Zoom level the volcano points are split into tiles at")
+
+    args = parser.parse_args()
+
+    export(args.volcanoes_file, args.world_file, args.out_dir, args.tile_zoom)
+    print("Wrote %s, serve it with: cd %s && python -m http.server" % (args.out_dir, args.out_dir))
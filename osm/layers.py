@@ -0,0 +1,144 @@
+import json
+import math
+
+import numpy
+import pandas
+from folium.map import Layer
+from folium.plugins import FastMarkerCluster
+from jinja2 import Template
+
+from population import cached_population
+
+# color based on elevation: < 1000 green, 1000 - 3000 orange, >= 3000 red (and unknown)
+ELEVATION_BINS = [-numpy.inf, 1000, 3000, numpy.inf]
+ELEVATION_COLORS = ['green', 'orange', 'red']
+
+
+def elevation_color_codes(elevations):
+    """
+    Returns an array of indexes into ELEVATION_COLORS, one per elevation. Missing
+    elevations get the last color, as color_producer's else branch gave them.
+    """
+    codes = numpy.array(pandas.cut(elevations, bins=ELEVATION_BINS, labels=False, right=False), dtype=float)
+    codes[numpy.isnan(codes)] = len(ELEVATION_COLORS) - 1
+    return codes.astype(numpy.int8)
+
+
+def round_elevations(rows, column=3):
+    """
+    Replaces the elevations in rows with whole metres, or None where they are missing
+    """
+    for row in rows:
+        value = row[column]
+        row[column] = int(round(value)) if math.isfinite(value) else None
+    return rows
+
+
+def marker_rows(data, precision=5):
+    """
+    Packs the volcano table into compact [lat, lon, color index, elevation] rows
+    """
+    rows = numpy.column_stack([
+        numpy.round(data["LAT"].to_numpy(dtype=float), precision),
+        numpy.round(data["LON"].to_numpy(dtype=float), precision),
+        elevation_color_codes(data["ELEV"]),
+        data["ELEV"].to_numpy(dtype=float)
+    ])
+    return round_elevations(rows.tolist())
+
+
+class CircleMarkerLayer(Layer):
+    """
+    Draws every row as a circle marker from one JSON array on a canvas renderer,
+    instead of emitting a folium.CircleMarker (and its own script block) per point.
+    """
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function() {
+                var rows = {{ this.rows|tojson }};
+                var colors = {{ this.colors|tojson }};
+                var renderer = L.canvas();
+                var layer = L.featureGroup();
+                for (var i = 0; i < rows.length; i++) {
+                    var row = rows[i];
+                    L.circleMarker([row[0], row[1]], {
+                        renderer: renderer,
+                        radius: {{ this.radius }},
+                        color: 'grey',
+                        fill: true,
+                        fillColor: colors[row[2]],
+                        fillOpacity: 0.7
+                    }).bindPopup((row[3] === null ? "?" : row[3]) + " m").addTo(layer);
+                }
+                return layer;
+            })();
+            {% if this.show %}
+            {{ this.get_name() }}.addTo({{ this._parent.get_name() }});
+            {% endif %}
+        {% endmacro %}
+        """)
+
+    def __init__(self, rows, colors=ELEVATION_COLORS, radius=6, name=None, overlay=True, control=True, show=True):
+        super(CircleMarkerLayer, self).__init__(name=name, overlay=overlay, control=control, show=show)
+        self._name = 'CircleMarkerLayer'
+        self.rows = rows
+        self.colors = colors
+        self.radius = radius
+
+
+class PrestyledGeoJson(Layer):
+    """
+    GeoJSON layer whose fill color is already stored in each feature's "fill" property,
+    so no Python style_function has to run per feature and no style mapping is embedded.
+    geojson is the already serialized GeoJSON text.
+    """
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.geoJson({{ this.geojson }}, {
+                style: function(feature) {
+                    return {fillColor: feature.properties.fill};
+                }
+            });
+            {% if this.show %}
+            {{ this.get_name() }}.addTo({{ this._parent.get_name() }});
+            {% endif %}
+        {% endmacro %}
+        """)
+
+    def __init__(self, geojson, name=None, overlay=True, control=True, show=True):
+        super(PrestyledGeoJson, self).__init__(name=name, overlay=overlay, control=control, show=show)
+        self._name = 'PrestyledGeoJson'
+        self.geojson = geojson
+
+
+def population_layer(input_file="world.json", name="Population"):
+    """
+    Builds the population layer from the cached, simplified and pre-styled copy of input_file
+    """
+    with open(cached_population(input_file), encoding="utf-8") as f:
+        return PrestyledGeoJson(f.read(), name=name)
+
+
+CLUSTER_CALLBACK = """
+    function (row) {
+        var colors = %s;
+        var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {
+            radius: 6, color: 'grey', fill: true, fillColor: colors[row[2]], fillOpacity: 0.7
+        });
+        marker.bindPopup((row[3] === null ? "?" : row[3]) + " m");
+        return marker;
+    }
+"""
+
+
+def volcano_layer(data, name="Volcanoes", cluster=False):
+    """
+    Builds the volcano layer from the LAT, LON and ELEV columns of data.
+    cluster=True groups nearby points with FastMarkerCluster, which stays
+    responsive with 100k+ points.
+    """
+    rows = marker_rows(data)
+    if cluster:
+        callback = CLUSTER_CALLBACK % json.dumps(ELEVATION_COLORS)
+        return FastMarkerCluster(rows, callback=callback, name=name)
+    return CircleMarkerLayer(rows, name=name)
@@ -1,31 +1,17 @@
 import folium
 import pandas
+from layers import population_layer, volcano_layer
 
 data = pandas.read_csv("Volcanoes.txt")
-lat = list(data["LAT"])
-lon = list(data["LON"])
-name = list(data["NAME"])
-elev = list(data["ELEV"])
-
-# color based on elevation
-def color_producer(elevation):
-    if elevation < 1000:
-        return 'green'
-    elif 1000 <= elevation < 3000:
-        return 'orange'
-    else:
-        return 'red'
 
 map = folium.Map(location=[38.58, -99.09], zoom_start=6, tiles="Mapbox Bright")
 
-fgv = folium.FeatureGroup(name="Volcanoes")
-
-for lt, ln, el in zip(lat, lon, elev):
-    fgv.add_child(folium.CircleMarker(location=[lt, ln], radius=6, popup=folium.Popup(str(el)+" m", parse_html=True), fill_color=color_producer(el), color = 'grey', fill = True, fill_opacity=0.7))
-
-fgp = folium.FeatureGroup(name="Population")
+# colors are binned by elevation for the whole column at once and all the points go
+# into one layer, clustered once there are too many to draw individually
+fgv = volcano_layer(data, name="Volcanoes", cluster=len(data) > 10000)
 
-fgp.add_child(folium.GeoJson(open('world.json', encoding = "utf-8-sig").read(), style_function=lambda x: {'fillColor':'green' if x['properties']['POP2005'] < 10000000 else 'orange' if 10000000 <= x['properties']['POP2005'] < 20000000 else 'red'}))
+# simplified and pre-styled once, then reused from .geojson_cache until world.json changes
+fgp = population_layer("world.json", name="Population")
 
 map.add_child(fgv)
 map.add_child(fgp)
@@ -0,0 +1,165 @@
+"""
+Preprocesses world.json into a small, pre-styled GeoJSON file for the population layer.
+
+    python population.py world.json --tolerance 0.05 --precision 3
+
+Polygons are simplified with Douglas-Peucker, coordinates are rounded, the
+POP2005 fill color is baked into each feature's "fill" property and every other
+property except NAME and POP2005 is dropped. The result is cached in
+.geojson_cache/ under a hash of the input file and the settings, so it is only
+rebuilt when one of them changes.
+"""
+import argparse
+import hashlib
+import json
+import os
+
+# bump when the output format changes so old cache entries are ignored
+CACHE_VERSION = "1"
+CACHE_DIR = ".geojson_cache"
+
+POPULATION_BINS = [10000000, 20000000]
+POPULATION_COLORS = ['green', 'orange', 'red']
+KEPT_PROPERTIES = ['NAME', 'POP2005']
+
+
+def population_color(population):
+    if population < POPULATION_BINS[0]:
+        return POPULATION_COLORS[0]
+    elif population < POPULATION_BINS[1]:
+        return POPULATION_COLORS[1]
+    else:
+        return POPULATION_COLORS[2]
+
+
+def _segment_distance_sq(p, a, b):
+    dx = b[0] - a[0]
+    dy = b[1] - a[1]
+    if dx == 0 and dy == 0:
+        return (p[0] - a[0]) ** 2 + (p[1] - a[1]) ** 2
+    t = ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / float(dx * dx + dy * dy)
+    t = max(0.0, min(1.0, t))
+    x = a[0] + t * dx
+    y = a[1] + t * dy
+    return (p[0] - x) ** 2 + (p[1] - y) ** 2
+
+
+def simplify_line(points, tolerance):
+    """
+    Douglas-Peucker simplification, iterative so long rings don't hit the recursion limit
+    """
+    if len(points) < 3 or tolerance <= 0:
+        return points
+    tolerance_sq = tolerance * tolerance
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        max_dist = 0
+        index = first
+        for i in range(first + 1, last):
+            dist = _segment_distance_sq(points[i], points[first], points[last])
+            if dist > max_dist:
+                max_dist = dist
+                index = i
+        if max_dist > tolerance_sq:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [p for p, k in zip(points, keep) if k]
+
+
+def simplify_ring(ring, tolerance, precision):
+    """
+    Returns the simplified, rounded ring, or None if it collapsed below a triangle
+    """
+    # a closed ring starts and ends on the same point, so split it in two halves
+    # to give Douglas-Peucker two distinct end points
+    middle = len(ring) // 2
+    simplified = simplify_line(ring[:middle + 1], tolerance)[:-1] + simplify_line(ring[middle:], tolerance)
+    rounded = []
+    for x, y in simplified:
+        point = [round(x, precision), round(y, precision)]
+        if not rounded or point != rounded[-1]:
+            rounded.append(point)
+    if len(rounded) < 4:
+        return None
+    return rounded
+
+
+def simplify_polygon(rings, tolerance, precision):
+    outer = simplify_ring(rings[0], tolerance, precision)
+    if outer is None:
+        return None
+    holes = [hole for hole in (simplify_ring(ring, tolerance, precision) for ring in rings[1:]) if hole]
+    return [outer] + holes
+
+
+def simplify_geometry(geometry, tolerance, precision):
+    if geometry['type'] == 'Polygon':
+        polygons = [geometry['coordinates']]
+    else:
+        polygons = geometry['coordinates']
+
+    simplified = [p for p in (simplify_polygon(rings, tolerance, precision) for rings in polygons) if p]
+    if not simplified:
+        # keep tiny countries visible: fall back to the largest polygon, only rounded
+        largest = max(polygons, key=lambda rings: len(rings[0]))
+        simplified = [simplify_polygon(largest, 0, precision) or largest]
+
+    if len(simplified) == 1:
+        return {'type': 'Polygon', 'coordinates': simplified[0]}
+    return {'type': 'MultiPolygon', 'coordinates': simplified}
+
+
+def preprocess(world, tolerance, precision):
+    features = []
+    for feature in world['features']:
+        properties = feature['properties']
+        styled = {key: properties[key] for key in KEPT_PROPERTIES if key in properties}
+        styled['fill'] = population_color(properties['POP2005'])
+        features.append({
+            'type': 'Feature',
+            'properties': styled,
+            'geometry': simplify_geometry(feature['geometry'], tolerance, precision)
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def cached_population(input_file="world.json", tolerance=0.05, precision=3, cache_dir=CACHE_DIR):
+    """
+    Returns the path of the preprocessed GeoJSON for input_file, building it if needed
+    """
+    with open(input_file, "rb") as f:
+        raw = f.read()
+    key = hashlib.sha1(raw)
+    key.update(("|%s|%r|%d" % (CACHE_VERSION, tolerance, precision)).encode("utf-8"))
+    cache_file = os.path.join(cache_dir, "population-%s.json" % key.hexdigest())
+    if os.path.exists(cache_file):
+        return cache_file
+
+    world = json.loads(raw.decode("utf-8-sig"))
+    styled = preprocess(world, tolerance, precision)
+
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    tmp_file = cache_file + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(styled, f, separators=(",", ":"))
+    os.rename(tmp_file, cache_file)
+    return cache_file
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input_file', nargs='?', default="world.json")
+    parser.add_argument('--tolerance', type=float, action='store', dest='tolerance', default=0.05,
+                        help="Simplification tolerance in degrees")
+    parser.add_argument('--precision', type=int, action='store', dest='precision', default=3,
+                        help="Number of decimals kept in the coordinates")
+
+    args = parser.parse_args()
+
+    cache_file = cached_population(args.input_file, args.tolerance, args.precision)
+    print("%s: %d bytes" % (cache_file, os.path.getsize(cache_file)))
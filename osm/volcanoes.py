@@ -0,0 +1,209 @@
+"""
+Columnar volcano table with a grid spatial index.
+
+    python volcanoes.py --bbox 40 -125 50 -110
+    python volcanoes.py --radius 46.2 -122.2 100
+    python volcanoes.py --nearest 46.2 -122.2 -k 5
+    python volcanoes.py --countries
+
+Volcanoes.txt (or Volcanoes_USA.txt) is parsed once into NumPy arrays. The points
+are sorted by the cell of a regular lat/lon grid they fall in, with an offsets array
+per cell, so a query only looks at the cells it overlaps and the exact test runs
+vectorized over those few points.
+"""
+import argparse
+import json
+import math
+
+import numpy
+import pandas
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat, lon, lats, lons):
+    """
+    Great-circle distance from (lat, lon) to each of lats/lons, in km
+    """
+    lat1 = math.radians(lat)
+    lats2 = numpy.radians(lats)
+    dlat = lats2 - lat1
+    dlon = numpy.radians(lons) - math.radians(lon)
+    a = numpy.sin(dlat / 2) ** 2 + math.cos(lat1) * numpy.cos(lats2) * numpy.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))
+
+
+def points_in_ring(lats, lons, ring):
+    """
+    Even-odd ray casting of the points against one GeoJSON ring ([lon, lat] pairs)
+    """
+    ring = numpy.asarray(ring, dtype=float)
+    x1 = ring[:-1, 0]
+    y1 = ring[:-1, 1]
+    x2 = ring[1:, 0]
+    y2 = ring[1:, 1]
+    px = lons[:, None]
+    py = lats[:, None]
+    straddles = (y1 > py) != (y2 > py)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        x_cross = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+    crossings = numpy.count_nonzero(straddles & (px < x_cross), axis=1)
+    return crossings % 2 == 1
+
+
+class VolcanoIndex(object):
+    def __init__(self, data, cell_size=1.0):
+        self.lat = data["LAT"].to_numpy(dtype=float)
+        self.lon = data["LON"].to_numpy(dtype=float)
+        self.elev = data["ELEV"].to_numpy(dtype=float)
+        self.name = data["NAME"].to_numpy(dtype=object)
+        self.cell_size = cell_size
+        self.rows = int(math.ceil(180 / cell_size))
+        self.cols = int(math.ceil(360 / cell_size))
+
+        cells = self._cell(self.lat, self.lon)
+        self.order = numpy.argsort(cells, kind='stable')
+        # offsets[c]:offsets[c + 1] is the slice of self.order that falls in cell c
+        self.offsets = numpy.searchsorted(cells[self.order], numpy.arange(self.rows * self.cols + 1))
+
+    @classmethod
+    def load(cls, filename="Volcanoes.txt", cell_size=1.0):
+        return cls(pandas.read_csv(filename), cell_size)
+
+    def __len__(self):
+        return len(self.lat)
+
+    def _row_col(self, lat, lon):
+        row = numpy.clip(((numpy.asarray(lat) + 90) // self.cell_size).astype(int), 0, self.rows - 1)
+        col = numpy.clip(((numpy.asarray(lon) + 180) // self.cell_size).astype(int), 0, self.cols - 1)
+        return row, col
+
+    def _cell(self, lat, lon):
+        row, col = self._row_col(lat, lon)
+        return row * self.cols + col
+
+    def _candidates(self, south, west, north, east):
+        """
+        Indexes of the points in the grid cells overlapping the box (west <= east)
+        """
+        (row0, col0), (row1, col1) = self._row_col(south, west), self._row_col(north, east)
+        parts = []
+        for row in range(int(row0), int(row1) + 1):
+            start = self.offsets[row * self.cols + int(col0)]
+            end = self.offsets[row * self.cols + int(col1) + 1]
+            if end > start:
+                parts.append(self.order[start:end])
+        if not parts:
+            return numpy.empty(0, dtype=int)
+        return numpy.concatenate(parts)
+
+    def bbox(self, south, west, north, east):
+        """
+        Indexes of the points inside the box. west > east means the box crosses the antimeridian.
+        """
+        if west > east:
+            return numpy.concatenate([self.bbox(south, west, north, 180.0), self.bbox(south, -180.0, north, east)])
+        idx = self._candidates(south, west, north, east)
+        lat = self.lat[idx]
+        lon = self.lon[idx]
+        return idx[(lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)]
+
+    def radius(self, lat, lon, km):
+        """
+        Returns (indexes, distances) of the points within km of (lat, lon), nearest first
+        """
+        dlat = math.degrees(km / EARTH_RADIUS_KM)
+        south = max(-90.0, lat - dlat)
+        north = min(90.0, lat + dlat)
+        cos_lat = math.cos(math.radians(max(abs(south), abs(north))))
+        if north >= 90 or south <= -90 or cos_lat < 1e-9 or dlat / cos_lat >= 180:
+            idx = self.bbox(south, -180.0, north, 180.0)
+        else:
+            dlon = dlat / cos_lat
+            west = (lon - dlon + 180) % 360 - 180
+            east = (lon + dlon + 180) % 360 - 180
+            idx = self.bbox(south, west, north, east)
+        distances = haversine_km(lat, lon, self.lat[idx], self.lon[idx])
+        inside = distances <= km
+        idx = idx[inside]
+        distances = distances[inside]
+        order = numpy.argsort(distances, kind='stable')
+        return idx[order], distances[order]
+
+    def nearest(self, lat, lon, k=1, start_km=50.0):
+        """
+        Returns (indexes, distances) of the k points nearest to (lat, lon). The search
+        radius doubles until it holds k points, which makes the k nearest exact.
+        """
+        k = min(k, len(self))
+        km = start_km
+        while True:
+            idx, distances = self.radius(lat, lon, km)
+            if len(idx) >= k or km >= math.pi * EARTH_RADIUS_KM:
+                return idx[:k], distances[:k]
+            km *= 2
+
+    def countries(self, world, name_property="NAME"):
+        """
+        Returns an array with the name of the country each point falls in (None if none)
+        """
+        result = numpy.full(len(self), None, dtype=object)
+        for feature in world['features']:
+            geometry = feature['geometry']
+            polygons = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+            for rings in polygons:
+                outer = numpy.asarray(rings[0], dtype=float)
+                west, south = outer.min(axis=0)
+                east, north = outer.max(axis=0)
+                idx = self.bbox(south, west, north, east)
+                idx = idx[result[idx] == None]  # noqa: E711, elementwise on an object array
+                if not len(idx):
+                    continue
+                inside = numpy.zeros(len(idx), dtype=bool)
+                for ring in rings:
+                    # holes flip the points inside them back out
+                    inside ^= points_in_ring(self.lat[idx], self.lon[idx], ring)
+                result[idx[inside]] = feature['properties'].get(name_property)
+        return result
+
+    def describe(self, idx, distances=None):
+        rows = []
+        for n, i in enumerate(idx):
+            row = {'name': self.name[i], 'lat': self.lat[i], 'lon': self.lon[i], 'elev': self.elev[i]}
+            if distances is not None:
+                row['km'] = round(float(distances[n]), 1)
+            rows.append(row)
+        return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--file', action='store', dest='filename', default="Volcanoes.txt")
+    parser.add_argument('--bbox', type=float, nargs=4, metavar=('SOUTH', 'WEST', 'NORTH', 'EAST'))
+    parser.add_argument('--radius', type=float, nargs=3, metavar=('LAT', 'LON', 'KM'))
+    parser.add_argument('--nearest', type=float, nargs=2, metavar=('LAT', 'LON'))
+    parser.add_argument('-k', type=int, action='store', dest='k', default=5)
+    parser.add_argument('--countries', action='store_true', dest='countries', default=False,
+                        help="Join every volcano to the country it is in, using world.json")
+    parser.add_argument('--world', action='store', dest='world_file', default="world.json")
+
+    args = parser.parse_args()
+
+    index = VolcanoIndex.load(args.filename)
+
+    if args.bbox:
+        rows = index.describe(index.bbox(*args.bbox))
+    elif args.radius:
+        rows = index.describe(*index.radius(*args.radius))
+    elif args.nearest:
+        rows = index.describe(*index.nearest(args.nearest[0], args.nearest[1], args.k))
+    elif args.countries:
+        with open(args.world_file, encoding="utf-8-sig") as f:
+            world = json.load(f)
+        names = index.countries(world)
+        rows = [dict(row, country=country) for row, country in zip(index.describe(range(len(index))), names)]
+    else:
+        rows = index.describe(range(len(index)))
+
+    for row in rows:
+        print(json.dumps(row))
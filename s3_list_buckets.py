@@ -1,13 +1,270 @@
+#!/usr/bin/env python
+# List every bucket, or scan them all for object statistics
+#
+#   ./s3_list_buckets.py
+#   ./s3_list_buckets.py --scan --output inventory.jsonl --workers 32 --prefix-depth 2
+#   ./s3_list_buckets.py --scan --format csv --output inventory.csv --bucket gap-vps-logs-prod
+#
+# --scan resolves each bucket's region and pages through list_objects_v2 in a pool of
+# workers, one bucket per worker. Each bucket only keeps running counters: a total, a
+# power-of-two size histogram and per-prefix totals down to --prefix-depth, and its row
+# is written as soon as it is finished. If a bucket has an S3 Inventory configuration
+# with a CSV report, the latest report is read instead of listing the bucket.
+
+import argparse
+import csv
+import gzip
+import io
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+# Object size histogram buckets: < 1KB, < 2KB, ... up to >= 1TB
+HISTOGRAM_BUCKETS = [1024 * 2 ** i for i in range(31)]
+MAX_PREFIXES_PER_BUCKET = 10000
+
+
+def size_bucket(size):
+    return min((size // 1024).bit_length(), len(HISTOGRAM_BUCKETS))
+
+
+def histogram_label(idx):
+    if idx == len(HISTOGRAM_BUCKETS):
+        return ">={}".format(HISTOGRAM_BUCKETS[-1])
+    return "<{}".format(HISTOGRAM_BUCKETS[idx])
+
+
+class BucketStats(object):
+    def __init__(self, bucket, region, prefix_depth):
+        self.bucket = bucket
+        self.region = region
+        self.prefix_depth = prefix_depth
+        self.source = "list_objects_v2"
+        self.objects = 0
+        self.bytes = 0
+        self.histogram = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        self.prefixes = {}
+        self.error = None
+
+    def add(self, key, size):
+        self.objects += 1
+        self.bytes += size
+        self.histogram[size_bucket(size)] += 1
+        if self.prefix_depth:
+            parts = key.split("/")[:-1][:self.prefix_depth]
+            prefix = "/".join(parts) + "/" if parts else ""
+            totals = self.prefixes.get(prefix)
+            if totals is None:
+                # Keep memory bounded for buckets with very wide key spaces
+                if len(self.prefixes) >= MAX_PREFIXES_PER_BUCKET:
+                    prefix = "(other)"
+                    totals = self.prefixes.setdefault(prefix, [0, 0])
+                else:
+                    totals = self.prefixes[prefix] = [0, 0]
+            totals[0] += 1
+            totals[1] += size
+
+    def to_dict(self):
+        return {
+            'bucket': self.bucket,
+            'region': self.region,
+            'source': self.source,
+            'objects': self.objects,
+            'bytes': self.bytes,
+            'histogram': {histogram_label(idx): count for idx, count in enumerate(self.histogram) if count},
+            'prefixes': {prefix: {'objects': totals[0], 'bytes': totals[1]}
+                         for prefix, totals in sorted(self.prefixes.items())},
+            'error': self.error
+        }
+
+
+class ClientCache(object):
+    """
+    One S3 client per region, shared between the workers
+    """
+    def __init__(self, session, workers):
+        self.session = session
+        self.config = Config(max_pool_connections=workers, retries={'max_attempts': 10, 'mode': 'adaptive'})
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def get(self, region):
+        with self.lock:
+            if region not in self.clients:
+                self.clients[region] = self.session.client('s3', region_name=region, config=self.config)
+            return self.clients[region]
+
+
+def get_bucket_region(s3, bucket):
+    location = s3.get_bucket_location(Bucket=bucket).get('LocationConstraint')
+    if location is None:
+        return 'us-east-1'
+    if location == 'EU':
+        return 'eu-west-1'
+    return location
+
+
+def find_csv_inventory(s3, bucket):
+    """
+    Returns the destination of a CSV S3 Inventory report for bucket, or None
+    """
+    kwargs = {'Bucket': bucket}
+    while True:
+        try:
+            res = s3.list_bucket_inventory_configurations(**kwargs)
+        except ClientError:
+            return None
+        for config in res.get('InventoryConfigurationList', []):
+            destination = config['Destination']['S3BucketDestination']
+            if config.get('IsEnabled') and destination['Format'] == 'CSV':
+                return {
+                    'bucket': destination['Bucket'].split(":::")[-1],
+                    'prefix': "/".join(p for p in [destination.get('Prefix', ''), bucket, config['Id']] if p) + "/"
+                }
+        if not res.get('IsTruncated'):
+            return None
+        kwargs['ContinuationToken'] = res['NextContinuationToken']
+
+
+def read_inventory(clients, stats, inventory):
+    """
+    Adds every object from the latest inventory manifest to stats
+    """
+    s3 = clients.get(get_bucket_region(clients.get('us-east-1'), inventory['bucket']))
+    paginator = s3.get_paginator('list_objects_v2')
+    dates = sorted(p['Prefix']
+                   for page in paginator.paginate(Bucket=inventory['bucket'], Prefix=inventory['prefix'], Delimiter="/")
+                   for p in page.get('CommonPrefixes', [])
+                   if p['Prefix'][len(inventory['prefix']):][:1].isdigit())
+    if not dates:
+        return False
+    manifest = json.load(s3.get_object(Bucket=inventory['bucket'], Key=dates[-1] + "manifest.json")['Body'])
+    columns = [c.strip() for c in manifest['fileSchema'].split(",")]
+    if 'Key' not in columns or 'Size' not in columns:
+        # the report doesn't include sizes, list the bucket instead
+        return False
+    key_idx = columns.index('Key')
+    size_idx = columns.index('Size')
+    for data_file in manifest['files']:
+        body = s3.get_object(Bucket=inventory['bucket'], Key=data_file['key'])['Body']
+        with gzip.GzipFile(fileobj=body) as gz:
+            for row in csv.reader(io.TextIOWrapper(gz, encoding="utf-8")):
+                if len(row) > size_idx and row[size_idx]:
+                    stats.add(row[key_idx], int(row[size_idx]))
+    stats.source = "inventory"
+    return True
+
+
+def scan_bucket(clients, bucket, prefix_depth, use_inventory):
+    stats = BucketStats(bucket, None, prefix_depth)
+    try:
+        stats.region = get_bucket_region(clients.get('us-east-1'), bucket)
+        s3 = clients.get(stats.region)
+
+        if use_inventory:
+            # read into separate stats so a failure part way through leaves no partial counts
+            inventory_stats = BucketStats(bucket, stats.region, prefix_depth)
+            try:
+                inventory = find_csv_inventory(s3, bucket)
+                if inventory and read_inventory(clients, inventory_stats, inventory):
+                    return inventory_stats
+            except Exception as e:
+                sys.stderr.write("{}: can't read the inventory report ({}: {}), listing the bucket instead\n".format(
+                    bucket, type(e).__name__, e))
+
+        paginator = s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket):
+            for obj in page.get('Contents', []):
+                stats.add(obj['Key'], obj['Size'])
+    except Exception as e:
+        # one bad bucket shouldn't stop the others from being scanned
+        stats.error = "{}: {}".format(type(e).__name__, e)
+    return stats
+
+
+class Writer(object):
+    def __init__(self, out, output_format):
+        self.out = out
+        self.output_format = output_format
+        if output_format == "csv":
+            self.csv = csv.writer(out)
+            self.csv.writerow(['bucket', 'region', 'source', 'prefix', 'objects', 'bytes', 'error'])
+
+    def write(self, stats):
+        if self.output_format == "csv":
+            self.csv.writerow([stats.bucket, stats.region, stats.source, "*", stats.objects, stats.bytes, stats.error or ""])
+            for prefix, totals in sorted(stats.prefixes.items()):
+                self.csv.writerow([stats.bucket, stats.region, stats.source, prefix, totals[0], totals[1], ""])
+        else:
+            self.out.write(json.dumps(stats.to_dict()) + "\n")
+        self.out.flush()
+
+
+def scan(session, buckets, workers, prefix_depth, use_inventory, writer):
+    clients = ClientCache(session, workers)
+    total_objects = 0
+    total_bytes = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(scan_bucket, clients, bucket, prefix_depth, use_inventory) for bucket in buckets]
+        for future in as_completed(futures):
+            stats = future.result()
+            writer.write(stats)
+            total_objects += stats.objects
+            total_bytes += stats.bytes
+            if stats.error:
+                sys.stderr.write("{}: {}\n".format(stats.bucket, stats.error))
+
+    sys.stderr.write("Scanned {} buckets: {} objects, {:.1f} GB\n".format(
+        len(futures), total_objects, total_bytes / 1024.0 ** 3))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--profile', action='store', dest='aws_profile', default=None)
+    parser.add_argument('--scan', action='store_true', dest='scan', default=False,
+                        help="Collect object statistics for every bucket")
+    parser.add_argument('--bucket', action='append', dest='buckets', default=[],
+                        help="Only scan these buckets")
+    parser.add_argument('--workers', type=int, action='store', dest='workers', default=32,
+                        help="Number of buckets scanned at the same time")
+    parser.add_argument('--prefix-depth', type=int, action='store', dest='prefix_depth', default=1,
+                        help="Number of '/' separated key levels to total by, 0 to disable")
+    parser.add_argument('--no-inventory', action='store_false', dest='use_inventory', default=True,
+                        help="Always list objects, even when an S3 Inventory report exists")
+    parser.add_argument('--format', action='store', dest='output_format', choices=['jsonl', 'csv'], default='jsonl')
+    parser.add_argument('--output', action='store', dest='output', default=None,
+                        help="File to write the results to, defaults to stdout")
+
+    args = parser.parse_args()
+
+    session = boto3.session.Session(profile_name=args.aws_profile)
+
+    # Create an S3 client
+    s3 = session.client('s3')
+
+    # Call S3 to list current buckets
+    response = s3.list_buckets()
 
-# Create an S3 client
-s3 = boto3.client('s3')
+    # Get a list of all bucket names from the response
+    buckets = [bucket['Name'] for bucket in response['Buckets']]
 
-# Call S3 to list current buckets
-response = s3.list_buckets()
+    if not args.scan:
+        # Print out the bucket list
+        print("Bucket List: %s" % buckets)
+        sys.exit(0)
 
-# Get a list of all bucket names from the response
-buckets = [bucket['Name'] for bucket in response['Buckets']]
+    if args.buckets:
+        buckets = [bucket for bucket in buckets if bucket in args.buckets]
 
-# Print out the bucket list
-print("Bucket List: %s" % buckets)
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        scan(session, buckets, args.workers, args.prefix_depth, args.use_inventory, Writer(out, args.output_format))
+    finally:
+        if args.output:
+            out.close()
@@ -1,34 +1,291 @@
-import boto3
+#!/usr/bin/env python
+# Upload a file or a whole directory to S3 and tag each object with its md5sum
+#
+#   ./s3_upload.py file.txt
+#   ./s3_upload.py keys/ --bucket my-bucket --prefix keys/ --workers 8 --part-size 16
+#   ./s3_upload.py keys/ --bucket my-bucket --prefix keys/ --sync
+#
+# The md5 is computed in a background thread with fixed-size chunked reads while the
+# multipart upload runs, so neither step loads the whole file into memory.
+#
+# With --sync only files whose md5 differs from the remote object are uploaded. The
+# remote side is read with one listing: single part ETags are the md5 already, and
+# multipart objects fall back to their md5sum tag. A local manifest keeps the size,
+# mtime and md5 of each file (and the ETag last seen for it) so unchanged files are
+# neither re-hashed nor looked up again.
+
+import argparse
 import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+
+BUCKET_NAME = 'tr-bastion-pub-keys-374725791127-us-east-1'
+MANIFEST_FILE = '.s3_upload_manifest.json'
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+MB = 1024 * 1024
+
+
+def file_md5(filename, chunk_size=HASH_CHUNK_SIZE):
+    """
+    Returns the md5 hex digest of filename, reading it in chunk_size pieces
+    into a single reused buffer.
+    """
+    md5 = hashlib.md5()
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with open(filename, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            md5.update(view[:n])
+    return md5.hexdigest()
+
+
+def get_transfer_config(part_size_mb, concurrency):
+    return TransferConfig(
+        multipart_threshold=part_size_mb * MB,
+        multipart_chunksize=part_size_mb * MB,
+        max_concurrency=concurrency,
+        use_threads=True
+    )
+
+
+def upload_file(s3, hash_pool, filename, bucket_name, key, transfer_config, digest=None):
+    """
+    Uploads filename to bucket_name/key while its md5 is computed on hash_pool,
+    then tags the object with the digest. Returns the digest.
+    The hashing is skipped when the digest is already known.
+    """
+    digest_future = hash_pool.submit(file_md5, filename) if digest is None else None
+    s3.upload_file(filename, bucket_name, key, Config=transfer_config)
+    if digest_future:
+        digest = digest_future.result()
+    s3.put_object_tagging(
+        Bucket=bucket_name,
+        Key=key,
+        Tagging={
+            'TagSet': [
+                {
+                    'Key': 'md5sum',
+                    'Value': digest
+                },
+            ]
+        }
+    )
+    return digest
+
+
+def iter_files(path, prefix):
+    """
+    Yields (filename, key) for path, or for every file below path if it is a directory.
+    """
+    if os.path.isfile(path):
+        yield path, prefix + os.path.basename(path)
+        return
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            filename = os.path.join(root, name)
+            key = prefix + os.path.relpath(filename, path).replace(os.sep, "/")
+            yield filename, key
+
+
+def get_s3_client(aws_profile, workers, concurrency):
+    session = boto3.session.Session(profile_name=aws_profile)
+    config = Config(max_pool_connections=max(10, workers * concurrency))
+    return session.client('s3', config=config)
+
+
+def upload(s3, files, bucket_name, workers, part_size_mb, concurrency):
+    """
+    Uploads (filename, key) pairs with a pool of workers. Returns the number of failures.
+    """
+    transfer_config = get_transfer_config(part_size_mb, concurrency)
+    failures = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as hash_pool, \
+            ThreadPoolExecutor(max_workers=workers) as upload_pool:
+        futures = {
+            upload_pool.submit(upload_file, s3, hash_pool, filename, bucket_name, key, transfer_config): key
+            for filename, key in files
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                print("{}  s3://{}/{}".format(future.result(), bucket_name, key))
+            except Exception as e:
+                print("Failed to upload {}: {}".format(key, e))
+                failures += 1
+
+    return failures
+
+
+def load_manifest(manifest_file):
+    try:
+        with open(manifest_file, "r") as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def save_manifest(manifest_file, manifest):
+    tmp_file = manifest_file + ".tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.rename(tmp_file, manifest_file)
+
+
+def list_remote(s3, bucket_name, prefix):
+    """
+    Returns {key: {'ETag': etag, 'Size': size}} for every object under prefix
+    """
+    remote = {}
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            remote[obj['Key']] = {'ETag': obj['ETag'].strip('"'), 'Size': obj['Size']}
+    return remote
+
+
+def get_md5_tag(s3, bucket_name, key):
+    tags = s3.get_object_tagging(Bucket=bucket_name, Key=key)['TagSet']
+    for tag in tags:
+        if tag['Key'] == 'md5sum':
+            return tag['Value']
+    return None
+
+
+def is_under(filename, path):
+    filename = os.path.abspath(filename)
+    path = os.path.abspath(path)
+    return filename == path or filename.startswith(os.path.join(path, ""))
+
+
+def sync(s3, files, bucket_name, prefix, manifest_file, workers, part_size_mb, concurrency, path=None):
+    """
+    Uploads only the files whose md5 doesn't match the remote object and updates
+    the manifest. Entries for files outside path are kept, the ones under it that
+    are gone or failed to upload are dropped. Returns the number of failures.
+    """
+    manifest = load_manifest(manifest_file)
+    files = list(files)
+
+    # Local side: re-hash only files whose size or mtime changed since the last sync
+    entries = {}
+    to_hash = []
+    for filename, key in files:
+        st = os.stat(filename)
+        entry = manifest.get(filename)
+        if entry and entry['size'] == st.st_size and entry['mtime'] == st.st_mtime and entry['key'] == key:
+            entries[filename] = entry
+        else:
+            entries[filename] = {'key': key, 'size': st.st_size, 'mtime': st.st_mtime, 'md5': None, 'etag': None}
+            to_hash.append(filename)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for filename, digest in zip(to_hash, pool.map(file_md5, to_hash)):
+            entries[filename]['md5'] = digest
+
+    # Remote side: one listing, then tag lookups only for multipart objects we haven't seen
+    remote = list_remote(s3, bucket_name, prefix)
+    changed = []
+    tag_lookups = []
+    for filename, key in files:
+        entry = entries[filename]
+        obj = remote.get(key)
+        if obj is None or obj['Size'] != entry['size']:
+            changed.append(filename)
+        elif obj['ETag'] == entry['md5'] or obj['ETag'] == entry['etag']:
+            entry['etag'] = obj['ETag']
+        elif "-" in obj['ETag']:
+            tag_lookups.append(filename)
+        else:
+            changed.append(filename)
+
+    with ThreadPoolExecutor(max_workers=workers * concurrency) as pool:
+        futures = {pool.submit(get_md5_tag, s3, bucket_name, entries[filename]['key']): filename
+                   for filename in tag_lookups}
+        for future in as_completed(futures):
+            filename = futures[future]
+            entry = entries[filename]
+            try:
+                remote_md5 = future.result()
+            except Exception as e:
+                print("Failed to read tags for {}: {}".format(entry['key'], e))
+                remote_md5 = None
+            if remote_md5 == entry['md5']:
+                entry['etag'] = remote[entry['key']]['ETag']
+            else:
+                changed.append(filename)
+
+    print("{} files, {} unchanged, {} to upload".format(len(files), len(files) - len(changed), len(changed)))
+
+    transfer_config = get_transfer_config(part_size_mb, concurrency)
+    failures = 0
+    with ThreadPoolExecutor(max_workers=workers) as hash_pool, \
+            ThreadPoolExecutor(max_workers=workers) as upload_pool:
+        futures = {
+            upload_pool.submit(upload_file, s3, hash_pool, filename, bucket_name, entries[filename]['key'],
+                               transfer_config, entries[filename]['md5']): filename
+            for filename in changed
+        }
+        for future in as_completed(futures):
+            filename = futures[future]
+            entry = entries[filename]
+            try:
+                print("{}  s3://{}/{}".format(future.result(), bucket_name, entry['key']))
+                # the ETag is recorded on the next sync, matched through the md5sum tag
+                entry['etag'] = None
+            except Exception as e:
+                print("Failed to upload {}: {}".format(entry['key'], e))
+                failures += 1
+                del entries[filename]
+
+    # keep what other syncs recorded, only this run's files are replaced
+    for filename in list(manifest):
+        if filename not in entries and path is not None and is_under(filename, path):
+            del manifest[filename]
+    for filename, key in files:
+        if filename in entries:
+            manifest[filename] = entries[filename]
+        else:
+            manifest.pop(filename, None)
+    save_manifest(manifest_file, manifest)
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', nargs='?', default='file.txt', help="File or directory to upload")
+    parser.add_argument('--bucket', action='store', dest='bucket_name', default=BUCKET_NAME)
+    parser.add_argument('--prefix', action='store', dest='prefix', default="",
+                        help="Key prefix to upload under")
+    parser.add_argument('--profile', action='store', dest='aws_profile', default=None)
+    parser.add_argument('--workers', type=int, action='store', dest='workers', default=4,
+                        help="Number of files uploaded at the same time")
+    parser.add_argument('--concurrency', type=int, action='store', dest='concurrency', default=10,
+                        help="Number of parts uploaded at the same time for each file")
+    parser.add_argument('--part-size', type=int, action='store', dest='part_size_mb', default=8,
+                        help="Multipart part size in MB")
+    parser.add_argument('--sync', action='store_true', dest='sync', default=False,
+                        help="Only upload files that changed since they were last uploaded")
+    parser.add_argument('--manifest', action='store', dest='manifest_file', default=MANIFEST_FILE,
+                        help="Local manifest used by --sync")
+
+    args = parser.parse_args()
 
-# Create an S3 client
-s3 = boto3.client('s3')
-
-filename = 'file.txt'
-bucket_name = 'tr-bastion-pub-keys-374725791127-us-east-1'
-
-s3.upload_file(filename, bucket_name, filename)
-s3.put_object_tagging(
-    Bucket = bucket_name,
-    Key = filename,
-    Tagging={
-        'TagSet': [
-            {
-                'Key': 'md5sum',
-                'Value': '169fc72bd9befd97f0a6e228d6306a40'
-            },
-        ]
-    }
-)
-
-x = s3.get_object_tagging(
-    Bucket = bucket_name,
-    Key = filename
-)
-
-print(x["TagSet"][0]["Value"])
-
-with open(filename,"rb") as f:
-    bytes = f.read() # read file as bytes
-    readable_hash = hashlib.md5(bytes).hexdigest();
-    print(readable_hash)
+    s3 = get_s3_client(args.aws_profile, args.workers, args.concurrency)
+    files = iter_files(args.path, args.prefix)
+    if args.sync:
+        failures = sync(s3, files, args.bucket_name, args.prefix, args.manifest_file,
+                        args.workers, args.part_size_mb, args.concurrency, args.path)
+    else:
+        failures = upload(s3, files, args.bucket_name, args.workers, args.part_size_mb, args.concurrency)
+    sys.exit(1 if failures else 0)
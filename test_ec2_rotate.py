@@ -0,0 +1,217 @@
+"""
+Tests for the capacity pre-flight check in ec2_rotate.py, with stub EC2 and Service Quotas clients.
+
+    python -m unittest test_ec2_rotate
+"""
+import unittest
+from datetime import datetime, timedelta
+
+import ec2_rotate
+
+VCPUS = {'m5.large': 2, 'm5.xlarge': 4, 'p3.2xlarge': 8, 'trn1.2xlarge': 8, 'u-6tb1.metal': 448, 'hpc7g.4xlarge': 16}
+
+
+class StubPaginator(object):
+    def __init__(self, pages):
+        self.pages = pages
+
+    def paginate(self, **kwargs):
+        return self.pages
+
+
+class StubEC2(object):
+    def __init__(self, running, max_instances=20, spot=()):
+        self.running = running
+        self.max_instances = max_instances
+        self.spot = spot
+
+    def describe_instance_types(self, InstanceTypes):
+        return {'InstanceTypes': [{'InstanceType': instance_type, 'VCpuInfo': {'DefaultVCpus': VCPUS[instance_type]}}
+                                  for instance_type in InstanceTypes]}
+
+    def get_paginator(self, name):
+        instances = [{'InstanceType': instance_type} for instance_type in self.running]
+        instances += [{'InstanceType': instance_type, 'InstanceLifecycle': 'spot'} for instance_type in self.spot]
+        return StubPaginator([{'Reservations': [{'Instances': instances}]}])
+
+    def describe_account_attributes(self, AttributeNames):
+        return {'AccountAttributes': [{'AttributeValues': [{'AttributeValue': str(self.max_instances)}]}]}
+
+
+class StubQuotas(object):
+    def __init__(self, quotas):
+        self.quotas = quotas
+
+    def get_service_quota(self, ServiceCode, QuotaCode):
+        return {'Quota': {'Value': float(self.quotas.get(QuotaCode, 0))}}
+
+
+class FailingQuotas(object):
+    def get_service_quota(self, ServiceCode, QuotaCode):
+        raise Exception("AccessDenied")
+
+
+class PartlyFailingQuotas(StubQuotas):
+    def __init__(self, quotas, failing):
+        StubQuotas.__init__(self, quotas)
+        self.failing = failing
+
+    def get_service_quota(self, ServiceCode, QuotaCode):
+        if QuotaCode in self.failing:
+            raise Exception("ThrottlingException")
+        return StubQuotas.get_service_quota(self, ServiceCode, QuotaCode)
+
+
+def make_record(name, size, instance_type='m5.large', region='us-east-1'):
+    record = ec2_rotate.AsgRecord({
+        'AutoScalingGroupName': name,
+        'MinSize': size,
+        'MaxSize': size * 2,
+        'DesiredCapacity': size,
+        'LaunchConfigurationName': 'lc',
+        'Instances': [{'InstanceId': '{}-{}'.format(name, i), 'InstanceType': instance_type, 'LaunchConfigurationName': 'lc'}
+                      for i in range(size)]
+    }, region)
+    record.rotation = ec2_rotate.RotationState(record)
+    return record
+
+
+class CapacityTest(unittest.TestCase):
+    def setUp(self):
+        self.is_prod = ec2_rotate.IS_PROD
+        ec2_rotate.IS_PROD = False
+        # non-prod doubles every ASG, so the surge of each is its size
+        self.asgs = {'a': make_record('a', 3), 'b': make_record('b', 3), 'c': make_record('c', 2)}
+
+    def tearDown(self):
+        ec2_rotate.IS_PROD = self.is_prod
+
+    def checkers(self, running, quotas=None, max_instances=20, spot=()):
+        return {'us-east-1': ec2_rotate.CapacityChecker(StubEC2(running, max_instances, spot), quotas)}
+
+    def test_quota_codes(self):
+        quota_code = ec2_rotate.CapacityChecker.quota_code
+        self.assertEqual(quota_code('m5.large'), ec2_rotate.STANDARD_VCPU_QUOTA)
+        self.assertEqual(quota_code('inf2.xlarge'), 'L-1945791B')
+        self.assertEqual(quota_code('p3.2xlarge'), 'L-417A185B')
+        self.assertEqual(quota_code('vt1.3xlarge'), 'L-DB2E81BA')
+        self.assertEqual(quota_code('trn1.2xlarge'), 'L-2C3B7624')
+        self.assertEqual(quota_code('dl1.24xlarge'), 'L-6E869C2A')
+        self.assertEqual(quota_code('u-6tb1.metal'), 'L-43DA4232')
+        self.assertIsNone(quota_code('hpc7g.4xlarge'))
+
+    def test_everything_fits_in_one_wave(self):
+        checkers = self.checkers(['m5.large'] * 10, StubQuotas({ec2_rotate.STANDARD_VCPU_QUOTA: 100}))
+        self.assertEqual(ec2_rotate.plan_capacity_waves(['a', 'b', 'c'], self.asgs, checkers), ([['a', 'b', 'c']], []))
+
+    def test_splits_into_waves(self):
+        # 20 vCPUs in use out of 34, the surges need 6, 6 and 4
+        checkers = self.checkers(['m5.large'] * 10, StubQuotas({ec2_rotate.STANDARD_VCPU_QUOTA: 34}))
+        self.assertEqual(ec2_rotate.plan_capacity_waves(['a', 'b', 'c'], self.asgs, checkers), ([['a', 'b'], ['c']], []))
+
+    def test_refuses_asgs_that_never_fit(self):
+        checkers = self.checkers(['m5.large'] * 10, StubQuotas({ec2_rotate.STANDARD_VCPU_QUOTA: 25}))
+        self.assertEqual(ec2_rotate.plan_capacity_waves(['a', 'b', 'c'], self.asgs, checkers), ([['c']], ['a', 'b']))
+
+    def test_accelerators_use_their_own_quota(self):
+        self.asgs['t'] = make_record('t', 2, 'trn1.2xlarge')
+        quotas = StubQuotas({ec2_rotate.STANDARD_VCPU_QUOTA: 1000, 'L-2C3B7624': 8})
+        checkers = self.checkers(['m5.large'] * 10, quotas)
+        self.assertEqual(ec2_rotate.plan_capacity_waves(['a', 't'], self.asgs, checkers), ([['a']], ['t']))
+
+    def test_unknown_families_are_not_checked(self):
+        self.asgs['h'] = make_record('h', 2, 'hpc7g.4xlarge')
+        checkers = self.checkers(['m5.large'] * 10, StubQuotas({ec2_rotate.STANDARD_VCPU_QUOTA: 26}))
+        self.assertEqual(ec2_rotate.plan_capacity_waves(['a', 'h'], self.asgs, checkers), ([['a', 'h']], []))
+
+    def test_spot_instances_are_not_counted(self):
+        checkers = self.checkers(['m5.large'] * 10, StubQuotas({ec2_rotate.STANDARD_VCPU_QUOTA: 34}), spot=['m5.large'] * 20)
+        self.assertEqual(ec2_rotate.plan_capacity_waves(['a', 'b', 'c'], self.asgs, checkers), ([['a', 'b'], ['c']], []))
+
+    def test_unreadable_quota_only_skips_its_families(self):
+        self.asgs['t'] = make_record('t', 2, 'trn1.2xlarge')
+        quotas = PartlyFailingQuotas({ec2_rotate.STANDARD_VCPU_QUOTA: 34}, ['L-2C3B7624'])
+        checkers = self.checkers(['m5.large'] * 10, quotas)
+        self.assertEqual(ec2_rotate.plan_capacity_waves(['a', 'b', 'c', 't'], self.asgs, checkers), ([['a', 'b', 't'], ['c']], []))
+
+    def test_falls_back_to_max_instances(self):
+        # 16 of 20 instances running, the surges need 3, 3 and 2 instances
+        for quotas in (None, FailingQuotas()):
+            checkers = self.checkers(['m5.large'] * 16, quotas)
+            self.assertEqual(ec2_rotate.plan_capacity_waves(['a', 'b', 'c'], self.asgs, checkers), ([['a'], ['b'], ['c']], []))
+
+    def test_run_rolling_update_refuses_up_front(self):
+        checkers = self.checkers(['m5.large'] * 10, StubQuotas({ec2_rotate.STANDARD_VCPU_QUOTA: 25}))
+        with self.assertRaises(ec2_rotate.InsufficientCapacity) as raised:
+            ec2_rotate.run_rolling_update(['a', 'c'], self.asgs, {}, {}, 0, False, 1, capacity_checkers=checkers,
+                                          check_up_to_date=False)
+        self.assertEqual(raised.exception.asgs, ['a'])
+
+
+class WindowTest(unittest.TestCase):
+    class Window(object):
+        name = 'nightly'
+        concurrency = 10
+        surge = None
+        batch_minutes = 30
+
+    def setUp(self):
+        self.saved = (ec2_rotate.IS_PROD, ec2_rotate.IS_DRY_RUN, ec2_rotate.ROTATE_UP_TO_DATE, ec2_rotate.get_asgs,
+                      ec2_rotate.run_rolling_update)
+        ec2_rotate.IS_PROD = False
+        # the stub instances already run the ASGs' launch configuration, and a dry run doesn't write the checkpoint
+        ec2_rotate.IS_DRY_RUN = True
+        ec2_rotate.ROTATE_UP_TO_DATE = True
+        self.asgs = {'a': make_record('a', 3), 'b': make_record('b', 3), 'c': make_record('c', 2)}
+        self.rotated = []
+        ec2_rotate.get_asgs = lambda asg_clients: self.asgs
+        ec2_rotate.run_rolling_update = lambda asg_update_list, *args, **kwargs: self.rotated.append(list(asg_update_list))
+
+    def tearDown(self):
+        (ec2_rotate.IS_PROD, ec2_rotate.IS_DRY_RUN, ec2_rotate.ROTATE_UP_TO_DATE, ec2_rotate.get_asgs,
+         ec2_rotate.run_rolling_update) = self.saved
+
+    def run_window(self, closes, quota):
+        checkers = {'us-east-1': ec2_rotate.CapacityChecker(StubEC2(['m5.large'] * 10),
+                                                            StubQuotas({ec2_rotate.STANDARD_VCPU_QUOTA: quota}))}
+        checkpoint = {}
+        jobs = [{'id': 'job', 'window': 'nightly', 'asgs': ['a', 'b', 'c'], 'tag_filters_list': []}]
+        ec2_rotate.run_window(self.Window(), closes, jobs, checkpoint, None, {}, {}, {}, 0, False, 1, checkers)
+        return checkpoint['job']
+
+    def test_waves_run_one_after_another(self):
+        state = self.run_window(datetime.now() + timedelta(hours=2), 34)
+        self.assertEqual(self.rotated, [['a', 'b'], ['c']])
+        self.assertEqual(state['status'], 'done')
+
+    def test_time_left_is_checked_before_each_wave(self):
+        # every wave takes the window's batch_minutes, so only one of the two fits in 45 minutes
+        clock = [datetime.now()]
+
+        class Clock(datetime):
+            @classmethod
+            def now(cls):
+                return clock[0]
+
+        def rotate(asg_update_list, *args, **kwargs):
+            self.rotated.append(list(asg_update_list))
+            clock[0] += timedelta(minutes=self.Window.batch_minutes)
+
+        ec2_rotate.run_rolling_update = rotate
+        ec2_rotate.datetime = Clock
+        try:
+            state = self.run_window(clock[0] + timedelta(minutes=45), 34)
+        finally:
+            ec2_rotate.datetime = datetime
+        self.assertEqual(self.rotated, [['a', 'b']])
+        self.assertEqual(state['status'], 'pending')
+
+    def test_refused_asgs_are_blocked(self):
+        state = self.run_window(datetime.now() + timedelta(hours=2), 25)
+        self.assertEqual(self.rotated, [['c']])
+        self.assertEqual(state['blocked'], ['a', 'b'])
+        self.assertEqual(state['status'], 'done')
+
+
+if __name__ == "__main__":
+    unittest.main()
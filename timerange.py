@@ -1,9 +1,8 @@
+from intervals import difference, intersection
+
 a = (1, 5) 
 b = (2, 6)
 
-if a0 >= b0 and a1 =< b1:
-	no result
-elif a0 == b0 and a1 > b1:
-	start b1 end a1
-elif a0 < b0 and a1 > b1:
-	start a0 end 
\ No newline at end of file
+# the part of a that b doesn't cover, and the part they share
+print(difference([a], [b]))
+print(intersection([a], [b]))
@@ -0,0 +1,10 @@
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("THREADS", 2))
+# import the app once in the master so the workers share its memory
+preload_app = True
+keepalive = 5
+accesslog = None
@@ -0,0 +1,116 @@
+"""
+Small load test for the web app.
+
+    python loadtest.py http://127.0.0.1:8000/ http://127.0.0.1:8000/about -n 5000 -c 20
+
+Each of the -c threads keeps one HTTP/1.1 connection open and sends requests
+until -n have been made in total. Prints requests per second and latency
+percentiles per URL. --revalidate sends If-None-Match with the ETag from the
+first response, like a browser revisiting the page.
+"""
+import argparse
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100.0))]
+
+
+class Worker(threading.Thread):
+    def __init__(self, urls, counter, lock, total, revalidate):
+        threading.Thread.__init__(self, daemon=True)
+        self.urls = urls
+        self.counter = counter
+        self.lock = lock
+        self.total = total
+        self.revalidate = revalidate
+        self.latencies = {url: [] for url in urls}
+        self.statuses = {}
+        self.errors = 0
+
+    def next_request(self):
+        with self.lock:
+            if self.counter[0] >= self.total:
+                return None
+            self.counter[0] += 1
+            return self.counter[0]
+
+    def run(self):
+        connections = {}
+        etags = {}
+        while True:
+            n = self.next_request()
+            if n is None:
+                break
+            url = self.urls[n % len(self.urls)]
+            parts = urlsplit(url)
+            origin = (parts.scheme, parts.netloc)
+            target = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+            headers = {"Accept-Encoding": "gzip, br"}
+            if self.revalidate and url in etags:
+                headers["If-None-Match"] = etags[url]
+            start = time.perf_counter()
+            try:
+                conn = connections.get(origin)
+                if conn is None:
+                    connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+                    conn = connections[origin] = connection_class(parts.netloc, timeout=30)
+                conn.request("GET", target, headers=headers)
+                response = conn.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                self.errors += 1
+                connections.pop(origin, None)
+                continue
+            self.latencies[url].append(time.perf_counter() - start)
+            self.statuses[response.status] = self.statuses.get(response.status, 0) + 1
+            if response.getheader("ETag"):
+                etags[url] = response.getheader("ETag")
+        for conn in connections.values():
+            conn.close()
+
+
+def run(urls, requests, concurrency, revalidate):
+    counter = [0]
+    lock = threading.Lock()
+    workers = [Worker(urls, counter, lock, requests, revalidate) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    done = sum(len(values) for worker in workers for values in worker.latencies.values())
+    errors = sum(worker.errors for worker in workers)
+    statuses = {}
+    for worker in workers:
+        for status, count in worker.statuses.items():
+            statuses[status] = statuses.get(status, 0) + count
+
+    print("%d requests in %.2fs, %.0f req/s, %d errors, statuses %s" % (
+        done, elapsed, done / elapsed if elapsed else 0, errors,
+        ", ".join("%d: %d" % item for item in sorted(statuses.items()))))
+    for url in urls:
+        values = sorted(value for worker in workers for value in worker.latencies[url])
+        print("%-40s p50 %6.1f ms  p90 %6.1f ms  p99 %6.1f ms  max %6.1f ms" % (
+            url, percentile(values, 50) * 1000, percentile(values, 90) * 1000,
+            percentile(values, 99) * 1000, (values[-1] if values else 0) * 1000))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('urls', nargs='+')
+    parser.add_argument('-n', type=int, action='store', dest='requests', default=2000)
+    parser.add_argument('-c', type=int, action='store', dest='concurrency', default=10)
+    parser.add_argument('--revalidate', action='store_true', dest='revalidate', default=False,
+                        help="Send If-None-Match with the ETag from the previous response")
+
+    args = parser.parse_args()
+
+    run(args.urls, args.requests, args.concurrency, args.revalidate)
@@ -1,14 +1,114 @@
-from flask import Flask, render_template
+"""
+Jason's web app.
+
+    python script1.py                    development server, templates re-rendered on every request
+    python script1.py --compress-static  writes .gz/.br copies of the static files
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Outside of debug mode each page is rendered once per worker and served from
+memory with an ETag and Last-Modified, so revisits get a 304. Static files are
+sent with a year long Cache-Control, and the precompressed copy is picked when
+the browser accepts it.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import sys
+from datetime import datetime, timezone
+
+from flask import Flask, render_template, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
+PAGE_MAX_AGE = 5 * 60
+COMPRESSIBLE = (".css", ".js", ".html", ".svg", ".json", ".txt")
+# (Accept-Encoding token, file suffix), best first
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+# Flask's own static route can't serve the precompressed copies, the one below replaces it
+app=Flask(__name__, static_folder=None)
+
+# {template name: (body, etag, last modified)}
+pages = {}
+
+
+def template_mtime(name):
+    folder = os.path.join(app.root_path, app.template_folder)
+    mtime = max(os.path.getmtime(os.path.join(folder, name)), os.path.getmtime(os.path.join(folder, "layout.html")))
+    return datetime.fromtimestamp(int(mtime), timezone.utc)
+
+
+def cached_page(name):
+    if app.debug:
+        return render_template(name)
+    if name not in pages:
+        body = render_template(name).encode("utf-8")
+        pages[name] = (body, hashlib.sha1(body).hexdigest(), template_mtime(name))
+    body, etag, last_modified = pages[name]
+
+    response = app.response_class(body, mimetype="text/html")
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = PAGE_MAX_AGE
+    return response.make_conditional(request)
+
+
+@app.route('/static/<path:filename>')
+def static(filename):
+    # parsed tokens with their q values, "gzip;q=0" means the browser refuses gzip
+    accepted = request.accept_encodings
+    for encoding, suffix in sorted(ENCODINGS, key=lambda item: -accepted[item[0]]):
+        if accepted[encoding] > 0 and os.path.isfile(os.path.join(STATIC_FOLDER, filename + suffix)):
+            mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+            response = send_from_directory(STATIC_FOLDER, filename + suffix, mimetype=mimetype,
+                                           max_age=STATIC_MAX_AGE, conditional=True)
+            response.headers["Content-Encoding"] = encoding
+            del response.headers["Content-Disposition"]
+            break
+    else:
+        response = send_from_directory(STATIC_FOLDER, filename, max_age=STATIC_MAX_AGE, conditional=True)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def compress_static():
+    """
+    Writes a .gz (and a .br if the brotli module is installed) next to every text file in static/
+    """
+    for root, dirs, files in os.walk(STATIC_FOLDER):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE):
+                continue
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                data = f.read()
+            with open(path + ".gz", "wb") as f:
+                f.write(gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli:
+                with open(path + ".br", "wb") as f:
+                    f.write(brotli.compress(data, quality=11))
+            print("Compressed %s" % path)
 
-app=Flask(__name__)
 
 @app.route('/')
 def home():
-    return render_template("home.html")
+    return cached_page("home.html")
 
 @app.route('/about')
 def about():
-    return render_template("about.html")
+    return cached_page("about.html")
 
 if __name__ =="__main__":
-    app.run(debug=True)
+    if "--compress-static" in sys.argv:
+        compress_static()
+    else:
+        app.run(debug=True)
@@ -0,0 +1,10 @@
+"""
+Production entry point, e.g.
+
+    python script1.py --compress-static
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from script1 import app
+
+if __name__ == "__main__":
+    app.run()
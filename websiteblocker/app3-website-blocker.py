@@ -1,28 +1,17 @@
-import time
-from datetime import datetime as dt
+from blocker import Schedule, run
+from blocklist import load_blocklist
 
 hosts_temp=r"D:\Dropbox\pp\block_websites\Demo\hosts"
 hosts_path="/etc/hosts"
 redirect="127.0.0.1"
 website_list=["www.facebook.com","facebook.com","dub119.mail.live.com","www.dub119.mail.live.com"]
 
-while True:
-    if dt(dt.now().year,dt.now().month,dt.now().day,8) < dt.now() < dt(dt.now().year,dt.now().month,dt.now().day,16):
-        print("Working hours...")
-        with open(hosts_path,'r+') as file:
-            content=file.read()
-            for website in website_list:
-                if website in content:
-                    pass
-                else:
-                    file.write(redirect+" "+ website+"\n")
-    else:
-        with open(hosts_path,'r+') as file:
-            content=file.readlines()
-            file.seek(0)
-            for line in content:
-                if not any(website in line for website in website_list):
-                    file.write(line)
-            file.truncate()
-        print("Fun hours...")
-    time.sleep(5)
+# block between 8 and 16 every day
+schedules=[Schedule(8, 16)]
+
+# extra blocklist files (hosts format or one domain per line) and allow-list files
+# with exceptions (example.com or *.example.com), compiled once and cached
+blocklists=[]
+allowlists=[]
+
+run(hosts_path, load_blocklist(blocklists, allowlists, website_list), schedules, redirect)
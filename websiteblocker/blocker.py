@@ -0,0 +1,196 @@
+"""
+Hosts-file website blocker engine.
+
+The blocked sites live in a delimited block of the hosts file:
+
+    # BEGIN website-blocker 5d41402abc4b2a76
+    127.0.0.1 facebook.com
+    127.0.0.1 www.facebook.com
+    # END website-blocker
+
+The hash on the BEGIN line identifies the site list the block was written from,
+so an unchanged block is recognised without comparing every entry.
+
+run() sleeps until the next schedule boundary instead of waking every few
+seconds. At each boundary the hosts file is read once and its block hash is
+compared to the wanted one. It is only rewritten when the block actually has to change,
+and then with one write to a temporary file followed by an atomic rename.
+Sites are matched as whole hostnames, never as substrings.
+"""
+import hashlib
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BEGIN_MARKER = "# BEGIN website-blocker"
+END_MARKER = "# END website-blocker"
+
+# Wake up at least this often, so clock changes and suspends are noticed
+MAX_SLEEP_SECONDS = 15 * 60
+
+
+class Schedule(object):
+    """
+    Blocking window from start to end (hours as floats, 8.5 is 08:30) on the given
+    weekdays (0 is Monday). A window with end < start runs past midnight.
+    """
+    def __init__(self, start, end, weekdays=range(7)):
+        self.start = start
+        self.end = end
+        self.weekdays = set(weekdays)
+
+    @classmethod
+    def parse(cls, text):
+        """
+        Parses "8-16", "08:30-17:00" or "22:00-06:00@0,1,2,3,4"
+        """
+        hours, _, days = text.partition("@")
+        start, end = [cls._hour(part) for part in hours.split("-")]
+        weekdays = [int(day) for day in days.split(",")] if days else range(7)
+        return cls(start, end, weekdays)
+
+    @staticmethod
+    def _hour(text):
+        hour, _, minute = text.strip().partition(":")
+        return int(hour) + (int(minute) / 60.0 if minute else 0)
+
+    def _window(self, day):
+        """
+        Returns the (start, end) datetimes of the window starting on day
+        """
+        midnight = datetime(day.year, day.month, day.day)
+        start = midnight + timedelta(hours=self.start)
+        end = midnight + timedelta(hours=self.end)
+        if end <= start:
+            end += timedelta(days=1)
+        return start, end
+
+    def windows(self, now):
+        """
+        Yields the windows that start between yesterday and a week from now
+        """
+        for offset in range(-1, 8):
+            day = now + timedelta(days=offset)
+            if day.weekday() in self.weekdays:
+                yield self._window(day)
+
+
+def is_blocking(schedules, now):
+    return any(start <= now < end for schedule in schedules for start, end in schedule.windows(now))
+
+
+def next_boundary(schedules, now):
+    """
+    Returns the next time any schedule starts or ends, or None if they never do
+    """
+    boundaries = [edge for schedule in schedules for window in schedule.windows(now)
+                  for edge in window if edge > now]
+    return min(boundaries) if boundaries else None
+
+
+def sites_digest(sites, redirect):
+    digest = hashlib.sha256(redirect.encode("utf-8"))
+    for site in sorted(sites):
+        digest.update(b"\n" + site.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def parse_hosts(content):
+    """
+    Splits the hosts file into (lines outside the managed block, managed lines,
+    digest written on the BEGIN line)
+    """
+    outside = []
+    managed = []
+    digest = None
+    inside = False
+    for line in content.splitlines():
+        stripped = line.strip()
+        if stripped.startswith(BEGIN_MARKER):
+            inside = True
+            digest = stripped[len(BEGIN_MARKER):].strip() or None
+        elif stripped == END_MARKER:
+            inside = False
+        elif inside:
+            managed.append(line)
+        else:
+            outside.append(line)
+    return outside, managed, digest
+
+
+def render_block(sites, redirect):
+    return ["%s %s" % (redirect, site) for site in sorted(sites)]
+
+
+def is_legacy_entry(line, sites, redirect):
+    # entries the old scripts appended outside of any block
+    parts = line.split()
+    return len(parts) == 2 and parts[0] == redirect and parts[1] in sites
+
+
+def desired_content(content, sites, redirect, blocking, digest=None):
+    """
+    Returns the new hosts file content, or None if content is already right
+    """
+    digest = digest or sites_digest(sites, redirect)
+    outside, managed, current_digest = parse_hosts(content)
+    kept = [line for line in outside if not is_legacy_entry(line, sites, redirect)]
+    if len(kept) == len(outside):
+        if blocking and current_digest == digest:
+            return None
+        if not blocking and BEGIN_MARKER not in content:
+            return None
+
+    while kept and not kept[-1].strip():
+        kept.pop()
+    lines = kept
+    if blocking:
+        lines = kept + ["%s %s" % (BEGIN_MARKER, digest)] + render_block(sites, redirect) + [END_MARKER]
+    return "\n".join(lines) + "\n"
+
+
+def atomic_write(path, content):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".hosts.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def apply(hosts_path, sites, redirect, blocking, digest=None):
+    """
+    Makes the hosts file block (or unblock) sites. Returns True if it had to be rewritten.
+    """
+    with open(hosts_path, "r") as f:
+        content = f.read()
+    new_content = desired_content(content, sites, redirect, blocking, digest)
+    if new_content is None:
+        return False
+    atomic_write(hosts_path, new_content)
+    return True
+
+
+def run(hosts_path, sites, schedules, redirect="127.0.0.1"):
+    sites = frozenset(site.strip().lower() for site in sites if site.strip())
+    digest = sites_digest(sites, redirect)
+    while True:
+        now = datetime.now()
+        blocking = is_blocking(schedules, now)
+        changed = apply(hosts_path, sites, redirect, blocking, digest)
+        print("%s %s%s" % (now.strftime("%H:%M:%S"), "Working hours..." if blocking else "Fun hours...",
+                           " (hosts file updated)" if changed else ""))
+
+        boundary = next_boundary(schedules, now)
+        sleep_for = MAX_SLEEP_SECONDS
+        if boundary is not None:
+            sleep_for = min(sleep_for, max(1, (boundary - datetime.now()).total_seconds()))
+        time.sleep(sleep_for)
@@ -0,0 +1,196 @@
+"""
+Compiles large domain blocklists for the website blocker.
+
+    python blocklist.py lists/ads.txt lists/social.hosts --allow allow.txt
+
+Accepts hosts-format lists ("0.0.0.0 ads.example.com"), plain domain lists and
+adblock-style "||example.com^" lines, with "#" and "!" comments. Adblock rules a
+hosts file can't express are skipped: element hiding rules ("example.com##.ad")
+and rules with "$" options ("||example.com^$third-party"). Exception rules
+("@@||example.com^") are added to the allow-list. Domains are lowercased,
+IDNA-encoded and deduplicated, then the allow-list is applied:
+
+    example.com      allows exactly example.com
+    *.example.com    allows example.com and every subdomain of it
+
+Allow rules are stored in a reversed-label trie (com -> example -> ...), so each
+domain is checked in time proportional to its number of labels.
+
+The compiled list is cached in .blocklist_cache/ under a key made from the input
+files' paths, sizes and modification times, so restarts only read one sorted file.
+"""
+import argparse
+import hashlib
+import os
+import re
+
+CACHE_DIR = ".blocklist_cache"
+# bump when parsing changes so old cache entries are ignored
+CACHE_VERSION = "3"
+
+LOCAL_NAMES = {"localhost", "localhost.localdomain", "local", "broadcasthost", "ip6-localhost",
+               "ip6-loopback", "0.0.0.0"}
+DOMAIN_RE = re.compile(r"^[a-z0-9_](?:[a-z0-9_-]{0,61}[a-z0-9_])?(?:\.[a-z0-9_](?:[a-z0-9_-]{0,61}[a-z0-9_])?)+$")
+IP_RE = re.compile(r"^[0-9.]+$|:")
+
+COSMETIC_MARKERS = ("##", "#@#", "#?#", "#$#")
+
+EXACT = "\0exact"
+WILDCARD = "\0wildcard"
+
+
+def normalize(domain):
+    """
+    Returns the canonical form of domain, or None if it isn't a blockable hostname
+    """
+    domain = domain.strip().lower().rstrip(".")
+    if not domain or domain in LOCAL_NAMES:
+        return None
+    if not domain.isascii():
+        try:
+            domain = domain.encode("idna").decode("ascii")
+        except UnicodeError:
+            return None
+    if not DOMAIN_RE.match(domain):
+        return None
+    return domain
+
+
+def parse_line(line):
+    """
+    Yields (domain, allow) for the domains on one line of a hosts file, domain list or
+    adblock list. allow is True for adblock exception rules, which allow the domain
+    and its subdomains.
+    """
+    # element hiding rules only hide parts of a page, they must not block the site. The
+    # marker has to be in the rule itself, "0.0.0.0 ads.example.com ## note" is a hosts line
+    parts = line.split(None, 1)
+    if parts and any(marker in parts[0] for marker in COSMETIC_MARKERS):
+        return
+    line = line.split("#", 1)[0].strip()
+    if not line or line.startswith("!") or line.startswith("["):
+        return
+    allow = line.startswith("@@")
+    if allow:
+        line = line[2:]
+    if line.startswith("||"):
+        # options like $third-party narrow the rule in ways a hosts file can't
+        if "$" in line:
+            return
+        line = line[2:].split("^", 1)[0]
+        if "/" in line or "*" in line:
+            return
+    elif allow:
+        return
+    parts = line.split()
+    if len(parts) > 1 and IP_RE.search(parts[0]):
+        # hosts format, an address followed by one or more names
+        parts = parts[1:]
+    for part in parts:
+        domain = normalize(part)
+        if domain:
+            yield domain, allow
+
+
+def parse_file(path):
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            for entry in parse_line(line):
+                yield entry
+
+
+class AllowTrie(object):
+    def __init__(self, rules=()):
+        self.root = {}
+        for rule in rules:
+            self.add(rule)
+
+    def add(self, rule):
+        rule = rule.split("#", 1)[0].strip().lower()
+        if not rule:
+            return
+        wildcard = rule.startswith("*.")
+        domain = normalize(rule[2:] if wildcard else rule)
+        if domain is None:
+            return
+        node = self.root
+        for label in reversed(domain.split(".")):
+            node = node.setdefault(label, {})
+        node[WILDCARD if wildcard else EXACT] = True
+
+    def allows(self, domain):
+        node = self.root
+        for label in reversed(domain.split(".")):
+            node = node.get(label)
+            if node is None:
+                return False
+            if WILDCARD in node:
+                return True
+        return EXACT in node
+
+
+def read_allow_rules(paths):
+    rules = []
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            rules.extend(f)
+    return rules
+
+
+def compile_blocklist(paths, allow_rules=(), extra_domains=()):
+    """
+    Returns the sorted list of blocked domains, from the lists and extra_domains
+    """
+    domains = set(filter(None, map(normalize, extra_domains)))
+    allow = AllowTrie(allow_rules)
+    for path in paths:
+        for domain, allowed in parse_file(path):
+            if allowed:
+                allow.add("*." + domain)
+            else:
+                domains.add(domain)
+    return sorted(domain for domain in domains if not allow.allows(domain))
+
+
+def cache_key(paths, allow_paths, extra_domains=()):
+    key = hashlib.sha256(CACHE_VERSION.encode("utf-8"))
+    for domain in extra_domains:
+        key.update(("extra|%s\n" % domain).encode("utf-8"))
+    for kind, group in (("block", paths), ("allow", allow_paths)):
+        for path in group:
+            st = os.stat(path)
+            key.update(("%s|%s|%d|%d\n" % (kind, os.path.abspath(path), st.st_size, st.st_mtime_ns)).encode("utf-8"))
+    return key.hexdigest()[:32]
+
+
+def load_blocklist(paths, allow_paths=(), extra_domains=(), cache_dir=CACHE_DIR):
+    """
+    Returns the compiled domains for the lists and extra_domains, from the cache when the
+    inputs haven't changed. extra_domains go through the allow-list like the lists do.
+    """
+    cache_file = os.path.join(cache_dir, "%s.txt" % cache_key(paths, allow_paths, extra_domains))
+    if os.path.exists(cache_file):
+        with open(cache_file, encoding="ascii") as f:
+            return f.read().split()
+
+    domains = compile_blocklist(paths, read_allow_rules(allow_paths), extra_domains)
+
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    tmp_file = cache_file + ".tmp"
+    with open(tmp_file, "w", encoding="ascii") as f:
+        f.write("\n".join(domains) + "\n")
+    os.replace(tmp_file, cache_file)
+    return domains
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('lists', nargs='+', help="Hosts-format or plain domain lists")
+    parser.add_argument('--allow', action='append', dest='allow_paths', default=[],
+                        help="Allow-list file, one domain or *.domain per line")
+
+    args = parser.parse_args()
+
+    domains = load_blocklist(args.lists, args.allow_paths)
+    print("%d domains" % len(domains))
@@ -1,5 +1,5 @@
-import time
-from datetime import datetime as dt
+from blocker import Schedule, run
+from blocklist import load_blocklist
 # the r is telling python not to evaluate any \* expressions and its just a row string
 # you could also add two \\ instead
 hosts_temp="hosts"
@@ -7,23 +7,12 @@ hosts_path=r"C:\Windows\System32\drivers\etc\hosts"
 redirect="127.0.0.1"
 website_list=["www.facebook.com", "facebook.com", "dub119.mail.live.com", "www.dub119.mail.live.com"]
 
-while True:
-    if dt(dt.now().year,dt.now().month,dt.now().day,12) < dt.now() < dt(dt.now().year,dt.now().month,dt.now().day,16):
-        print("Working Hours ...")
-        with open(hosts_temp,'r+') as file:
-            content=file.read()
-            for website in website_list:
-                if website in content:
-                    pass
-                else:
-                    file.write(redirect + " " + website + "\n")
-    else:
-        with open(hosts_temp, 'r+') as file:
-            content = file.readlines()
-            file.seek(0)
-            for line in content:
-                if not any(website in line for website in website_list):
-                    file.write(line)
-            file.truncate()
-        print("Fun Hours ...")
-    time.sleep(5)
+# block between 12 and 16 every day, more windows can be added to the list
+schedules=[Schedule(12, 16)]
+
+# extra blocklist files (hosts format or one domain per line) and allow-list files
+# with exceptions (example.com or *.example.com), compiled once and cached
+blocklists=[]
+allowlists=[]
+
+run(hosts_temp, load_blocklist(blocklists, allowlists, website_list), schedules, redirect)